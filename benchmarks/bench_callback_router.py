@@ -0,0 +1,131 @@
+"""Бенчмарк маршрутизации колбэков: цепочка lambda-фильтров против CallbackRouter.
+
+Оба варианта прогоняют одинаковый набор синтетических нажатий через настоящий aiogram Dispatcher
+с пустыми обработчиками, поэтому измеряется только стоимость поиска обработчика и разбора данных.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_callback_router [кол-во нажатий]
+"""
+import asyncio
+import itertools
+import sys
+import time
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters.state import State
+from aiogram.types import Update
+
+from callback_router import CallbackRouter
+from callbacks import SelectCategory, CategoryPage, ChooseVideo, VideoPage, SelectVideo, CalendarMonth, SelectDay
+from models import Form
+
+# Пары (callback_data в старом формате, callback_data в новом формате) для типичных нажатий
+CLICKS = [
+    ('main_menu', 'main_menu'),
+    ('watch_video', 'watch_video'),
+    ('next_page_15', CategoryPage(cursor=15, forward=True).pack()),
+    ('select_category_17', SelectCategory(subject_id=17).pack()),
+    ('choose_video_17', ChooseVideo(subject_id=17, after_id=0).pack()),
+    ('next_video_page_17_1040', VideoPage(subject_id=17, cursor=1040, forward=True).pack()),
+    ('prev_video_page_17_1042', VideoPage(subject_id=17, cursor=1042, forward=False).pack()),
+    ('select_video_1041', SelectVideo(video_id=1041, subject_id=17, page_after_id=1040).pack()),
+    ('admin_menu', 'admin_menu'),
+    ('next-month_2026_10', CalendarMonth(year=2026, month=11).pack()),
+    ('select-day_20-11-2026', SelectDay(year=2026, month=11, day=20).pack()),
+    ('ignore', 'ignore'),
+]
+
+
+async def _noop(*args, **kwargs) -> None:
+    pass
+
+
+def legacy_dispatcher() -> Dispatcher:
+    """ Диспетчер с фильтрами в том же порядке, в котором они были зарегистрированы в callback_handlers """
+    dp = Dispatcher()
+    filters = [
+        (lambda call: call.data == 'select_user' or call.data == 'select_admin',),
+        (lambda call: call.data == 'change_role',),
+        (lambda call: call.data.startswith('change'),),
+        (lambda call: call.data == 'main_menu',),
+        (lambda call: call.data == 'watch_video',),
+        (lambda call: call.data.startswith('next_page') or call.data.startswith('prev_page'),),
+        (lambda call: call.data.startswith('select_category'),),
+        (lambda call: call.data.startswith('choose_video'),),
+        (lambda c: c.data and (c.data.startswith('next_video_page') or c.data.startswith('prev_video_page')),),
+        (lambda c: c.data and c.data.startswith('select_video'),),
+        (lambda c: c.data == "admin_set_reminder",),
+        (Form.date_input, lambda call: call.data.startswith('select-day_')),
+        (Form.finish_reminder, lambda c: c.data == 'admin_confirm_reminder'),
+        (lambda c: c.data == 'cancel_reminder', State('*')),
+        (lambda call: call.data.startswith('admin'),),
+        (lambda call: 'prev-month' in call.data,),
+        (lambda call: 'next-month' in call.data,),
+    ]
+    for callback_filters in filters:
+        dp.callback_query.register(_legacy_handler, *callback_filters)
+    return dp
+
+
+async def _legacy_handler(callback) -> None:
+    # Старые обработчики разбирали данные вручную
+    callback.data.split('_')
+
+
+def routed_dispatcher() -> Dispatcher:
+    dp = Dispatcher()
+    router = CallbackRouter()
+    router.action('select_user', 'select_admin', 'change_role', 'change_select_user', 'change_select_admin',
+                  'main_menu', 'watch_video', 'admin_set_reminder', 'cancel_reminder', 'admin_menu',
+                  'admin_get_users', 'ignore')(_noop)
+    router.action('admin_confirm_reminder', state=Form.finish_reminder)(_noop)
+    router.action(SelectDay, state=Form.date_input)(_noop)
+    for payload_class in (SelectCategory, CategoryPage, ChooseVideo, VideoPage, SelectVideo, CalendarMonth):
+        router.action(payload_class)(_noop)
+
+    @dp.callback_query()
+    async def route_callback(callback, state):
+        await router.dispatch(callback, state)
+
+    return dp
+
+
+def make_updates(data: list[str], count: int) -> list[Update]:
+    updates = []
+    for update_id, callback_data in zip(range(count), itertools.cycle(data)):
+        updates.append(Update.model_validate({
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'from': {'id': 1, 'is_bot': False, 'first_name': 'Bench'},
+                'chat_instance': '1',
+                'data': callback_data,
+                'message': {'message_id': 1, 'date': 0, 'chat': {'id': 1, 'type': 'private'}},
+            },
+        }))
+    return updates
+
+
+async def _run(dp: Dispatcher, bot: Bot, updates: list[Update]) -> float:
+    """ Возвращает среднее время обработки одного нажатия в микросекундах """
+    start = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - start) / len(updates) * 1_000_000
+
+
+async def main(count: int = 20000) -> None:
+    bot = Bot('123456:benchmark')
+    legacy_updates = make_updates([old for old, _ in CLICKS], count)
+    routed_updates = make_updates([new for _, new in CLICKS], count)
+
+    legacy = await _run(legacy_dispatcher(), bot, legacy_updates)
+    routed = await _run(routed_dispatcher(), bot, routed_updates)
+    print(f"lambda chain:    {legacy:8.2f} µs/click")
+    print(f"CallbackRouter:  {routed:8.2f} µs/click")
+    print(f"speedup:         {legacy / routed:8.2f}x")
+    await bot.session.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,407 @@
+"""Набор микробенчмарков слоя базы данных на синтетических данных разного масштаба.
+
+Для каждого масштаба (пользователей:видео) таблицы faculties, subjects, teachers, videos, users и reminders
+дозаполняются до нужного размера (в PostgreSQL - через COPY), после чего каждый метод PostgresqlHandler,
+PostgresqlVideoHandler и PostgresqlRemindersHandler вызывается CONCURRENCY клиентами одновременно -
+до REQUESTS вызовов или TIME_BUDGET секунд на метод. Для каждого метода сохраняются p50/p99/среднее время вызова.
+Обработчики при ошибке запроса пишут ее в лог и возвращают None. Метод, у которого все вызовы вернули None
+и при этом в лог записывались ошибки, отмечается в отчете как неудачный: его время не сохраняется
+и не участвует в оценке роста и сравнении с другим прогоном.
+
+Методы, время которых растет вместе с размером таблицы почти линейно (наклон в логарифмических координатах
+между наименьшим и наибольшим масштабом не меньше LINEAR_SLOPE), помечаются в отчете - это полные выборки
+и агрегаты, которым нужен индекс, счетчик или пагинация. Результаты записываются в JSON (с коммитом git),
+а --compare сравнивает прогон с сохраненным результатом другого коммита.
+
+Данные создаются в отдельной схеме PostgreSQL (удаляется после прогона). Если POSTGRES_CONNECTION_STRING
+не задан, используется бэкенд SQLite во временном файле (или явно: --backend sqlite).
+Методы, меняющие данные (insert_user, change_user_role, add_reminder, claim_due_reminders и т.д.),
+выполняются на тех же таблицах; import_catalog не входит в набор - его измеряет database_handlers.catalog_import.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_db [--scale 10000:1000 --scale 100000:10000] [--concurrency 8]
+                                  [--backend auto|postgres|sqlite] [--output bench_db.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+import dotenv
+
+SCHEMA = 'bench_db'
+DEFAULT_SCALES = ['10000:1000', '100000:10000', '1000000:100000']
+# Наклон log(время)/log(размер), начиная с которого рост считается линейным
+LINEAR_SLOPE = 0.5
+# ID чатов синтетических пользователей и пользователей, добавляемых insert_user во время замеров
+CHAT_ID_BASE = 1_000_000_000
+INSERTED_CHAT_ID_BASE = 5_000_000_000
+
+
+class Counts:
+    """ Размеры таблиц для масштаба (пользователей, видео); размеры каталога выводятся из кол-ва видео """
+
+    def __init__(self, users: int = 0, videos: int = 0):
+        self.users = users
+        self.videos = videos
+        self.reminders = users // 10
+        self.subjects = max(10, videos // 50) if videos else 0
+        self.teachers = max(20, videos // 10) if videos else 0
+        self.faculties = max(2, self.subjects // 100) if videos else 0
+
+    def as_dict(self) -> dict:
+        return {'users': self.users, 'videos': self.videos, 'reminders': self.reminders,
+                'subjects': self.subjects, 'teachers': self.teachers, 'faculties': self.faculties}
+
+
+# === DATA ===
+
+def _seed_rows(current: Counts, target: Counts) -> list[tuple[str, tuple, iter]]:
+    """ Строки, которых не хватает до размера target: (таблица, колонки, строки) в порядке внешних ключей """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [
+        ('faculties', ('name',),
+         ((f"faculty {n}",) for n in range(current.faculties + 1, target.faculties + 1))),
+        ('subjects', ('name', 'faculty_id'),
+         ((f"subject {n}", 1 + n % target.faculties) for n in range(current.subjects + 1, target.subjects + 1))),
+        ('teachers', ('name', 'subject_id'),
+         ((f"teacher {n}", 1 + n % target.subjects) for n in range(current.teachers + 1, target.teachers + 1))),
+        ('videos', ('teacher_id', 'telegram_file_id', 'name'),
+         ((1 + n % target.teachers, f"file_{n}", f"video {n}") for n in range(current.videos + 1, target.videos + 1))),
+        ('users', ('chat_id', 'username', 'firstname', 'role', 'is_active'),
+         ((CHAT_ID_BASE + n, f"user_{n}", f"User {n}", 'admin' if n % 100 == 0 else 'user', n % 50 != 0)
+          for n in range(current.users + 1, target.users + 1))),
+        # Половина напоминаний уже наступила, половина - в будущем
+        ('reminders', ('username', 'date_time', 'text'),
+         ((f"user_{n * 10}", now + datetime.timedelta(minutes=n if n % 2 else -n), f"reminder {n}")
+          for n in range(current.reminders + 1, target.reminders + 1))),
+    ]
+
+
+class Context:
+    """ Аргументы вызовов: случайные существующие записи текущего масштаба и записи, созданные во время замеров """
+
+    # Номера пользователей, добавляемых insert_user, общие для всех масштабов: таблицы не пересоздаются между ними
+    _inserted = itertools.count(1)
+
+    def __init__(self, counts: Counts, rng: random.Random):
+        self.counts = counts
+        self.random = rng
+        self.reminder_ids: list[int] = []
+
+    def chat_id(self) -> int:
+        return CHAT_ID_BASE + self.random.randint(1, self.counts.users)
+
+    def username(self) -> str:
+        return f"user_{self.random.randint(1, self.counts.users)}"
+
+    def user_id(self) -> int:
+        return self.random.randint(1, self.counts.users)
+
+    def new_chat_id(self) -> int:
+        return INSERTED_CHAT_ID_BASE + next(self._inserted)
+
+    def pick(self, table: str) -> int:
+        return self.random.randint(1, getattr(self.counts, table))
+
+    def reminder_id(self) -> int:
+        return self.reminder_ids.pop() if self.reminder_ids else self.random.randint(1, self.counts.reminders)
+
+
+# Методы обработчиков: (обработчик, метод, таблица, от размера которой зависит время, аргументы)
+METHODS = [
+    ('users', 'get_user_by_id', 'users', lambda c: (c.chat_id(),)),
+    ('users', 'get_user_by_username', 'users', lambda c: (c.username(),)),
+    ('users', 'insert_user', 'users', lambda c: (c.new_chat_id(), 'bench', 'Bench', 'user')),
+    ('users', 'change_user_role', 'users', lambda c: (c.chat_id(), c.random.choice(('user', 'admin')))),
+    ('users', 'get_users_info', 'users', lambda c: ()),
+    ('users', 'get_users_by_role_page', 'users', lambda c: ('admin', c.user_id(), None, 20)),
+    ('users', 'get_admins_page', 'users', lambda c: (c.user_id(), None, 20)),
+    ('users', 'get_users', 'users', lambda c: ()),
+    ('users', 'get_active_users_chunk', 'users', lambda c: (c.user_id(), 500)),
+    ('users', 'count_active_users', 'users', lambda c: ()),
+    ('users', 'activate_user', 'users', lambda c: (c.chat_id(),)),
+    ('videos', 'get_faculties', 'videos', lambda c: ()),
+    ('videos', 'get_subjects', 'videos', lambda c: ()),
+    ('videos', 'get_subjects_page', 'videos', lambda c: (c.pick('subjects'), None, 5)),
+    ('videos', 'get_teachers', 'videos', lambda c: ()),
+    ('videos', 'get_videos', 'videos', lambda c: (c.pick('subjects'),)),
+    ('videos', 'get_videos_by_teacher_id', 'videos', lambda c: (c.pick('teachers'),)),
+    ('videos', 'get_videos_by_subject_id', 'videos', lambda c: (c.pick('subjects'),)),
+    ('videos', 'get_videos_page_by_subject_id', 'videos', lambda c: (c.pick('subjects'), 0, None, 8)),
+    ('videos', 'get_videos_by_faculty_id', 'videos', lambda c: (c.pick('faculties'),)),
+    ('videos', 'get_video_by_id', 'videos', lambda c: (c.pick('videos'),)),
+    ('videos', 'get_subject_id_by_video_id', 'videos', lambda c: (c.pick('videos'),)),
+    ('reminders', 'add_reminder', 'reminders',
+     lambda c: (c.username(), datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1), 'bench')),
+    ('reminders', 'get_upcoming_reminders', 'reminders', lambda c: (10,)),
+    ('reminders', 'get_current_reminders', 'reminders', lambda c: ()),
+    ('reminders', 'claim_due_reminders', 'reminders', lambda c: (100,)),
+    ('reminders', 'delete_reminder', 'reminders', lambda c: (c.reminder_id(),)),
+]
+
+
+# === BACKENDS ===
+
+class PostgresBackend:
+    name = 'postgres'
+
+    def __init__(self, dsn: str, pool_size: int):
+        self._dsn = dsn
+        self._pool_size = pool_size
+        self._admin = None
+
+    async def open(self) -> dict:
+        import asyncpg
+        from database_handlers.migrations import migrate
+        from database_handlers.postgresql_handler import ParentPostgresqlHandler, PostgresqlHandler, \
+            PostgresqlVideoHandler, PostgresqlRemindersHandler
+        self._parent = ParentPostgresqlHandler
+
+        self._admin = await asyncpg.connect(self._dsn)
+        await self._admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+        await ParentPostgresqlHandler.open_connection(self._dsn, min_size=self._pool_size, max_size=self._pool_size,
+                                                      server_settings={'search_path': SCHEMA})
+        handlers = {'users': PostgresqlHandler(), 'videos': PostgresqlVideoHandler(),
+                    'reminders': PostgresqlRemindersHandler()}
+        await handlers['users'].set_table('users')
+        async with ParentPostgresqlHandler.connection() as conn:
+            for handler in handlers.values():
+                await handler.create_table_if_not_exist()
+            await migrate(conn)
+        await ParentPostgresqlHandler.warm_up()
+        return handlers
+
+    async def seed(self, table: str, columns: tuple, rows) -> None:
+        async with self._parent.connection() as conn:
+            await conn.copy_records_to_table(table, records=rows, columns=columns)
+
+    async def analyze(self) -> None:
+        async with self._parent.connection() as conn:
+            await conn.execute("ANALYZE")
+
+    async def close(self) -> None:
+        await self._parent.close_connection()
+        if self._admin is not None:
+            await self._admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            await self._admin.close()
+
+
+class SqliteBackend:
+    name = 'sqlite'
+    # Кол-во строк в одной вставке при заполнении таблиц
+    BATCH = 50_000
+
+    def __init__(self):
+        self._directory = tempfile.TemporaryDirectory(prefix='bench_db_')
+
+    async def open(self) -> dict:
+        from database_handlers.sqlite_handler import ParentSqliteHandler, SqliteHandler, SqliteVideoHandler, \
+            SqliteRemindersHandler
+        self._parent = ParentSqliteHandler
+
+        await ParentSqliteHandler.open_connection(os.path.join(self._directory.name, 'bench.db'))
+        handlers = {'users': SqliteHandler(), 'videos': SqliteVideoHandler(), 'reminders': SqliteRemindersHandler()}
+        await handlers['users'].set_table('users')
+        for handler in handlers.values():
+            await handler.create_table_if_not_exist()
+        return handlers
+
+    async def seed(self, table: str, columns: tuple, rows) -> None:
+        sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.BATCH:
+                await self._parent.executemany(sql, batch)
+                batch = []
+        if batch:
+            await self._parent.executemany(sql, batch)
+
+    async def analyze(self) -> None:
+        await self._parent.execute("ANALYZE")
+
+    async def close(self) -> None:
+        await self._parent.close_connection()
+        self._directory.cleanup()
+
+
+# === MEASUREMENT ===
+
+class _ErrorCounter(logging.Handler):
+    """ Считает ошибки, записанные в лог (обработчики БД пишут их вместо исключений) """
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+async def _measure(handler, method: str, make_args, context: Context, requests: int, concurrency: int,
+                   time_budget: float) -> dict:
+    call = getattr(handler, method)
+    samples = []
+    empty = 0
+    deadline = time.perf_counter() + time_budget
+    remaining = requests
+
+    async def client():
+        nonlocal remaining, empty
+        while remaining > 0 and time.perf_counter() < deadline:
+            remaining -= 1
+            args = make_args(context)
+            start = time.perf_counter()
+            result = await call(*args)
+            samples.append(time.perf_counter() - start)
+            # Обработчики возвращают None и при ошибке запроса (ошибка пишется в лог)
+            if result is None:
+                empty += 1
+            elif method == 'add_reminder':
+                context.reminder_ids.append(result)
+
+    errors = _ErrorCounter()
+    logging.getLogger().addHandler(errors)
+    try:
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    finally:
+        logging.getLogger().removeHandler(errors)
+    samples.sort()
+    if empty == len(samples) and errors.count:
+        # Ни один вызов не выполнился: время путей обработки ошибки не сохраняется
+        return {'requests': len(samples), 'none_results': empty, 'errors': errors.count, 'failed': True}
+    return {
+        'requests': len(samples),
+        'none_results': empty,
+        'errors': errors.count,
+        'p50_ms': round(statistics.median(samples) * 1000, 3),
+        'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+    }
+
+
+def _growth(scales: list[dict]) -> dict[str, float]:
+    """ Наклон log(p50)/log(размер таблицы) между наименьшим и наибольшим масштабом для каждого метода """
+    if len(scales) < 2:
+        return {}
+    first, last = scales[0], scales[-1]
+    growth = {}
+    for _, method, table, _ in METHODS:
+        size_ratio = last['counts'][table] / max(first['counts'][table], 1)
+        if size_ratio <= 1 or _failed(first, method) or _failed(last, method):
+            continue
+        p50_first, p50_last = first['methods'][method]['p50_ms'], last['methods'][method]['p50_ms']
+        growth[method] = round(math.log(max(p50_last, 1e-3) / max(p50_first, 1e-3)) / math.log(size_ratio), 2)
+    return growth
+
+
+def _failed(scale: dict, method: str) -> bool:
+    """ True - если метода нет в результатах масштаба или все его вызовы завершились ошибкой """
+    stats = scale['methods'].get(method)
+    return stats is None or stats.get('failed', False)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _compare(result: dict, previous: dict) -> None:
+    print(f"\nComparison with {previous.get('commit')} ({previous.get('backend')}), p50:")
+    previous_scales = {(scale['counts']['users'], scale['counts']['videos']): scale for scale in previous['scales']}
+    for scale in result['scales']:
+        old = previous_scales.get((scale['counts']['users'], scale['counts']['videos']))
+        if old is None:
+            continue
+        print(f"  users {scale['counts']['users']}, videos {scale['counts']['videos']}:")
+        for method, stats in scale['methods'].items():
+            if _failed(scale, method) or _failed(old, method):
+                if method in old['methods']:
+                    print(f"    {method:32} failed in {'this' if _failed(scale, method) else 'previous'} run")
+                continue
+            if method in old['methods']:
+                before = old['methods'][method]['p50_ms']
+                ratio = stats['p50_ms'] / before if before else float('inf')
+                print(f"    {method:32} {before:10.3f} -> {stats['p50_ms']:10.3f} ms  ({ratio:5.2f}x)")
+
+
+async def main(args: argparse.Namespace) -> None:
+    dotenv.load_dotenv()
+    dsn = os.getenv('POSTGRES_CONNECTION_STRING')
+    backend_name = args.backend if args.backend != 'auto' else ('postgres' if dsn else 'sqlite')
+    backend = PostgresBackend(dsn, args.concurrency + 2) if backend_name == 'postgres' else SqliteBackend()
+    targets = [Counts(*(int(part) for part in scale.split(':'))) for scale in args.scale or DEFAULT_SCALES]
+    rng = random.Random(0)
+
+    result = {'backend': backend.name, 'commit': _git_commit(), 'timestamp': datetime.datetime.now().isoformat(),
+              'concurrency': args.concurrency, 'requests': args.requests, 'scales': []}
+    handlers = await backend.open()
+    try:
+        current = Counts()
+        for target in sorted(targets, key=lambda counts: (counts.users, counts.videos)):
+            start = time.perf_counter()
+            for table, columns, rows in _seed_rows(current, target):
+                await backend.seed(table, columns, rows)
+            await backend.analyze()
+            current = target
+            print(f"\n[{backend.name}] users {target.users}, videos {target.videos} "
+                  f"(seeded in {time.perf_counter() - start:.1f} s)")
+
+            context = Context(target, rng)
+            methods = {}
+            for handler_key, method, _, make_args in METHODS:
+                methods[method] = await _measure(handlers[handler_key], method, make_args, context,
+                                                 args.requests, args.concurrency, args.time_budget)
+                stats = methods[method]
+                if stats.get('failed'):
+                    print(f"  {method:32} FAILED: all {stats['requests']} calls returned None, "
+                          f"{stats['errors']} errors logged")
+                    continue
+                print(f"  {method:32} p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms  "
+                      f"({stats['requests']} calls, {stats['none_results']} None)")
+            result['scales'].append({'counts': target.as_dict(), 'methods': methods})
+            failed = sorted(method for method, stats in methods.items() if stats.get('failed'))
+            if failed:
+                result.setdefault('failed', {})[f"{target.users}:{target.videos}"] = failed
+    finally:
+        await backend.close()
+
+    result['growth'] = _growth(result['scales'])
+    result['linear'] = sorted(method for method, slope in result['growth'].items() if slope >= LINEAR_SLOPE)
+    if result['linear']:
+        print(f"\nLatency grows ~linearly with table size (slope >= {LINEAR_SLOPE}):")
+        for method in result['linear']:
+            print(f"  {method:32} slope {result['growth'][method]}")
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"\nResults saved to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            _compare(result, json.load(file))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Database layer micro-benchmarks")
+    parser.add_argument('--scale', action='append', metavar='USERS:VIDEOS',
+                        help=f"dataset size, can be repeated (default: {' '.join(DEFAULT_SCALES)})")
+    parser.add_argument('--backend', choices=('auto', 'postgres', 'sqlite'), default='auto',
+                        help="auto - postgres if POSTGRES_CONNECTION_STRING is set, otherwise sqlite")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent callers per method")
+    parser.add_argument('--requests', type=int, default=500, help="calls per method and scale")
+    parser.add_argument('--time-budget', type=float, default=5.0, help="max seconds per method and scale")
+    parser.add_argument('--output', default='bench_db.json', help="JSON file for the results")
+    parser.add_argument('--compare', help="JSON results of another run to compare with")
+    asyncio.run(main(parser.parse_args()))
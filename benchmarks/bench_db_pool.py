@@ -0,0 +1,91 @@
+"""Бенчмарк слоя запросов к PostgreSQL: пул по умолчанию против настроенного пула с подготовленными запросами.
+
+Для get_user_by_id и get_videos_by_subject_id запускается CONCURRENCY одновременных клиентов, каждый выполняет
+запросы подряд. Сравниваются два варианта:
+    baseline - asyncpg.create_pool(dsn) с настройками по умолчанию и текстом запроса в каждом вызове
+               (как было до реестра запросов);
+    prepared - пул из ParentPostgresqlHandler.open_connection (параметры из окружения, прогрев соединений,
+               подготовленные запросы реестра).
+Выводятся p50 и p99 времени одного запроса.
+
+Бенчмарк только читает данные: ID пользователей и предметов берутся из существующих таблиц.
+Запуск из корня репозитория (нужен POSTGRES_CONNECTION_STRING в окружении или .env):
+    python -m benchmarks.bench_db_pool [кол-во запросов на клиента] [кол-во клиентов]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+import dotenv
+
+os.environ.setdefault('TOKEN', '123456:benchmark')
+
+from loader import db_handler, db_video_handler  # noqa: E402
+from database_handlers.postgresql_handler import ParentPostgresqlHandler  # noqa: E402
+
+USER_SQL = "SELECT * FROM users WHERE chat_id = $1"
+VIDEOS_SQL = """SELECT V.id, V.name, V.telegram_file_id
+                FROM subjects S
+                JOIN teachers T ON S.id = T.subject_id
+                JOIN videos V ON T.id = V.teacher_id
+                WHERE S.id = $1
+                ORDER BY V.id"""
+
+
+def _percentiles(samples: list[float]) -> str:
+    samples = sorted(samples)
+    p50 = statistics.median(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"p50 {p50 * 1000:7.3f} ms   p99 {p99 * 1000:7.3f} ms"
+
+
+async def _clients(call, keys: list, requests: int, concurrency: int) -> list[float]:
+    samples = []
+
+    async def client(offset: int):
+        for i in range(requests):
+            start = time.perf_counter()
+            await call(keys[(offset + i) % len(keys)])
+            samples.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return samples
+
+
+async def main(requests: int = 200, concurrency: int = 50) -> None:
+    dotenv.load_dotenv()
+    dsn = os.getenv('POSTGRES_CONNECTION_STRING')
+
+    baseline = await asyncpg.create_pool(dsn)
+    chat_ids = [r['chat_id'] for r in await baseline.fetch("SELECT chat_id FROM users LIMIT 1000")] or [0]
+    subject_ids = [r['id'] for r in await baseline.fetch("SELECT id FROM subjects LIMIT 1000")] or [0]
+
+    async def baseline_user(chat_id):
+        async with baseline.acquire() as conn:
+            await conn.fetchrow(USER_SQL, chat_id)
+
+    async def baseline_videos(subject_id):
+        async with baseline.acquire() as conn:
+            await conn.fetch(VIDEOS_SQL, subject_id)
+
+    print(f"{concurrency} clients x {requests} requests")
+    print(f"baseline get_user_by_id:           {_percentiles(await _clients(baseline_user, chat_ids, requests, concurrency))}")
+    print(f"baseline get_videos_by_subject_id: {_percentiles(await _clients(baseline_videos, subject_ids, requests, concurrency))}")
+    await baseline.close()
+
+    await db_handler.set_table('users')
+    await ParentPostgresqlHandler.open_connection(dsn)
+    await ParentPostgresqlHandler.warm_up()
+    print(f"prepared get_user_by_id:           "
+          f"{_percentiles(await _clients(db_handler.get_user_by_id, chat_ids, requests, concurrency))}")
+    print(f"prepared get_videos_by_subject_id: "
+          f"{_percentiles(await _clients(db_video_handler.get_videos_by_subject_id, subject_ids, requests, concurrency))}")
+    await ParentPostgresqlHandler.close_connection()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*args))
@@ -0,0 +1,192 @@
+"""Сквозной бенчмарк пропускной способности бота.
+
+Запускается локальная замена Bot API (benchmarks.fake_bot_api), бот подключается к ней через
+TELEGRAM_API_SERVER, а синтетические пользователи параллельно проходят типичные сценарии через настоящий
+диспетчер dp из loader.py с настоящими обработчиками и базой данных:
+    зритель - /start -> выбор роли -> Смотреть видео -> следующая страница категорий -> категория ->
+              Выбрать видео -> следующая страница видео -> видео -> соседнее видео -> Выбрать видео -> видео ->
+              Главное меню;
+    админ   - /start -> выбор роли -> Админ меню -> Установить напоминание -> ник -> дата -> время ->
+              текст -> Установить.
+Нажатие выбирается из клавиатуры, которую бот последним отправил в чат, поэтому сценарий идет
+по настоящему интерфейсу; шаг пропускается, если нужной кнопки нет.
+
+Каталог создается в отдельной схеме и удаляется после прогона. Ограничения частоты запросов к Bot API
+по умолчанию сняты, чтобы измерялся сам бот (--telegram-limits оставляет ограничения OutboundDispatcher).
+Результат: обновлений в секунду, p50/p99 времени обработки обновления и кол-во запросов к Bot API на обновление.
+
+Запуск из корня репозитория (нужен POSTGRES_CONNECTION_STRING в окружении или .env):
+    python -m benchmarks.bench_e2e [--users 200] [--admins 5] [--rounds 3] [--latency 0.03] [--rate-429 0.01]
+"""
+import argparse
+import asyncio
+import datetime
+import itertools
+import os
+import random
+import statistics
+import time
+
+import asyncpg
+import dotenv
+from aiogram.types import Update, Message, CallbackQuery, Chat, User, Video
+
+from benchmarks.fake_bot_api import FakeBotApi, video_object
+
+SCHEMA = 'bench_e2e'
+FACULTIES = 5
+SUBJECTS = 60
+TEACHERS = 240
+VIDEOS = 6000
+
+# Шаги сценариев: ('command' | 'text', текст) или ('click', начало callback_data кнопки)
+VIEWER_FLOW = [
+    ('command', '/start'),
+    ('click', 'select_user'),
+    ('click', 'watch_video'),
+    ('click', 'cp:'),
+    ('click', 'sc:'),
+    ('click', 'cv:'),
+    ('click', 'vp:'),
+    ('click', 'sv:'),
+    # Предыдущее или следующее видео, возврат к списку и выбор другого видео - в том же сообщении
+    ('click', 'sv:'),
+    ('click', 'cv:'),
+    ('click', 'sv:'),
+    ('click', 'main_menu'),
+]
+ADMIN_FLOW = [
+    ('command', '/start'),
+    ('click', 'select_admin'),
+    ('click', 'admin_menu'),
+    ('click', 'admin_set_reminder'),
+    # Напоминание админ ставит самому себе - его ник точно есть в БД
+    ('text', '{username}'),
+    ('click', 'sd:'),
+    ('text', '12:00'),
+    ('text', 'Benchmark reminder'),
+    ('click', 'admin_confirm_reminder'),
+]
+
+
+def catalog_records():
+    for video in range(1, VIDEOS + 1):
+        teacher = video % TEACHERS
+        subject = teacher % SUBJECTS
+        yield (f"faculty {subject % FACULTIES}", f"subject {subject}", f"teacher {teacher}", f"video {video}",
+               f"bench_file_{video}")
+
+
+class Client:
+    """ Синтетический пользователь: отправляет обновления в диспетчер и измеряет время их обработки """
+
+    _update_ids = itertools.count(1)
+
+    def __init__(self, bot_module, api: FakeBotApi, user_id: int, flow: list, rng: random.Random):
+        self._bot_module = bot_module
+        self._api = api
+        self._flow = flow
+        self._random = rng
+        self.user = User(id=user_id, is_bot=False, first_name=f"User {user_id}", username=f"bench_user_{user_id}")
+        self.chat = Chat(id=user_id, type='private')
+        self._message_ids = itertools.count(1)
+        self.latencies: list[float] = []
+        self.skipped = 0
+
+    async def run(self, rounds: int) -> None:
+        for _ in range(rounds):
+            for kind, value in self._flow:
+                update = self._make_update(kind, value.format(username=self.user.username))
+                if update is None:
+                    self.skipped += 1
+                    continue
+                start = time.perf_counter()
+                await self._bot_module.dp.feed_update(self._bot_module.bot, update)
+                self.latencies.append(time.perf_counter() - start)
+
+    def _make_update(self, kind: str, value: str) -> Update | None:
+        now = datetime.datetime.now()
+        update_id = next(self._update_ids)
+        if kind != 'click':
+            message = Message(message_id=1000000 + next(self._message_ids), date=now, chat=self.chat,
+                              from_user=self.user, text=value)
+            return Update(update_id=update_id, message=message)
+
+        buttons = [data for data in self._api.buttons(self.chat.id) if data.startswith(value)]
+        if not buttons:
+            return None
+        last = self._api.chats[self.chat.id]
+        content = {'video': Video(**video_object(last['video'])), 'caption': last['text']} if last.get('video') \
+            else {'text': last['text'] or '-'}
+        message = Message(message_id=last['message_id'], date=now, chat=self.chat,
+                          from_user=User(id=1, is_bot=True, first_name='Fake bot'), **content)
+        callback = CallbackQuery(id=str(update_id), from_user=self.user, chat_instance='bench',
+                                 data=self._random.choice(buttons), message=message)
+        return Update(update_id=update_id, callback_query=callback)
+
+
+def _percentile(samples: list[float], percent: float) -> float:
+    return statistics.quantiles(samples, n=100)[int(percent) - 1] if len(samples) > 1 else samples[0]
+
+
+async def main(args: argparse.Namespace) -> None:
+    dotenv.load_dotenv()
+    api = FakeBotApi(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429)
+    # Бот создается при импорте loader.py, поэтому адрес Bot API и ограничения задаются до импорта
+    os.environ['TELEGRAM_API_SERVER'] = await api.start(port=args.api_port)
+    os.environ.setdefault('TOKEN', '123456:bench')
+    os.environ['FSM_STORAGE'] = 'memory'
+    if not args.telegram_limits:
+        os.environ.update(BOT_API_RATE='1000000', BOT_API_CHAT_RATE='1000000', BOT_API_CONCURRENCY='1000')
+    import loader as bot_module
+    # Импорт модулей с обработчиками регистрирует их в диспетчере
+    import callback_handlers  # noqa: F401
+    import message_handlers  # noqa: F401
+    from database_handlers.functions import import_catalog
+    from database_handlers.postgresql_handler import ParentPostgresqlHandler
+
+    dsn = os.getenv('POSTGRES_CONNECTION_STRING')
+    admin = await asyncpg.connect(dsn)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    try:
+        await bot_module.connect_to_db(min_size=2, max_size=args.pool_size, server_settings={'search_path': SCHEMA})
+        await bot_module.ParentDatabaseHandler.warm_up()
+        print(f"Catalog: {await import_catalog(catalog_records())}")
+
+        rng = random.Random(0)
+        clients = [Client(bot_module, api, 100000 + i, VIEWER_FLOW, rng) for i in range(args.users)]
+        clients += [Client(bot_module, api, 200000 + i, ADMIN_FLOW, rng) for i in range(args.admins)]
+        api.reset()
+        start = time.perf_counter()
+        await asyncio.gather(*(client.run(args.rounds) for client in clients))
+        elapsed = time.perf_counter() - start
+
+        latencies = [latency for client in clients for latency in client.latencies]
+        print(f"clients: {len(clients)}, rounds: {args.rounds}, updates: {len(latencies)}, "
+              f"skipped steps: {sum(client.skipped for client in clients)}")
+        print(f"throughput:        {len(latencies) / elapsed:9.1f} updates/s")
+        print(f"latency p50:       {_percentile(latencies, 50) * 1000:9.2f} ms")
+        print(f"latency p99:       {_percentile(latencies, 99) * 1000:9.2f} ms")
+        print(f"API calls/update:  {api.total_calls / len(latencies):9.2f}")
+        print(f"flood waits (429): {api.flood_waits}")
+        print("API calls by method: " + ", ".join(f"{method} {count}" for method, count in api.calls.most_common()))
+    finally:
+        await ParentPostgresqlHandler.close_connection()
+        await bot_module.bot.session.close()
+        await api.stop()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End-to-end bot throughput benchmark")
+    parser.add_argument('--users', type=int, default=200, help="concurrent viewers")
+    parser.add_argument('--admins', type=int, default=5, help="concurrent admins setting reminders")
+    parser.add_argument('--rounds', type=int, default=3, help="times each client repeats its flow")
+    parser.add_argument('--latency', type=float, default=0.03, help="fake Bot API response delay, seconds")
+    parser.add_argument('--jitter', type=float, default=0.01, help="max random extra delay, seconds")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="share of Bot API requests answered with 429")
+    parser.add_argument('--pool-size', type=int, default=20, help="database pool size")
+    parser.add_argument('--api-port', type=int, default=8081)
+    parser.add_argument('--telegram-limits', action='store_true', help="keep OutboundDispatcher rate limits")
+    asyncio.run(main(parser.parse_args()))
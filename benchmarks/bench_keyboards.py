@@ -0,0 +1,41 @@
+"""Микро-бенчмарк построения клавиатур: сборка с нуля против готовой разметки из кэша.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_keyboards [кол-во повторов]
+"""
+import datetime
+import os
+import sys
+import timeit
+
+# menu_manager импортирует bot, которому нужен токен правильного формата
+os.environ.setdefault('TOKEN', '123456:benchmark')
+
+import menu_manager
+
+
+def _measure(func, number: int) -> float:
+    """ Возвращает среднее время одного вызова в микросекундах """
+    return timeit.timeit(func, number=number) / number * 1_000_000
+
+
+def main(number: int = 2000) -> None:
+    today = datetime.date.today()
+    cases = {
+        'main_menu (user)': (menu_manager._main_menu_markup, ('user',)),
+        'main_menu (admin)': (menu_manager._main_menu_markup, ('admin',)),
+        'choose_role_menu': (menu_manager._choose_role_markup, (None,)),
+        'admin_menu': (menu_manager._admin_menu_markup, ()),
+        'cancel_button': (menu_manager._cancel_button_markup, ()),
+        'calendar': (menu_manager._calendar_markup, (today.month, today.year, today)),
+    }
+    print(f"{'menu':<20}{'build, µs':>12}{'cached, µs':>12}{'speedup':>10}")
+    for name, (builder, args) in cases.items():
+        built = _measure(lambda: builder.__wrapped__(*args), number)
+        builder(*args)
+        cached = _measure(lambda: builder(*args), number)
+        print(f"{name:<20}{built:>12.2f}{cached:>12.2f}{built / cached:>9.0f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
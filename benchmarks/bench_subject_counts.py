@@ -0,0 +1,93 @@
+"""Бенчмарк списка предметов с видео: GROUP BY по всем видео против таблицы счетчиков.
+
+В отдельной схеме создаются все таблицы (теми же обработчиками и миграциями, что и в боте), а таблицы каталога
+заполняются синтетическими данными: факультеты, предметы, преподаватели и VIDEOS видео.
+Затем сравнивается время прежнего запроса get_subjects (JOIN трех таблиц + GROUP BY/HAVING)
+и запроса по таблице счетчиков subject_video_counts. Схема удаляется после прогона.
+
+Запуск из корня репозитория (нужен POSTGRES_CONNECTION_STRING в окружении или .env):
+    python -m benchmarks.bench_subject_counts [кол-во видео] [кол-во повторов]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import asyncpg
+import dotenv
+
+from database_handlers.migrations import migrate
+from database_handlers.postgresql_handler import ParentPostgresqlHandler, PostgresqlHandler, PostgresqlVideoHandler, \
+    PostgresqlRemindersHandler
+from database_handlers.queries import registry
+
+SCHEMA = 'bench_subject_counts'
+FACULTIES = 20
+SUBJECTS = 2000
+TEACHERS = 10000
+
+GROUP_BY_SQL = """SELECT S.id, S.name
+                  FROM subjects S
+                  JOIN teachers T ON S.id = T.subject_id
+                  JOIN videos V ON T.id = V.teacher_id
+                  GROUP BY S.id, S.name
+                  HAVING COUNT(V.id) > 0"""
+
+
+async def _seed(conn: asyncpg.Connection, videos: int) -> None:
+    await conn.execute(f"""
+        INSERT INTO faculties (name) SELECT 'faculty ' || g FROM generate_series(1, {FACULTIES}) g;
+        INSERT INTO subjects (name, faculty_id)
+            SELECT 'subject ' || g, 1 + g % {FACULTIES} FROM generate_series(1, {SUBJECTS}) g;
+        INSERT INTO teachers (name, subject_id)
+            SELECT 'teacher ' || g, 1 + g % {SUBJECTS} FROM generate_series(1, {TEACHERS}) g;
+        INSERT INTO videos (teacher_id, telegram_file_id, name)
+            SELECT 1 + g % {TEACHERS}, 'file_' || g, 'video ' || g FROM generate_series(1, {videos}) g;
+        ANALYZE;""")
+
+
+async def _timed(conn: asyncpg.Connection, sql: str, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        await conn.fetch(sql)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+async def main(videos: int = 1_000_000, repeats: int = 20) -> None:
+    dotenv.load_dotenv()
+    dsn = os.getenv('POSTGRES_CONNECTION_STRING')
+    admin = await asyncpg.connect(dsn)
+    await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}")
+    try:
+        await ParentPostgresqlHandler.open_connection(dsn, min_size=1, max_size=2,
+                                                      server_settings={'search_path': SCHEMA})
+        # Миграции затрагивают и таблицы пользователей и напоминаний, поэтому создаются все таблицы бота
+        users_handler = PostgresqlHandler()
+        await users_handler.set_table('users')
+        for handler in (users_handler, PostgresqlVideoHandler(), PostgresqlRemindersHandler()):
+            await handler.create_table_if_not_exist()
+        async with ParentPostgresqlHandler.connection() as conn:
+            await migrate(conn)
+            start = time.perf_counter()
+            await _seed(conn, videos)
+            print(f"Seeded {videos} videos in {time.perf_counter() - start:.1f} s (counters maintained by triggers)")
+
+            group_by = await _timed(conn, GROUP_BY_SQL, repeats)
+            counters = await _timed(conn, registry['videos.subjects'], repeats)
+            subjects = len(await conn.fetch(registry['videos.subjects']))
+        print(f"subjects with videos: {subjects}")
+        print(f"GROUP BY over videos:  {group_by:9.2f} ms")
+        print(f"subject_video_counts:  {counters:9.2f} ms")
+        print(f"speedup:               {group_by / counters:9.1f}x")
+    finally:
+        await ParentPostgresqlHandler.close_connection()
+        await admin.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await admin.close()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    asyncio.run(main(*args))
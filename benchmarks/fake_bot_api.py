@@ -0,0 +1,177 @@
+"""Локальная замена Telegram Bot API для бенчмарков.
+
+Сервер на aiohttp принимает запросы вида <адрес>/bot<токен>/<метод> (формат TelegramAPIServer.from_base),
+отвечает правдоподобными результатами и записывает вызовы: кол-во по методам, а для каждого чата -
+последнее сообщение бота (текст или видео) с клавиатурой, по которой бенчмарк выбирает следующее нажатие.
+Можно задать задержку ответа и долю ответов 429 Too Many Requests (flood wait), а также ответить 429
+на следующие запросы в конкретный чат (flood_chats). Время поступления каждого запроса записывается в requests.
+Как и настоящий Bot API, сервер отвечает 400 на изменение текста видео-сообщения и медиа текстового сообщения,
+а на отправку сообщений в чаты из blocked_chats - 403 (пользователь заблокировал бота).
+
+Запуск отдельно (бот подключается через TELEGRAM_API_SERVER=http://127.0.0.1:8081):
+    python -m benchmarks.fake_bot_api [--port 8081] [--latency 0.05] [--jitter 0.02] [--rate-429 0.01]
+"""
+import argparse
+import asyncio
+import collections
+import json
+import random
+import time
+
+from aiohttp import web
+
+# Методы, которые возвращают отправленное или измененное сообщение
+_MESSAGE_METHODS = {'sendMessage', 'sendVideo', 'sendDocument', 'sendPhoto', 'editMessageText',
+                    'editMessageReplyMarkup', 'editMessageMedia', 'editMessageCaption'}
+
+
+class FakeBotApi:
+    """ Имитация Bot API с записью вызовов """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_429: float = 0.0, retry_after: int = 1,
+                 seed: int = 0):
+        """
+        :param latency: Задержка каждого ответа (в секундах).
+        :param jitter: Максимальная случайная добавка к задержке (в секундах).
+        :param rate_429: Доля запросов, на которые отвечается 429 Too Many Requests.
+        :param retry_after: Значение retry_after в ответах 429 (в секундах).
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.flood_waits = 0
+        # Последнее сообщение бота в каждом чате: {'message_id', 'text', 'reply_markup', 'video'}
+        self.chats: dict[int, dict] = {}
+        # Чаты пользователей, заблокировавших бота
+        self.blocked_chats: set[int] = set()
+        # Чат -> кол-во следующих запросов в него, на которые отвечается 429
+        self.flood_chats: collections.Counter[int | str] = collections.Counter()
+        # Поступившие запросы: (time.monotonic(), метод, chat_id или None)
+        self.requests: list[tuple[float, str, int | str | None]] = []
+        self._message_ids: collections.Counter[int] = collections.Counter()
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self) -> None:
+        """ Сбрасывает счетчики вызовов (состояние чатов сохраняется) """
+        self.calls.clear()
+        self.flood_waits = 0
+        self.requests.clear()
+
+    def buttons(self, chat_id: int) -> list[str]:
+        """ Возвращает callback_data кнопок последнего сообщения бота в чате """
+        markup = (self.chats.get(chat_id) or {}).get('reply_markup') or {}
+        return [button['callback_data'] for row in markup.get('inline_keyboard', [])
+                for button in row if 'callback_data' in button]
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8081) -> str:
+        """ Запускает сервер и возвращает базовый адрес для TELEGRAM_API_SERVER (port=0 - любой свободный порт) """
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        return f"http://{host}:{self._runner.addresses[0][1]}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = dict(await request.post())
+        chat_id = params.get('chat_id')
+        # chat_id может быть и username канала (@channel)
+        chat_id = int(chat_id) if chat_id and chat_id.lstrip('-').isdigit() else chat_id
+        self.requests.append((time.monotonic(), method, chat_id))
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        flooded = self.flood_chats[chat_id] > 0
+        if flooded:
+            self.flood_chats[chat_id] -= 1
+        if flooded or self.rate_429 and self._random.random() < self.rate_429:
+            self.flood_waits += 1
+            return web.json_response({'ok': False, 'error_code': 429,
+                                      'description': f'Too Many Requests: retry after {self.retry_after}',
+                                      'parameters': {'retry_after': self.retry_after}}, status=429)
+        self.calls[method] += 1
+        if method.startswith('send') and chat_id in self.blocked_chats:
+            return web.json_response({'ok': False, 'error_code': 403,
+                                      'description': 'Forbidden: bot was blocked by the user'}, status=403)
+        error = self._edit_error(method, params)
+        if error:
+            return web.json_response({'ok': False, 'error_code': 400, 'description': f'Bad Request: {error}'},
+                                     status=400)
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    def _edit_error(self, method: str, params: dict) -> str | None:
+        """ Как и Bot API, не дает изменить текст видео-сообщения или медиа текстового сообщения """
+        chat = self.chats.get(int(params.get('chat_id') or 0))
+        if chat is None or int(params.get('message_id') or 0) != chat['message_id']:
+            return None
+        if method == 'editMessageText' and chat['video']:
+            return 'there is no text in the message to edit'
+        if method in ('editMessageMedia', 'editMessageCaption') and not chat['video']:
+            return 'there is no media in the message to edit'
+
+    def _result(self, method: str, params: dict):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Fake bot', 'username': 'fake_bot'}
+        if method not in _MESSAGE_METHODS:
+            return True
+
+        chat_id = int(params['chat_id'])
+        chat = self.chats.setdefault(chat_id, {'message_id': 0, 'text': '', 'reply_markup': None, 'video': None})
+        if method.startswith('send'):
+            self._message_ids[chat_id] += 1
+            chat.update(message_id=self._message_ids[chat_id], text=params.get('text') or params.get('caption', ''),
+                        reply_markup=None, video=params.get('video'))
+        elif method == 'editMessageMedia':
+            media = json.loads(params['media'])
+            chat.update(text=media.get('caption', ''), video=media['media'])
+        elif 'text' in params or 'caption' in params:
+            chat['text'] = params.get('text') or params.get('caption', '')
+        if 'reply_markup' in params:
+            chat['reply_markup'] = json.loads(params['reply_markup'])
+        result = {'message_id': int(params.get('message_id') or chat['message_id']), 'date': int(time.time()),
+                  'chat': {'id': chat_id, 'type': 'private'}}
+        if chat['video']:
+            result.update(caption=chat['text'], video=video_object(chat['video']))
+        else:
+            result['text'] = chat['text'] or '-'
+        return result
+
+
+def video_object(file_id: str) -> dict:
+    """ Объект Video Bot API для file_id """
+    return {'file_id': file_id, 'file_unique_id': file_id, 'width': 1280, 'height': 720, 'duration': 60}
+
+async def _serve(args: argparse.Namespace) -> None:
+    api = FakeBotApi(latency=args.latency, jitter=args.jitter, rate_429=args.rate_429)
+    print(f"Fake Bot API listening on {await api.start(port=args.port)}")
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(f"calls: {api.total_calls} {dict(api.calls)}, flood waits: {api.flood_waits}")
+    finally:
+        await api.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="response delay, seconds")
+    parser.add_argument('--jitter', type=float, default=0.0, help="max random extra delay, seconds")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="share of requests answered with 429")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
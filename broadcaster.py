@@ -0,0 +1,151 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+
+from outbound_dispatcher import bulk_sending
+
+# Результаты отправки одного сообщения рассылки
+SENT = 'sent'
+FAILED = 'failed'
+BLOCKED = 'blocked'
+
+
+class Broadcaster:
+    """Рассылка сообщения всем активным пользователям.
+
+    Получатели читаются из БД пачками по возрастанию id (keyset), поэтому в памяти находится только одна пачка,
+    а длинная рассылка не держит открытой транзакцию. Пачка отправляется параллельно с приоритетом массовых
+    запросов - частоту ограничивает OutboundDispatcher. После каждой пачки в БД сохраняется контрольная точка
+    (id последнего получателя и счетчики), поэтому после перезапуска бота рассылка продолжается с места остановки.
+    Пользователи, заблокировавшие бота, помечаются неактивными и не получают следующие рассылки.
+    Ход рассылки (скорость и оставшееся время) показывается в сообщении в чате администратора.
+    """
+
+    # Минимальный интервал между обновлениями сообщения о ходе рассылки (в секундах)
+    PROGRESS_INTERVAL = 5
+    # Пауза перед повтором, если база данных недоступна (в секундах)
+    RETRY_DELAY = 60
+
+    def __init__(self, users_handler, broadcasts_handler, user_cache=None, chunk_size: int = 500):
+        """
+        :param users_handler: Обработчик таблицы пользователей (PostgresqlHandler).
+        :param broadcasts_handler: Обработчик таблицы рассылок (PostgresqlBroadcastHandler).
+        :param user_cache: Кэш пользователей (UserCache), из которого удаляются заблокировавшие бота.
+        :param chunk_size: Кол-во получателей, читаемых и отправляемых за один раз.
+        """
+        self._users_handler = users_handler
+        self._broadcasts_handler = broadcasts_handler
+        self._user_cache = user_cache
+        self._chunk_size = chunk_size
+        self._tasks: dict[int, asyncio.Task] = {}
+
+    def __len__(self) -> int:
+        """ Кол-во выполняющихся рассылок """
+        return len(self._tasks)
+
+    async def start(self, bot: Bot, admin_chat_id: int, text: str) -> int | None:
+        """Создает рассылку и запускает ее в фоне.
+
+        :param bot: Экземпляр бота.
+        :param admin_chat_id: Чат администратора, в котором показывается ход рассылки.
+        :param text: Текст рассылки.
+        :return: ID рассылки или None, если ее не удалось создать.
+        """
+        total = await self._users_handler.count_active_users()
+        broadcast = await self._broadcasts_handler.create_broadcast(admin_chat_id, text, total or 0)
+        if broadcast is None:
+            return None
+        broadcast = dict(broadcast)
+        status = await bot.send_message(admin_chat_id, f"Рассылка #{broadcast['id']} запущена: {total} получателей")
+        await self._broadcasts_handler.set_status_message(broadcast['id'], status.message_id)
+        broadcast['status_message_id'] = status.message_id
+        self._spawn(bot, broadcast)
+        return broadcast['id']
+
+    async def resume(self, bot: Bot) -> None:
+        """ Продолжает рассылки, прерванные остановкой бота """
+        for broadcast in await self._broadcasts_handler.get_unfinished_broadcasts() or []:
+            if broadcast['id'] not in self._tasks:
+                logging.info(f"Resuming broadcast {broadcast['id']} after user {broadcast['last_user_id']}")
+                self._spawn(bot, dict(broadcast))
+
+    def _spawn(self, bot: Bot, broadcast: dict) -> None:
+        task = asyncio.create_task(self._run(bot, broadcast))
+        self._tasks[broadcast['id']] = task
+        task.add_done_callback(lambda t: self._tasks.pop(broadcast['id'], None))
+
+    async def _run(self, bot: Bot, broadcast: dict) -> None:
+        started = time.monotonic()
+        # Кол-во сообщений, обработанных до перезапуска, не учитывается в скорости текущего запуска
+        processed_before = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        last_report = 0.0
+        while True:
+            users = await self._users_handler.get_active_users_chunk(after_id=broadcast['last_user_id'],
+                                                                     limit=self._chunk_size)
+            if users is None:
+                await asyncio.sleep(self.RETRY_DELAY)
+                continue
+            if not users:
+                break
+
+            with bulk_sending():
+                results = await asyncio.gather(*(self._send(bot, user['chat_id'], broadcast['text'])
+                                                 for user in users))
+            blocked = [user for user, result in zip(users, results) if result == BLOCKED]
+            blocked_user_ids = [user['id'] for user in blocked]
+            sent, failed = results.count(SENT), results.count(FAILED)
+            while not await self._broadcasts_handler.save_progress(broadcast['id'], users[-1]['id'], sent, failed,
+                                                                   blocked_user_ids):
+                await asyncio.sleep(self.RETRY_DELAY)
+            if self._user_cache is not None:
+                # Кэш не должен считать активными пользователей, помеченных неактивными в БД
+                for user in blocked:
+                    self._user_cache.invalidate(user['chat_id'])
+            broadcast['last_user_id'] = users[-1]['id']
+            broadcast['sent'] += sent
+            broadcast['failed'] += failed
+            broadcast['blocked'] += len(blocked_user_ids)
+
+            if time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                await self._report(bot, broadcast, processed_before, started)
+
+        await self._broadcasts_handler.finish_broadcast(broadcast['id'])
+        await self._report(bot, broadcast, processed_before, started, finished=True)
+
+    @staticmethod
+    async def _send(bot: Bot, chat_id: int, text: str) -> str:
+        try:
+            await bot.send_message(chat_id=chat_id, text=text)
+            return SENT
+        except TelegramForbiddenError:
+            return BLOCKED
+        except Exception as e:
+            logging.error(f"Error sending broadcast message to {chat_id}: {e}")
+            return FAILED
+
+    @staticmethod
+    async def _report(bot: Bot, broadcast: dict, processed_before: int, started: float,
+                      finished: bool = False) -> None:
+        processed = broadcast['sent'] + broadcast['failed'] + broadcast['blocked']
+        elapsed = time.monotonic() - started
+        rate = (processed - processed_before) / elapsed if elapsed > 0 else 0.0
+        text = (f"Рассылка #{broadcast['id']} {'завершена' if finished else 'выполняется'}\n"
+                f"Обработано: {processed} из {broadcast['total']}\n"
+                f"Отправлено: {broadcast['sent']}, ошибок: {broadcast['failed']}, "
+                f"заблокировали бота: {broadcast['blocked']}\n"
+                f"Скорость: {rate:.1f} сообщ./с")
+        if not finished and rate > 0:
+            remaining = max(broadcast['total'] - processed, 0) / rate
+            text += f"\nОсталось: ~{datetime.timedelta(seconds=int(remaining))}"
+        if broadcast['status_message_id'] is None:
+            return
+        try:
+            await bot.edit_message_text(chat_id=broadcast['admin_chat_id'],
+                                        message_id=broadcast['status_message_id'], text=text)
+        except Exception as e:
+            logging.error(f"Error reporting progress of broadcast {broadcast['id']}: {e}")
@@ -0,0 +1,161 @@
+"""Компактная двоичная упаковка данных колбэков.
+
+Telegram ограничивает callback_data 64 байтами. Стандартный CallbackData записывает поля текстом через ':',
+а PackedCallbackData упаковывает их в байты и кодирует base64url:
+
+    <prefix>:<base64url(версия кодека | поля | контрольная сумма)>
+
+Целые числа и bool записываются как varint (zigzag), строки - как длина + UTF-8. Контрольная сумма (2 байта blake2s
+от prefix и полей) отсекает обрезанные и поврежденные данные, а версия - кнопки, созданные старым форматом.
+Если упакованные данные не помещаются в 64 байта, они сохраняются в таблице коротких ключей на сервере,
+а в callback_data передается только ключ: "<prefix>:~<ключ>". Таблица ограничена по размеру и вытесняет
+давно не использованные записи, поэтому колбэк очень старой кнопки может не разобраться - он будет проигнорирован.
+"""
+import base64
+import hashlib
+from collections import OrderedDict
+from typing import Any
+
+from aiogram.filters.callback_data import MAX_CALLBACK_LENGTH, CallbackData
+
+# Версия формата упаковки. Увеличивается при несовместимом изменении полей колбэков
+CODEC_VERSION = 1
+# Признак того, что в callback_data передан ключ таблицы, а не сами данные
+SHORT_KEY_MARK = '~'
+CHECKSUM_SIZE = 2
+SHORT_KEY_SIZE = 6
+
+
+class ShortKeyTable:
+    """ Таблица коротких ключей для данных колбэков, не помещающихся в 64 байта (LRU) """
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._payloads: OrderedDict[str, bytes] = OrderedDict()
+
+    def put(self, payload: bytes) -> str:
+        # Ключ - хэш данных, поэтому одна и та же кнопка, построенная повторно, не занимает новую запись
+        key = _b64encode(hashlib.blake2s(payload, digest_size=SHORT_KEY_SIZE).digest())
+        self._payloads[key] = payload
+        self._payloads.move_to_end(key)
+        while len(self._payloads) > self.maxsize:
+            self._payloads.popitem(last=False)
+        return key
+
+    def get(self, key: str) -> bytes | None:
+        payload = self._payloads.get(key)
+        if payload is not None:
+            self._payloads.move_to_end(key)
+        return payload
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+
+short_key_table = ShortKeyTable()
+
+
+class PackedCallbackData(CallbackData, prefix=''):
+    """Базовый класс колбэков с двоичной упаковкой полей.
+
+    Поддерживаются поля типов int, bool и str. Наследники объявляются так же, как обычные CallbackData:
+        class SelectVideo(PackedCallbackData, prefix='sv'):
+            video_id: int
+    """
+
+    def pack(self) -> str:
+        body = bytearray([CODEC_VERSION])
+        for name, field in self.model_fields.items():
+            _write_value(body, field.annotation, getattr(self, name))
+        body += _checksum(self.__prefix__, body)
+        callback_data = f"{self.__prefix__}{self.__separator__}{_b64encode(body)}"
+        if len(callback_data.encode()) > MAX_CALLBACK_LENGTH:
+            callback_data = f"{self.__prefix__}{self.__separator__}{SHORT_KEY_MARK}{short_key_table.put(bytes(body))}"
+        return callback_data
+
+    @classmethod
+    def unpack(cls, value: str):
+        prefix, separator, encoded = value.partition(cls.__separator__)
+        if prefix != cls.__prefix__ or not separator:
+            raise ValueError(f"Bad prefix ({prefix!r} != {cls.__prefix__!r})")
+        if encoded.startswith(SHORT_KEY_MARK):
+            body = short_key_table.get(encoded[len(SHORT_KEY_MARK):])
+            if body is None:
+                raise ValueError(f"Callback data {value!r} has expired")
+        else:
+            body = _b64decode(encoded)
+        if len(body) <= CHECKSUM_SIZE or body[0] != CODEC_VERSION:
+            raise ValueError(f"Unsupported callback data version in {value!r}")
+        body, checksum = body[:-CHECKSUM_SIZE], body[-CHECKSUM_SIZE:]
+        if _checksum(cls.__prefix__, body) != checksum:
+            raise ValueError(f"Callback data {value!r} is corrupted")
+
+        offset = 1
+        payload = {}
+        for name, field in cls.model_fields.items():
+            payload[name], offset = _read_value(body, offset, field.annotation)
+        if offset != len(body):
+            raise ValueError(f"Callback data {value!r} has trailing bytes")
+        return cls(**payload)
+
+
+# === ENCODING ===
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def _b64decode(data: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+    except Exception as e:
+        raise ValueError(f"Bad callback data encoding: {e}")
+
+
+def _checksum(prefix: str, body: bytes) -> bytes:
+    return hashlib.blake2s(prefix.encode() + body, digest_size=CHECKSUM_SIZE).digest()
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    # zigzag: небольшие отрицательные числа тоже занимают мало байт (-1 -> 1, 1 -> 2, -2 -> 3).
+    # ~(value << 1) вместо (value << 1) ^ (value >> 63): целые Python не ограничены 64 битами
+    value = ~(value << 1) if value < 0 else value << 1
+    while value > 0x7F:
+        buffer.append(value & 0x7F | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, offset: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Truncated callback data")
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), offset
+
+
+def _write_value(buffer: bytearray, annotation: Any, value: Any) -> None:
+    if annotation is bool or annotation is int:
+        _write_varint(buffer, int(value))
+    elif annotation is str:
+        encoded = value.encode()
+        _write_varint(buffer, len(encoded))
+        buffer += encoded
+    else:
+        raise ValueError(f"Type {annotation!r} can not be packed to callback data")
+
+
+def _read_value(data: bytes, offset: int, annotation: Any) -> tuple[Any, int]:
+    if annotation is str:
+        length, offset = _read_varint(data, offset)
+        if length < 0 or offset + length > len(data):
+            raise ValueError("Truncated callback data")
+        return data[offset:offset + length].decode(), offset + length
+    value, offset = _read_varint(data, offset)
+    return (bool(value) if annotation is bool else value), offset
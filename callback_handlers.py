@@ -1,22 +1,31 @@
+import io
 import json
+import os
 
-from bot import bot, dp, db_handler
+from loader import bot, dp, broadcaster, profiler, slow_updates
+from callback_router import CallbackRouter
+from callbacks import SelectCategory, CategoryPage, ChooseVideo, VideoPage, SelectVideo, CalendarMonth, SelectDay, \
+    AdminsPage
+from database_handlers.catalog_import import manifest_format, read_manifest
 from database_handlers.functions import *
 from menu_manager import *
 from models import Form
 
 from aiogram import types
 from aiogram.fsm.context import FSMContext
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters.state import State
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile, FSInputFile
 
 import datetime
 import pytz
 
 
+# Все колбэки инлайн-кнопок маршрутизируются по коду действия (см. route_callback в конце модуля)
+callback_router = CallbackRouter()
+
+
 # === CALLBACK HANDLERS ===
 
-@dp.callback_query(lambda call: call.data == 'select_user' or call.data == 'select_admin')
+@callback_router.action('select_user', 'select_admin')
 async def set_user_role(callback: aiogram.types.CallbackQuery) -> None:
     if callback.data == 'select_user':
         role = 'user'
@@ -28,32 +37,27 @@ async def set_user_role(callback: aiogram.types.CallbackQuery) -> None:
                              markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data == 'change_role')
-async def change_role(callback: aiogram.types.CallbackQuery) -> None:
+@callback_router.action('change_role')
+async def change_role_menu(callback: aiogram.types.CallbackQuery) -> None:
     text, keyboard = await choose_role_menu(opt='change')
     await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
                              markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data.startswith('change'))
+@callback_router.action('change_select_user', 'change_select_admin')
 async def change_role(callback: aiogram.types.CallbackQuery):
     """ Обработчик выбора роли.
 
     Позволяет установить/поменять роль пользователя.
     """
-    if 'admin' in callback.data:
-        role = 'admin'
-    elif 'user' in callback.data:
-        role = 'user'
-    else:
-        return
-    await db_handler.change_user_role(chat_id=callback.message.chat.id, new_role=role)
+    role = 'admin' if callback.data == 'change_select_admin' else 'user'
+    await change_user_role(chat_id=callback.message.chat.id, new_role=role)
     text, keyboard = await main_menu(chat_id=callback.message.chat.id)
     await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
                              markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data == 'main_menu')
+@callback_router.action('main_menu')
 async def main_menu_callback(callback: aiogram.types.CallbackQuery):
     """ Обработчик кнопки "Главное меню".
 
@@ -65,83 +69,95 @@ async def main_menu_callback(callback: aiogram.types.CallbackQuery):
                              markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data == 'watch_video')
+@callback_router.action('watch_video')
 async def watch_video_callback(callback: aiogram.types.CallbackQuery):
     """ Обработчик кнопки "Смотреть видео".
 
     После нажатия на кнопку "Смотреть видео" текущее сообщение заменяется на новое, с текстом "Выберите категорию"
     и списком кнопок, каждая из которых - категория. Список категорий берется из базы, из таблицы "categories".
     """
-    subjects = await get_subjects()
-    keyboard = await categories_menu(subjects)
+    subjects, has_prev, has_next = await get_subjects_page(limit=CATEGORIES_PAGE_SIZE)
+    keyboard = await categories_menu(subjects, has_prev, has_next)
     text = 'Выберите категорию:'
     await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
                              markup=keyboard)
 
 
-@dp.callback_query(lambda call: call.data.startswith('select_category'))
-async def select_category_callback(callback: aiogram.types.CallbackQuery):
+@callback_router.action(CategoryPage)
+async def change_category_page(callback: aiogram.types.CallbackQuery, callback_data: CategoryPage):
+    """ Обрабатывает кнопки Далее и Назад в выборе категории
+    """
+    if callback_data.forward:
+        subjects, has_prev, has_next = await get_subjects_page(after_id=callback_data.cursor,
+                                                               limit=CATEGORIES_PAGE_SIZE)
+    else:
+        subjects, has_prev, has_next = await get_subjects_page(before_id=callback_data.cursor,
+                                                               limit=CATEGORIES_PAGE_SIZE)
+    keyboard = await categories_menu(subjects, has_prev, has_next)
+    await bot.edit_message_reply_markup(callback.message.chat.id, callback.message.message_id, reply_markup=keyboard)
+
+
+@callback_router.action(SelectCategory)
+async def select_category_callback(callback: aiogram.types.CallbackQuery, callback_data: SelectCategory):
     """ Обработчик выбора категорий.
 
     После выбора категории подгружается список видео, которые соответствуют этой категории
     и отправляется первое видео с прикрепленным инлайн-меню.
     """
-    subject_id = int(callback.data.strip("_")[-1])
+    subject_id = callback_data.subject_id
     videos = await get_videos_by_subject(subject_id=subject_id)
-    # TODO: Реализовать механизм переключения видео
-    keyboard = await under_video_menu(videos=videos, category_id=subject_id)
-    # Удаляет меню с выбором категории
-    await bot.delete_message(chat_id=callback.message.chat.id, message_id=callback.message.message_id)
-    # Отправляет первое видео из категории с новым меню
-    await bot.send_video(chat_id=callback.message.chat.id, video=videos[0]['file_id'], reply_markup=keyboard)
+    keyboard = await under_video_menu(videos=videos, category_id=subject_id, page_size=VIDEOS_PAGE_SIZE)
+    # Меню категорий - текстовое сообщение, поэтому видео отправляется новым сообщением вместо меню
+    await change_video_message(callback.message, videos[0]['file_id'], keyboard)
 
 
-@dp.callback_query(lambda call: call.data.startswith('choose_video'))
-async def choose_video_callback(callback: aiogram.types.CallbackQuery):
+@callback_router.action(ChooseVideo)
+async def choose_video_callback(callback: aiogram.types.CallbackQuery, callback_data: ChooseVideo):
     """Обрабатывает нажатие кнопки "Выбрать видео"
 
-    После нажатия на кнопку "Выбрать видео" текущее сообщение удаляется и отправляется новое,
-    состоящее из матрицы кнопок, текстом которых является название видео и при нажатии на них
-    текущее сообщение удаляется и отправляется новое, состоящее из выбранного видео и инлайн-меню
+    После нажатия на кнопку "Выбрать видео" меню под видео заменяется матрицей кнопок, текстом которых является
+    название видео. При нажатии на них видео в этом же сообщении заменяется выбранным (см. select_video).
     """
-    subject_id = int(callback.data.strip("_")[-1])
-    videos = await get_videos_by_subject(subject_id=subject_id)
-    keyboard = await choose_video_menu(subject_id, videos)
-    # Удаляет предыдущее сообщение с видео
-    await bot.delete_message(chat_id=callback.message.chat.id, message_id=callback.message.message_id)
-    # Отправляет новое сообщение со списком видео
-    try:
-        await bot.send_message(chat_id=callback.message.chat.id, text="Выберете видео:", reply_markup=keyboard)
-    except Exception as e:
-        logging.error(e)
+    subject_id = callback_data.subject_id
+    videos, has_prev, has_next = await get_videos_page_by_subject(subject_id=subject_id,
+                                                                  after_id=callback_data.after_id,
+                                                                  limit=VIDEOS_PAGE_SIZE)
+    keyboard = await choose_video_menu(subject_id, videos, has_prev, has_next, after_id=callback_data.after_id)
+    await change_video_list_menu(callback.message, "Выберете видео:", keyboard)
 
 
-@dp.callback_query(lambda c: c.data and (c.data.startswith('next_video_page') or c.data.startswith('prev_video_page')))
-async def change_video_page(call: aiogram.types.CallbackQuery):
+@callback_router.action(VideoPage)
+async def change_video_page(call: aiogram.types.CallbackQuery, callback_data: VideoPage):
     """ Обрабатывает кнопки Далее и Назад в выборе видео
     """
-    call_parts = call.data.split('_')
-    direction = call_parts[0]
-    subject_id = int(call_parts[-2])
-    page_index = int(call_parts[-1])
-    videos = await get_videos_by_subject(subject_id=subject_id)
-    if direction == 'next':
-        page_index += 1
-    elif direction == 'prev':
-        page_index -= 1
-    keyboard = await choose_video_menu(subject_id, videos, page_index)
+    subject_id = callback_data.subject_id
+    if callback_data.forward:
+        videos, has_prev, has_next = await get_videos_page_by_subject(subject_id=subject_id,
+                                                                      after_id=callback_data.cursor,
+                                                                      limit=VIDEOS_PAGE_SIZE)
+        keyboard = await choose_video_menu(subject_id, videos, has_prev, has_next, after_id=callback_data.cursor)
+    else:
+        videos, has_prev, has_next = await get_videos_page_by_subject(subject_id=subject_id,
+                                                                      before_id=callback_data.cursor,
+                                                                      limit=VIDEOS_PAGE_SIZE)
+        keyboard = await choose_video_menu(subject_id, videos, has_prev, has_next)
     await bot.edit_message_reply_markup(call.message.chat.id, call.message.message_id, reply_markup=keyboard)
 
 
-@dp.callback_query(lambda c: c.data and c.data.startswith('select_video'))
-async def select_video(callback: aiogram.types.CallbackQuery):
-    video_id = int(callback.data.split('_')[-1])
-    video = await get_video(video_id)
-    keyboard = await under_video_menu([video], category_id=await get_subject_id_by_video_id(video_id))
-    await bot.delete_message(chat_id=callback.message.chat.id, message_id=callback.message.message_id)
-    # Отправляет первое видео из категории с новым меню
-    logging.info(video)
-    await bot.send_video(chat_id=callback.message.chat.id, video=video['file_id'], reply_markup=keyboard)
+@callback_router.action(SelectVideo)
+async def select_video(callback: aiogram.types.CallbackQuery, callback_data: SelectVideo):
+    """ Обрабатывает выбор видео из списка и кнопки предыдущего и следующего видео.
+
+    Видео и его соседи берутся из закэшированного списка видео предмета, а видео и меню в сообщении
+    заменяются одним запросом. Запрос конкретного видео нужен, только если каталог успел измениться.
+    """
+    videos = await get_videos_by_subject(subject_id=callback_data.subject_id)
+    index = next((i for i, v in enumerate(videos) if v['id'] == callback_data.video_id), None)
+    if index is None:
+        videos, index = [await get_video(callback_data.video_id)], 0
+    keyboard = await under_video_menu(videos, video_index=index, category_id=callback_data.subject_id,
+                                      page_after_id=callback_data.page_after_id, page_size=VIDEOS_PAGE_SIZE)
+    await change_video_message(callback.message, videos[index]['file_id'], keyboard)
 
 
 # === ADMIN MENU ===
@@ -152,7 +168,7 @@ reminder_callback_confirm = 'admin_confirm_reminder'
 
 
 # Обработчик кнопки "Установить напоминание"
-@dp.callback_query(lambda c: c.data == "admin_set_reminder")
+@callback_router.action(reminder_callback_set)
 async def set_reminder_handler(callback_query: types.CallbackQuery, state: FSMContext):
     await bot.answer_callback_query(callback_query.id)
     await bot.send_message(callback_query.from_user.id, 'Введите ник пользователя:', reply_markup=await create_cancel_button())
@@ -178,10 +194,9 @@ async def process_user_input(message: types.Message, state: FSMContext):
         await state.set_state(Form.date_input.state)
 
 
-@dp.callback_query(Form.date_input, lambda call: call.data.startswith('select-day_'))
-async def process_date_input(call: types.CallbackQuery, state: FSMContext):
-    date_str = call.data[len('select-day_'):]
-    date = datetime.datetime.strptime(date_str, '%d-%m-%Y').date()
+@callback_router.action(SelectDay, state=Form.date_input)
+async def process_date_input(call: types.CallbackQuery, callback_data: SelectDay, state: FSMContext):
+    date = datetime.date(callback_data.year, callback_data.month, callback_data.day)
     await state.update_data(date=date)
     await bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id, text='Введите время в формате ЧЧ:ММ:', reply_markup=await create_cancel_button())
     await state.set_state(Form.time_input.state)
@@ -217,7 +232,7 @@ async def process_text_input(message: types.Message, state: FSMContext):
 
 
 # Обработчик кнопки "Установить"
-@dp.callback_query(Form.finish_reminder, lambda c: c.data == reminder_callback_confirm)
+@callback_router.action(reminder_callback_confirm, state=Form.finish_reminder)
 async def confirm_reminder_handler(callback_query: types.CallbackQuery, state: FSMContext):
     await bot.answer_callback_query(callback_query.id)
     data = await state.get_data()
@@ -229,7 +244,7 @@ async def confirm_reminder_handler(callback_query: types.CallbackQuery, state: F
     await state.clear()
 
 
-@dp.callback_query(lambda c: c.data == 'cancel_reminder', State('*'))
+@callback_router.action('cancel_reminder')
 async def cancel_reminder_handler(callback_query: types.CallbackQuery, state: FSMContext):
     current_state = await state.get_state()
     if current_state is not None:
@@ -238,65 +253,221 @@ async def cancel_reminder_handler(callback_query: types.CallbackQuery, state: FS
         await bot.send_message(callback_query.from_user.id, 'Установка напоминания отменена.')
 
 
-@dp.callback_query(lambda call: call.data.startswith('admin'))
-async def admin_callback(callback: aiogram.types.CallbackQuery):
+@callback_router.action('admin_menu')
+async def admin_menu_callback(callback: aiogram.types.CallbackQuery):
+    """ Обработчик нажатия на кнопку "Админ панель".
+
+    После нажатия на кнопку "Админ панель" отправляется сообщение с админ меню.
+    """
     # TODO: Добавить больше функционала в админ-панель
-    if callback.data == 'admin_menu':
-        """ Обработчик нажатия на кнопку "Админ панель".
-
-        После нажатия на кнопку "Админ панель" отправляется сообщение с админ меню.
-        """
-        text, keyboard = await admin_menu()
-        await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
-                                 markup=keyboard)
-    elif callback.data == 'admin_get_users':
-        """ Обработчик нажатия кнопки "Статистика пользователей".
-
-        Выводит статистику по пользователям из БД.
-        """
-        total_users, admin_users_count, admin_usernames, user_users_count = await get_users_count()
-        text = f"""
-        Общее кол-во пользователей: {total_users}
-        Кол-во обычных пользователей: {user_users_count}
-        Кол-во админов: {admin_users_count}
-        """
-        text_admins = "Админы:\n"
-        for admin in admin_usernames:
-            text_admins += '@' + admin + '\n'
-        await bot.delete_message(chat_id=callback.message.chat.id, message_id=callback.message.message_id)
-        await bot.send_message(chat_id=callback.message.chat.id, text=text)
-        await bot.send_message(chat_id=callback.message.chat.id, text=text_admins)
-        text, keyboard = await admin_menu()
-        await bot.send_message(chat_id=callback.message.chat.id, text=text, reply_markup=keyboard)
+    text, keyboard = await admin_menu()
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
+                             markup=keyboard)
+
+
+@callback_router.action('admin_get_users')
+async def admin_get_users_callback(callback: aiogram.types.CallbackQuery):
+    """ Обработчик нажатия кнопки "Статистика пользователей".
+
+    Выводит статистику по пользователям из БД и первую страницу списка админов.
+    """
+    admins, has_prev, has_next = await get_admins_page(limit=ADMINS_PAGE_SIZE)
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+                             text=await users_stats_text(admins),
+                             markup=await admins_menu(admins, has_prev, has_next))
+
+
+@callback_router.action(AdminsPage)
+async def change_admins_page(callback: aiogram.types.CallbackQuery, callback_data: AdminsPage):
+    """ Обрабатывает кнопки Далее и Назад в списке админов """
+    if callback_data.forward:
+        admins, has_prev, has_next = await get_admins_page(after_id=callback_data.cursor, limit=ADMINS_PAGE_SIZE)
+    else:
+        admins, has_prev, has_next = await get_admins_page(before_id=callback_data.cursor, limit=ADMINS_PAGE_SIZE)
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+                             text=await users_stats_text(admins),
+                             markup=await admins_menu(admins, has_prev, has_next))
+
+
+async def users_stats_text(admins: list) -> str:
+    """ Текст статистики пользователей со страницей списка админов """
+    total_users, admin_users_count, user_users_count = await get_users_count()
+    text = f"""
+    Общее кол-во пользователей: {total_users}
+    Кол-во обычных пользователей: {user_users_count}
+    Кол-во админов: {admin_users_count}
+
+Админы:
+"""
+    for admin in admins:
+        text += '@' + admin['username'] + '\n'
+    return text
+
+
+@callback_router.action('admin_import_catalog')
+async def admin_import_catalog_callback(callback: aiogram.types.CallbackQuery, state: FSMContext):
+    """ Обработчик нажатия кнопки "Импорт каталога".
+
+    Просит отправить файл-манифест каталога (CSV или JSON) и ждет его в состоянии Form.catalog_import.
+    """
+    await state.set_state(Form.catalog_import)
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+                             text="Отправьте файл каталога (CSV или JSON) с полями: "
+                                  "faculty, subject, teacher, name, file_id",
+                             markup=await create_admin_cancel_button())
+
+
+@callback_router.action('admin_cancel')
+async def admin_cancel_callback(callback: aiogram.types.CallbackQuery, state: FSMContext):
+    await state.clear()
+    text, keyboard = await admin_menu()
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
+                             markup=keyboard)
+
+
+@dp.message(Form.catalog_import)
+async def process_catalog_import(message: types.Message, state: FSMContext):
+    """ Импортирует присланный администратором файл каталога """
+    user = await get_user_by_chat_id(message.chat.id)
+    if user is None or user['role'] != 'admin':
+        await state.clear()
+        return
+    if message.document is None:
+        await message.answer("Отправьте файл каталога документом.", reply_markup=await create_admin_cancel_button())
+        return
+
+    await message.answer("Импорт каталога...")
+    try:
+        file = await bot.download(message.document)
+        records = read_manifest(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''),
+                                manifest_format(message.document.file_name or ''))
+        stats = await import_catalog(records)
+    except Exception as e:
+        logging.error(f"Error importing catalog from {message.document.file_name}: {e}")
+        stats = None
+    await state.clear()
+    if stats is None:
+        await message.answer("Не удалось импортировать каталог. Проверьте формат файла.")
+    else:
+        await message.answer(f"""Каталог импортирован:
+    Добавлено факультетов: {stats['faculties']}
+    Добавлено предметов: {stats['subjects']}
+    Добавлено преподавателей: {stats['teachers']}
+    Добавлено видео: {stats['videos']}
+    Обновлено видео: {stats['videos_updated']}""")
+    text, keyboard = await admin_menu()
+    await message.answer(text, reply_markup=keyboard)
+
+
+@callback_router.action('admin_broadcast')
+async def admin_broadcast_callback(callback: aiogram.types.CallbackQuery, state: FSMContext):
+    """ Обработчик нажатия кнопки "Рассылка".
+
+    Просит ввести текст рассылки и ждет его в состоянии Form.broadcast_text.
+    """
+    await state.set_state(Form.broadcast_text)
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id,
+                             text="Введите текст рассылки для всех пользователей:",
+                             markup=await create_admin_cancel_button())
+
+
+@dp.message(Form.broadcast_text)
+async def process_broadcast_text(message: types.Message, state: FSMContext):
+    """ Запускает рассылку введенного администратором текста """
+    user = await get_user_by_chat_id(message.chat.id)
+    await state.clear()
+    if user is None or user['role'] != 'admin':
+        return
+    if not message.text:
+        await message.answer("Рассылка поддерживает только текст.")
+    elif await broadcaster.start(bot, message.chat.id, message.text) is None:
+        await message.answer("Не удалось запустить рассылку.")
+    text, keyboard = await admin_menu()
+    await message.answer(text, reply_markup=keyboard)
+
+
+# Длительность профилирования, запущенного из админ-меню: в секундах и в обработанных обновлениях
+PROFILE_SECONDS = int(os.getenv('PROFILE_SECONDS', 30))
+PROFILE_UPDATES = int(os.getenv('PROFILE_UPDATES', 1000))
+# Ответ на нажатие кнопок профилирования не администратором (колбэк можно отправить и без кнопки)
+ADMIN_ONLY_TEXT = "Доступно только администраторам"
+
+
+@callback_router.action('admin_profiling')
+async def admin_profiling_callback(callback: aiogram.types.CallbackQuery):
+    """ Обработчик нажатия кнопки "Профилирование" """
+    user = await get_user_by_chat_id(callback.message.chat.id)
+    if user is None or user['role'] != 'admin':
+        await callback.answer(ADMIN_ONLY_TEXT, show_alert=True)
+        return
+    text, keyboard = await profiling_menu(profiler.running, len(slow_updates))
+    await change_inline_menu(chat_id=callback.message.chat.id, message_id=callback.message.message_id, text=text,
+                             markup=keyboard)
+
+
+@callback_router.action('admin_profile_seconds', 'admin_profile_updates')
+async def admin_profile_callback(callback: aiogram.types.CallbackQuery):
+    """ Запускает профилирование на PROFILE_SECONDS секунд или PROFILE_UPDATES обновлений.
+
+    Файл профиля отправляется администратору после остановки профилирования.
+    """
+    chat_id = callback.message.chat.id
+    user = await get_user_by_chat_id(chat_id)
+    if user is None or user['role'] != 'admin':
+        await callback.answer(ADMIN_ONLY_TEXT, show_alert=True)
+        return
+
+    async def send_profile(path: str | None) -> None:
+        if path is None:
+            await bot.send_message(chat_id, "Профиль пуст.")
+        else:
+            await bot.send_document(chat_id, FSInputFile(path), caption="Профиль (collapsed stacks)")
+
+    if callback.data == 'admin_profile_seconds':
+        started = profiler.start(seconds=PROFILE_SECONDS, on_finish=send_profile)
+        description = f"{PROFILE_SECONDS} с"
+    else:
+        started = profiler.start(updates=PROFILE_UPDATES, on_finish=send_profile)
+        description = f"{PROFILE_UPDATES} обновлений"
+    await callback.answer(f"Профилирование запущено на {description}" if started
+                          else "Профилирование уже выполняется")
+    text, keyboard = await profiling_menu(profiler.running, len(slow_updates))
+    await change_inline_menu(chat_id=chat_id, message_id=callback.message.message_id, text=text, markup=keyboard)
+
+
+@callback_router.action('admin_slow_updates')
+async def admin_slow_updates_callback(callback: aiogram.types.CallbackQuery):
+    """ Отправляет журнал медленных обновлений файлом (в нем тексты сообщений и chat_id пользователей) """
+    user = await get_user_by_chat_id(callback.message.chat.id)
+    if user is None or user['role'] != 'admin':
+        await callback.answer(ADMIN_ONLY_TEXT, show_alert=True)
+        return
+    if not len(slow_updates):
+        await callback.answer("Медленных обновлений нет")
+        return
+    await callback.answer()
+    await bot.send_document(callback.message.chat.id,
+                            BufferedInputFile(slow_updates.dump().encode(), filename='slow_updates.txt'))
 
 
 # === CALENDAR HANDLERS ===
 
-@dp.callback_query(lambda call: 'prev-month' in call.data)
-async def previous_month(call: types.CallbackQuery):
-    splitted_callback_data = call.data.split("_")
-    year = int(splitted_callback_data[1])
-    month = int(splitted_callback_data[2])
-    month -= 1
-    if month < 1:
-        month = 12
-        year -= 1
-    new_calendar = await create_calendar(month, year)
+@callback_router.action(CalendarMonth)
+async def change_month(call: types.CallbackQuery, callback_data: CalendarMonth):
+    new_calendar = await create_calendar(callback_data.month, callback_data.year)
     await bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id, text="Выберите дату:", reply_markup=new_calendar)
 
-@dp.callback_query(lambda call: 'next-month' in call.data)
-async def next_month(call: types.CallbackQuery):
-    splitted_callback_data = call.data.split("_")
-    year = int(splitted_callback_data[1])
-    month = int(splitted_callback_data[2])
-    month += 1
-    if month > 12:
-        month = 1
-        year += 1
-    new_calendar = await create_calendar(month, year)
-    await bot.edit_message_text(chat_id=call.message.chat.id, message_id=call.message.message_id, text="Выберите дату:", reply_markup=new_calendar)
 
-# === DEBUG ===
-# @dp.callback_query()
-# async def log_chat(callback):
-#     logging.info(callback)
+@callback_router.action('ignore')
+async def ignore_callback(callback: types.CallbackQuery):
+    """ Кнопки-заглушки (заголовки календаря, название видео) """
+    await callback.answer()
+
+
+# === CALLBACK ROUTING ===
+
+@dp.callback_query()
+async def route_callback(callback: types.CallbackQuery, state: FSMContext):
+    """ Единственный обработчик колбэков в диспетчере: передает колбэк обработчику по коду действия """
+    if not await callback_router.dispatch(callback, state):
+        await callback.answer()
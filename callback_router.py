@@ -0,0 +1,89 @@
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from aiogram import types
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+
+from metrics import set_handler_name
+
+
+class _Route(NamedTuple):
+    handler: Callable[..., Awaitable[Any]]
+    # Класс данных колбэка или None для кнопок без параметров
+    payload_class: type[CallbackData] | None
+    # Состояние FSM, в котором должен находиться пользователь, или None - в любом состоянии
+    state: str | None
+    wants_callback_data: bool
+    wants_state: bool
+
+
+class CallbackRouter:
+    """Маршрутизатор колбэков инлайн-кнопок.
+
+    Вместо цепочки фильтров, которые aiogram проверяет по очереди на каждое нажатие, обработчик находится
+    одним поиском в словаре по коду действия - части callback_data до первого ':'.
+    Поля колбэка разбираются в объект соответствующего класса CallbackData и передаются обработчику
+    в аргументе callback_data, а FSMContext - в аргументе state (если обработчик их принимает).
+    """
+
+    def __init__(self):
+        self._routes: dict[str, _Route] = {}
+
+    def action(self, *actions: str | type[CallbackData], state: State = None):
+        """Регистрирует обработчик для одного или нескольких кодов действий.
+
+        :param actions: Строковые коды кнопок без параметров или классы CallbackData.
+        :param state: Состояние FSM, в котором обработчик должен срабатывать.
+        """
+        def decorator(handler):
+            parameters = inspect.signature(handler).parameters
+            for action in actions:
+                if isinstance(action, str):
+                    code, payload_class = action, None
+                else:
+                    code, payload_class = action.__prefix__, action
+                if code in self._routes:
+                    raise ValueError(f"Callback action {code!r} is already registered")
+                self._routes[code] = _Route(handler, payload_class, state.state if state is not None else None,
+                                            'callback_data' in parameters, 'state' in parameters)
+            return handler
+        return decorator
+
+    def resolve(self, data: str) -> tuple[_Route, CallbackData | None] | None:
+        """Находит обработчик и разбирает данные колбэка.
+
+        :return: Кортеж (маршрут, данные колбэка) или None, если колбэк неизвестен или поврежден.
+        """
+        route = self._routes.get(data.partition(':')[0])
+        if route is None:
+            return None
+        if route.payload_class is None:
+            return route, None
+        try:
+            return route, route.payload_class.unpack(data)
+        except (TypeError, ValueError):
+            return None
+
+    async def dispatch(self, callback: types.CallbackQuery, state: FSMContext) -> bool:
+        """Вызывает обработчик колбэка.
+
+        :return: True - если колбэк был обработан.
+        """
+        resolved = self.resolve(callback.data or '')
+        if resolved is None:
+            logging.warning(f"Unknown callback data: {callback.data}")
+            return False
+        route, payload = resolved
+        if route.state is not None and await state.get_state() != route.state:
+            return False
+        set_handler_name(route.handler.__name__)
+        kwargs = {}
+        if route.wants_callback_data:
+            kwargs['callback_data'] = payload
+        if route.wants_state:
+            kwargs['state'] = state
+        await route.handler(callback, **kwargs)
+        return True
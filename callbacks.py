@@ -0,0 +1,64 @@
+"""Типизированные данные колбэков инлайн-кнопок.
+
+Каждый класс упаковывается в строку вида "<код действия>:<поле>:<поле>...", где код действия - prefix класса.
+По коду действия CallbackRouter находит обработчик, а поля разбираются обратно в типизированный объект.
+Кнопки без параметров используют простые строковые коды (например, 'main_menu').
+Классы, наследуемые от PackedCallbackData, упаковывают поля в двоичном виде (см. callback_codec).
+"""
+from aiogram.filters.callback_data import CallbackData
+
+from callback_codec import PackedCallbackData
+
+
+class SelectCategory(CallbackData, prefix='sc'):
+    """ Выбор категории (предмета) """
+    subject_id: int
+
+
+class CategoryPage(CallbackData, prefix='cp'):
+    """ Переключение страницы категорий: forward - страница после cursor, иначе - перед cursor """
+    cursor: int
+    forward: bool
+
+
+class ChooseVideo(CallbackData, prefix='cv'):
+    """ Переход к списку видео предмета: after_id - курсор страницы списка, на которую нужно вернуться """
+    subject_id: int
+    after_id: int = 0
+
+
+class VideoPage(CallbackData, prefix='vp'):
+    """ Переключение страницы списка видео: forward - страница после cursor, иначе - перед cursor """
+    subject_id: int
+    cursor: int
+    forward: bool
+
+
+class SelectVideo(PackedCallbackData, prefix='sv'):
+    """Выбор видео из списка.
+
+    Кроме ID видео несет предмет и курсор страницы списка, с которой видео выбрано: по ним видео находится
+    в уже закэшированной странице, а кнопка "Выбрать видео" возвращает на ту же страницу.
+    """
+    video_id: int
+    subject_id: int
+    page_after_id: int
+
+
+class CalendarMonth(CallbackData, prefix='cm'):
+    """ Переключение календаря на указанный месяц """
+    year: int
+    month: int
+
+
+class SelectDay(CallbackData, prefix='sd'):
+    """ Выбор дня в календаре """
+    year: int
+    month: int
+    day: int
+
+
+class AdminsPage(CallbackData, prefix='ap'):
+    """ Переключение страницы списка администраторов: forward - страница после cursor, иначе - перед cursor """
+    cursor: int
+    forward: bool
@@ -0,0 +1 @@
+# Корень репозитория с модулями бота добавляется в sys.path при сборе тестов pytest
@@ -1,6 +1,15 @@
 from abc import ABC, abstractmethod
 
 
+def keyset_page(records: list, limit: int, reverse: bool) -> tuple[list, bool]:
+    """ Отрезает лишнюю запись keyset-выборки и возвращает записи в порядке возрастания id """
+    has_more = len(records) > limit
+    records = records[:limit]
+    if reverse:
+        records.reverse()
+    return records, has_more
+
+
 class BaseDatabaseHandler(ABC):
     def __init__(self):
         self._table = None
@@ -77,12 +86,38 @@ class BaseDatabaseHandler(ABC):
 
     @abstractmethod
     async def get_users_info(self):
-        """Возвращает список с данными о пользователях
+        """Возвращает данные о кол-ве пользователей
 
         Такие данные:
-            - Общее кол-во пользователей
-            - Администраторы
-            - Кол-во обычных пользователей
+            - Общее кол-во пользователей (total_users)
+            - Кол-во администраторов (admin_users_count)
+            - Кол-во обычных пользователей (user_users_count)
         :return:
         """
+        pass
+
+    @abstractmethod
+    async def get_users_by_role_page(self, role: str, after_id: int = 0, before_id: int = None,
+                                     limit: int = 20) -> tuple[list, bool] | None:
+        """Возвращает страницу пользователей с указанной ролью, упорядоченных по id.
+
+        Возвращает кортеж (записи, есть ли еще записи в направлении выборки).
+        :param role: Роль пользователей (admin | user).
+        :param after_id: ID пользователя, после которого начинается страница.
+        :param before_id: ID пользователя, перед которым заканчивается страница (для перехода назад).
+        :param limit: Кол-во пользователей на странице.
+        """
+        pass
+
+    @abstractmethod
+    async def get_admins_page(self, after_id: int = 0, before_id: int = None,
+                              limit: int = 20) -> tuple[list, bool] | None:
+        """Возвращает страницу администраторов, упорядоченных по id.
+
+        То же, что get_users_by_role_page('admin', ...), но условие на роль записано в запросе константой,
+        поэтому план подготовленного запроса использует частичный индекс администраторов.
+        :param after_id: ID пользователя, после которого начинается страница.
+        :param before_id: ID пользователя, перед которым заканчивается страница (для перехода назад).
+        :param limit: Кол-во администраторов на странице.
+        """
         pass
\ No newline at end of file
@@ -0,0 +1,113 @@
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class AsyncTTLCache:
+    """Кэш с ограниченным временем жизни записей (TTL) и вытеснением давно неиспользуемых записей (LRU).
+
+    Одновременные промахи по одному ключу объединяются (single-flight): загрузка выполняется один раз,
+    а остальные запросы ждут ее результата.
+    Значения отдаются без копирования, поэтому изменять их нельзя.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600):
+        """
+        :param maxsize: Максимальное кол-во записей в кэше.
+        :param ttl: Время жизни записи в секундах.
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        # Ключ -> (время истечения, значение)
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        # Ключ -> задача загрузки значения
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # Увеличивается при каждой инвалидации, чтобы не сохранять результаты загрузок, начатых до нее
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """ Возвращает значение из кэша без загрузки или default, если значения нет """
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """ Сохраняет значение в кэш, вытесняя самую давно использованную запись при переполнении """
+        self._data[key] = (time.monotonic() + self._ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Возвращает значение из кэша, а при промахе - загружает его с помощью loader.
+
+        :param key: Ключ записи.
+        :param loader: Функция без аргументов, возвращающая корутину загрузки значения.
+        """
+        entry = self._data.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._data[key]
+
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._inflight[key] = task
+        # shield - отмена одного из ожидающих не должна отменять загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generation
+        try:
+            value = await loader()
+        finally:
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+        if generation == self._generation:
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key: Hashable = None) -> None:
+        """Удаляет запись из кэша.
+
+        :param key: Ключ записи. Если не указан - кэш очищается полностью.
+        """
+        if key is None:
+            self._data.clear()
+            self._inflight.clear()
+        else:
+            self._data.pop(key, None)
+            self._inflight.pop(key, None)
+        self._generation += 1
+
+
+def cached(cache: AsyncTTLCache):
+    """Декоратор, кэширующий результаты асинхронной функции в указанном кэше.
+
+    Ключом служат имя функции и ее аргументы (позиционные и именованные аргументы приводятся к одному виду).
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__name__, tuple(bound.arguments.items()))
+            return await cache.get_or_load(key, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,83 @@
+"""Массовый импорт каталога видео из файла-манифеста.
+
+Манифест - CSV с заголовком или JSON-список объектов с полями:
+    faculty  - название факультета;
+    subject  - название предмета;
+    teacher  - имя преподавателя;
+    name     - название видео;
+    file_id  - ID файла видео в Telegram.
+Факультеты, предметы и преподаватели находятся по названиям и создаются, если их нет;
+видео с уже известным file_id обновляются, остальные - добавляются (см. PostgresqlVideoHandler.import_catalog).
+
+Запуск из корня репозитория (нужен POSTGRES_CONNECTION_STRING в окружении или .env):
+    python -m database_handlers.catalog_import semester.csv
+Импорт увеличивает версию каталога в БД, и все процессы запущенного бота сбрасывают свои кэши каталога
+в течение CATALOG_VERSION_INTERVAL (см. database_handlers.functions.watch_catalog_version).
+"""
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from typing import IO, Iterator
+
+MANIFEST_COLUMNS = ('faculty', 'subject', 'teacher', 'name', 'file_id')
+
+
+def read_manifest(file: IO[str], fmt: str) -> Iterator[tuple]:
+    """Читает манифест и возвращает записи в порядке MANIFEST_COLUMNS.
+
+    CSV читается построчно, поэтому большой файл не загружается в память целиком.
+    :param file: Текстовый файл манифеста.
+    :param fmt: Формат манифеста: 'csv' или 'json'.
+    """
+    if fmt == 'csv':
+        rows = csv.DictReader(file)
+    elif fmt == 'json':
+        rows = json.load(file)
+        if not isinstance(rows, list):
+            raise ValueError("JSON manifest must be a list of objects")
+    else:
+        raise ValueError(f"Unknown manifest format: {fmt}")
+
+    for number, row in enumerate(rows, start=1):
+        try:
+            record = tuple(str(row[column]).strip() for column in MANIFEST_COLUMNS)
+        except (KeyError, TypeError):
+            raise ValueError(f"Manifest row {number} must have fields: {', '.join(MANIFEST_COLUMNS)}")
+        if not all(record):
+            raise ValueError(f"Manifest row {number} has empty fields")
+        yield record
+
+
+def manifest_format(filename: str) -> str:
+    """ Определяет формат манифеста по расширению файла """
+    return 'json' if filename.lower().endswith('.json') else 'csv'
+
+
+async def _main(path: str) -> None:
+    import dotenv
+    from .postgresql_handler import ParentPostgresqlHandler, PostgresqlVideoHandler
+
+    dotenv.load_dotenv()
+    await ParentPostgresqlHandler.open_connection(os.getenv('POSTGRES_CONNECTION_STRING'), min_size=1, max_size=1)
+    try:
+        start = time.perf_counter()
+        with open(path, encoding='utf-8-sig', newline='') as file:
+            stats = await PostgresqlVideoHandler().import_catalog(read_manifest(file, manifest_format(path)))
+        if stats is None:
+            print("Import failed, see log for details")
+        else:
+            print(f"Imported in {time.perf_counter() - start:.1f} s: {stats}")
+    finally:
+        await ParentPostgresqlHandler.close_connection()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 2:
+        print(__doc__)
+        sys.exit(1)
+    asyncio.run(_main(sys.argv[1]))
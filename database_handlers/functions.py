@@ -1,9 +1,22 @@
+import asyncio
+import logging
 from datetime import datetime
 from typing import Set, Dict, Any, List
 
 import aiogram
 
-from bot import db_handler, db_video_handler, db_reminder_handler
+from loader import db_handler, db_video_handler, db_reminder_handler, reminder_scheduler, user_cache
+from .cache import AsyncTTLCache, cached
+from .user_cache import MISSING
+
+# Кэш каталога видео. Каталог меняется редко, поэтому записи живут 10 минут.
+# Кэш свой в каждом процессе: процесс, выполнивший импорт, сбрасывает его сразу (invalidate_catalog_cache),
+# а остальные процессы - в течение CATALOG_VERSION_INTERVAL, заметив новую версию каталога в БД
+catalog_cache = AsyncTTLCache(maxsize=1024, ttl=600)
+# Период проверки версии каталога в БД (в секундах)
+CATALOG_VERSION_INTERVAL = 5
+# Задача, следящая за версией каталога (ссылка хранится, чтобы задачу не удалил сборщик мусора)
+_catalog_version_task: asyncio.Task | None = None
 
 
 # === USER FUNCTIONS ===
@@ -17,26 +30,75 @@ async def write_user_in_db(callback: aiogram.types.CallbackQuery, role: str) ->
     chat_id = callback.message.chat.id
     username = callback.from_user.username
     firstname = callback.from_user.first_name
-    await db_handler.insert_user(chat_id=chat_id, username=username, first_name=firstname, role=role)
+    user = await db_handler.insert_user(chat_id=chat_id, username=username, first_name=firstname, role=role)
+    if user:
+        user_cache.put(dict(user))
+    else:
+        user_cache.invalidate(chat_id)
+
+
+async def activate_user(chat_id: int) -> None:
+    """Снова включает пользователя в рассылки, если он был помечен неактивным.
+
+    Состояние берется из кэша (при промахе - читается из БД), изменяющий запрос выполняется только для неактивных.
+    Рассылка в этом процессе удаляет заблокировавших бота из кэша, а блокировка, отмеченная рассылкой
+    в другом процессе, станет видна после истечения срока записи кэша.
+    :param chat_id: ID чата пользователя.
+    """
+    user = await get_user_by_chat_id(chat_id)
+    if user is None or user.get('is_active', True):
+        return
+    user = await db_handler.activate_user(chat_id=chat_id)
+    if user:
+        user_cache.put(dict(user))
 
 
-async def get_user_by_chat_id(chat_id: int) -> list | None:
+async def change_user_role(chat_id: int, new_role: str) -> None:
+    """Меняет роль пользователя.
+
+    :param chat_id: ID чата пользователя.
+    :param new_role: Новая роль пользователя.
+    """
+    user = await db_handler.change_user_role(chat_id=chat_id, new_role=new_role)
+    if user:
+        user_cache.put(dict(user))
+    else:
+        user_cache.invalidate(chat_id)
+
+
+async def get_user_by_chat_id(chat_id: int) -> dict | None:
     """Возвращает данные пользователя или None
 
     :param chat_id: id чата с пользователем
-    :return: данные пользователя типа list или None - если не найден
+    :return: данные пользователя типа dict или None - если не найден
     """
-    result = await db_handler.get_user_by_id(chat_id=chat_id)
-    return result
+    user = user_cache.get(chat_id)
+    if user is MISSING:
+        result = await db_handler.get_user_by_id(chat_id=chat_id)
+        if result:
+            user = dict(result)
+            user_cache.put(user)
+        else:
+            user = None
+            user_cache.put_missing(chat_id=chat_id)
+    return user
 
 
 async def get_user_by_username(username: str) -> dict | None:
     """Возвращает данные пользователя или None.
 
     :param username: Username пользователя.
-    :return: Данные пользователя типа tuple или None - если не найден
+    :return: Данные пользователя типа dict или None - если не найден
     """
-    user = await db_handler.get_user_by_username(username=username)
+    user = user_cache.get_by_username(username)
+    if user is MISSING:
+        result = await db_handler.get_user_by_username(username=username)
+        if result:
+            user = dict(result)
+            user_cache.put(user)
+        else:
+            user = None
+            user_cache.put_missing(username=username)
     if user:
         return {'id': user['id'], 'username': user['username'], 'chat_id': user['chat_id']}
     return None
@@ -49,10 +111,11 @@ async def is_user_in_db(chat_id=None, username=None) -> bool:
     :param username: Username пользователя.
     :return: True или False в зависимости от результата.
     """
+    user = None
     if chat_id:
-        user = await db_handler.get_user_by_id(chat_id)
+        user = await get_user_by_chat_id(chat_id)
     elif username:
-        user = await db_handler.get_user_by_username(username)
+        user = await get_user_by_username(username)
     if user:
         return True
     return False
@@ -61,22 +124,82 @@ async def is_user_in_db(chat_id=None, username=None) -> bool:
 async def get_users_count() -> tuple:
     """Возвращает данные о количестве пользователей.
 
-
-    :return:
+    Кол-во берется из счетчиков по ролям и не зависит от размера таблицы пользователей.
+    :return: кортеж (всего пользователей, кол-во админов, кол-во обычных пользователей)
     """
-    # TODO: Сделать запрос кол-ва пользователей
     info = await db_handler.get_users_info()
-    total_users = info['total_users']
-    admin_users_count = info['admin_users_count']
-    user_users_count = info['user_users_count']
+    if info is None:
+        return 0, 0, 0
+    return info['total_users'], info['admin_users_count'], info['user_users_count']
 
-    admin_users_data = info['admin_users_data']
-    admin_usernames = [record['username'] for record in admin_users_data]
-    return total_users, admin_users_count, admin_usernames, user_users_count
+
+async def get_admins_page(after_id: int = 0, before_id: int = None,
+                          limit: int = 20) -> tuple[List[dict[str, Any]], bool, bool]:
+    """Возвращает страницу администраторов.
+
+    Возвращает кортеж (список словарей администраторов, есть ли предыдущая страница, есть ли следующая страница).
+    Словарь имеет следующий вид: {'id': ID пользователя, 'username': Username, 'chat_id': ID чата}.
+    :param after_id: ID пользователя, после которого начинается страница.
+    :param before_id: ID пользователя, перед которым заканчивается страница (для перехода назад).
+    :param limit: Кол-во администраторов на странице.
+    """
+    page = await db_handler.get_admins_page(after_id=after_id, before_id=before_id, limit=limit)
+    if page is None:
+        return [], False, False
+    admins, has_more = page
+    if before_id is not None and not admins:
+        # Предыдущих администраторов не осталось - возвращаем первую страницу
+        return await get_admins_page(limit=limit)
+    has_prev, has_next = (has_more, True) if before_id is not None else (after_id > 0, has_more)
+    return ([{'id': admin['id'], 'username': admin['username'], 'chat_id': admin['chat_id']} for admin in admins],
+            has_prev, has_next)
 
 
 # === VIDEO FUNCTIONS ===
 
+def invalidate_catalog_cache() -> None:
+    """ Сбрасывает кэш каталога. Вызывается после любых изменений факультетов, предметов, преподавателей или видео """
+    catalog_cache.invalidate()
+
+
+async def watch_catalog_version() -> None:
+    """Запускает фоновую проверку версии каталога.
+
+    Каждый импорт каталога (из бота любого процесса или из CLI) увеличивает версию в БД.
+    Когда версия меняется, кэш каталога этого процесса сбрасывается.
+    """
+    global _catalog_version_task
+    if _catalog_version_task is None:
+        version = await db_video_handler.get_catalog_version()
+        _catalog_version_task = asyncio.create_task(_watch_catalog_version(version))
+
+
+async def _watch_catalog_version(version: int | None) -> None:
+    while True:
+        await asyncio.sleep(CATALOG_VERSION_INTERVAL)
+        current = await db_video_handler.get_catalog_version()
+        if current is None or current == version:
+            continue
+        if version is not None:
+            logging.info(f"Catalog version changed to {current}, resetting catalog cache")
+            invalidate_catalog_cache()
+        version = current
+
+
+async def import_catalog(records) -> dict[str, int] | None:
+    """ Импортирует каталог видео из записей манифеста и сбрасывает кэш каталога.
+
+    Импорт увеличивает версию каталога в БД, поэтому кэши остальных процессов сбрасывает watch_catalog_version.
+    Возвращает кол-во добавленных и обновленных записей по таблицам или None, если импорт не удался.
+    :param records: Записи манифеста (см. database_handlers.catalog_import.read_manifest).
+    """
+    stats = await db_video_handler.import_catalog(records)
+    if stats is not None:
+        invalidate_catalog_cache()
+    return stats
+
+
+@cached(catalog_cache)
 async def get_faculties() -> List[dict]:
     """ Возвращает список словарей факультетов.
 
@@ -86,6 +209,7 @@ async def get_faculties() -> List[dict]:
     return [{'id': faculty["id"], 'name': faculty["name"]} for faculty in faculties]
 
 
+@cached(catalog_cache)
 async def get_subjects() -> dict:
     """ Возвращает список словарей предметов кол-во видео по которым больше 0.
 
@@ -95,6 +219,29 @@ async def get_subjects() -> dict:
     return {subject["id"]: subject["name"] for subject in subjects}
 
 
+@cached(catalog_cache)
+async def get_subjects_page(after_id: int = 0, before_id: int = None, limit: int = 5) -> tuple[dict, bool, bool]:
+    """ Возвращает страницу предметов, кол-во видео по которым больше 0.
+
+    Возвращает кортеж (словарь {ID предмета: Название предмета}, есть ли предыдущая страница, есть ли следующая страница).
+    :param after_id: ID предмета, после которого начинается страница.
+    :param before_id: ID предмета, перед которым заканчивается страница (для перехода назад).
+    :param limit: Кол-во предметов на странице.
+    """
+    subjects, has_more = await db_video_handler.get_subjects_page(after_id=after_id, before_id=before_id, limit=limit)
+    if before_id is not None and not subjects:
+        # Предыдущих предметов не осталось - возвращаем первую страницу
+        return await get_subjects_page(limit=limit)
+    has_prev, has_next = (has_more, True) if before_id is not None else (after_id > 0, has_more)
+    return {subject["id"]: subject["name"] for subject in subjects}, has_prev, has_next
+
+
+async def warm_up_catalog_cache(page_size: int) -> None:
+    """ Загружает в кэш первую страницу предметов - ее запрашивает первое нажатие "Смотреть видео" после запуска """
+    await get_subjects_page(limit=page_size)
+
+
+@cached(catalog_cache)
 async def get_teachers() -> List[dict]:
     """ Возвращает список словарей преподавателей.
 
@@ -104,6 +251,7 @@ async def get_teachers() -> List[dict]:
     return [{'id': teacher["id"], 'name': teacher["name"]} for teacher in teachers]
 
 
+@cached(catalog_cache)
 async def get_videos_by_teacher(teacher_id: int) -> List[dict[str, Any]]:
     """ Возвращает список словарей видео по конкретному преподавателю.
 
@@ -114,6 +262,7 @@ async def get_videos_by_teacher(teacher_id: int) -> List[dict[str, Any]]:
     return [{'id': vid['id'], 'name': vid['name'], 'file_id': vid['telegram_file_id']} for vid in videos]
 
 
+@cached(catalog_cache)
 async def get_videos_by_subject(subject_id: int) -> List[dict[str, Any]]:
     """ Возвращает список словарей видео по предмету.
 
@@ -124,6 +273,29 @@ async def get_videos_by_subject(subject_id: int) -> List[dict[str, Any]]:
     return [{'id': vid['id'], 'name': vid['name'], 'file_id': vid['telegram_file_id']} for vid in videos]
 
 
+@cached(catalog_cache)
+async def get_videos_page_by_subject(subject_id: int, after_id: int = 0, before_id: int = None,
+                                     limit: int = 2) -> tuple[List[dict[str, Any]], bool, bool]:
+    """ Возвращает страницу видео по предмету.
+
+    Возвращает кортеж (список словарей видео, есть ли предыдущая страница, есть ли следующая страница).
+    Словарь имеет следующий вид: {'id': ID видео, 'name': Название видео, 'file_id': ID файла в телеграм}.
+    :param subject_id: ID предмета в БД.
+    :param after_id: ID видео, после которого начинается страница.
+    :param before_id: ID видео, перед которым заканчивается страница (для перехода назад).
+    :param limit: Кол-во видео на странице.
+    """
+    videos, has_more = await db_video_handler.get_videos_page_by_subject_id(subject_id=subject_id, after_id=after_id,
+                                                                            before_id=before_id, limit=limit)
+    if before_id is not None and not videos:
+        # Предыдущих видео не осталось - возвращаем первую страницу
+        return await get_videos_page_by_subject(subject_id=subject_id, limit=limit)
+    has_prev, has_next = (has_more, True) if before_id is not None else (after_id > 0, has_more)
+    return ([{'id': vid['id'], 'name': vid['name'], 'file_id': vid['telegram_file_id']} for vid in videos],
+            has_prev, has_next)
+
+
+@cached(catalog_cache)
 async def get_videos_by_faculty(faculty_id: int) -> List[dict[str, Any]]:
     """ Возвращает список словарей видео по конкретному факультету.
 
@@ -134,6 +306,7 @@ async def get_videos_by_faculty(faculty_id: int) -> List[dict[str, Any]]:
     return [{'id': vid['id'], 'name': vid['name'], 'file_id': vid['telegram_file_id']} for vid in videos]
 
 
+@cached(catalog_cache)
 async def get_video(video_id: int) -> dict[str, Any]:
     """ Возвращает словарь с данными о видео.
 
@@ -144,6 +317,7 @@ async def get_video(video_id: int) -> dict[str, Any]:
     return {'name': v['name'], 'file_id': v['telegram_file_id']}
 
 
+@cached(catalog_cache)
 async def get_subject_id_by_video_id(video_id: int) -> int:
     """ Возвращает индекс предмета.
 
@@ -157,7 +331,10 @@ async def get_subject_id_by_video_id(video_id: int) -> int:
 # === REMINDER FUNCTIONS ===
 
 async def add_reminder(user: str, date_time: datetime, text: str) -> None:
-    await db_reminder_handler.add_reminder(username=user, date_time=date_time, text=text)
+    reminder_id = await db_reminder_handler.add_reminder(username=user, date_time=date_time, text=text)
+    if reminder_id is not None:
+        # Будим планировщик, чтобы новое напоминание было отправлено вовремя
+        reminder_scheduler.push(reminder_id, date_time, user, text)
 
 
 async def delete_reminder(reminder_id: int) -> None:
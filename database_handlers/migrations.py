@@ -0,0 +1,350 @@
+"""Версионные миграции схемы базы данных.
+
+Таблицы создаются обработчиками (create_table_if_not_exist), а все последующие изменения схемы описываются
+здесь упорядоченным списком MIGRATIONS. Примененные версии записываются в таблицу schema_migrations.
+
+Миграции выполняются под advisory-блокировкой, поэтому несколько одновременно запущенных экземпляров бота
+(например, рабочие процессы workers.py) не применяют их параллельно. Индексы создаются через
+CREATE INDEX CONCURRENTLY, который не блокирует запись в таблицу, но не может выполняться в транзакции:
+миграция с такими шагами выполняется без транзакции, а версия записывается после всех шагов.
+Если построение индекса прервалось, недействительный индекс удаляется и строится заново при следующем запуске.
+
+Запуск из корня репозитория:
+    python -m database_handlers.migrations migrate  - применить миграции
+    python -m database_handlers.migrations status   - показать примененные и ожидающие миграции
+    python -m database_handlers.migrations explain  - показать планы выполнения горячих запросов
+"""
+import asyncio
+import logging
+import os
+import sys
+from typing import NamedTuple
+
+import asyncpg
+
+from .queries import registry
+
+MIGRATIONS_TABLE = 'schema_migrations'
+# Ключ advisory-блокировки миграций (произвольная константа)
+MIGRATIONS_LOCK_KEY = 7_315_204_001
+
+
+class Index(NamedTuple):
+    """ Шаг миграции: создание индекса без блокировки записи в таблицу """
+    name: str
+    table: str
+    columns: str
+    # Условие частичного индекса
+    where: str = None
+
+    def sql(self) -> str:
+        sql = f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.name} ON {self.table} ({self.columns})"
+        return f"{sql} WHERE {self.where}" if self.where else sql
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    steps: tuple
+
+    @property
+    def transactional(self) -> bool:
+        return not any(isinstance(step, Index) for step in self.steps)
+
+
+MIGRATIONS = [
+    Migration(1, 'Indexes for hot queries', (
+        # Поиск пользователя по username при создании и отправке напоминаний
+        Index('users_username_idx', 'users', 'username'),
+        # Выборка наступивших и ближайших напоминаний
+        Index('reminders_date_time_idx', 'reminders', 'date_time'),
+        # Соединения каталога: предметы факультета, преподаватели предмета, видео преподавателя по порядку id
+        Index('subjects_faculty_id_idx', 'subjects', 'faculty_id'),
+        Index('teachers_subject_id_idx', 'teachers', 'subject_id'),
+        Index('videos_teacher_id_idx', 'videos', 'teacher_id, id'),
+    )),
+    Migration(2, 'Video counters per teacher, subject and faculty', (
+        # Пока создаются триггеры и заполняются счетчики, каталог не должен меняться
+        "LOCK TABLE videos, teachers IN SHARE ROW EXCLUSIVE MODE",
+        """CREATE TABLE IF NOT EXISTS teacher_video_counts
+           (teacher_id INT PRIMARY KEY REFERENCES teachers(id) ON DELETE CASCADE,
+           video_count INT NOT NULL)""",
+        """CREATE TABLE IF NOT EXISTS subject_video_counts
+           (subject_id INT PRIMARY KEY REFERENCES subjects(id) ON DELETE CASCADE,
+           video_count INT NOT NULL)""",
+        # Счетчики факультетов вычисляются по небольшой таблице счетчиков предметов
+        """CREATE OR REPLACE VIEW faculty_video_counts AS
+           SELECT S.faculty_id, SUM(C.video_count)::INT AS video_count
+           FROM subject_video_counts C
+           JOIN subjects S ON S.id = C.subject_id
+           GROUP BY S.faculty_id""",
+        # Прибавляет к счетчикам преподавателей (и их предметов) изменения кол-ва видео
+        """CREATE OR REPLACE FUNCTION adjust_video_counts(teacher_ids INT[], deltas INT[]) RETURNS VOID AS $$
+           BEGIN
+               INSERT INTO teacher_video_counts AS C (teacher_id, video_count)
+               SELECT D.teacher_id, SUM(D.delta) FROM unnest(teacher_ids, deltas) AS D(teacher_id, delta)
+               WHERE D.teacher_id IS NOT NULL
+               GROUP BY D.teacher_id
+               ON CONFLICT (teacher_id) DO UPDATE SET video_count = C.video_count + EXCLUDED.video_count;
+
+               INSERT INTO subject_video_counts AS C (subject_id, video_count)
+               SELECT T.subject_id, SUM(D.delta) FROM unnest(teacher_ids, deltas) AS D(teacher_id, delta)
+               JOIN teachers T ON T.id = D.teacher_id
+               WHERE T.subject_id IS NOT NULL
+               GROUP BY T.subject_id
+               ON CONFLICT (subject_id) DO UPDATE SET video_count = C.video_count + EXCLUDED.video_count;
+           END
+           $$ LANGUAGE plpgsql""",
+        # Триггеры уровня оператора: массовая вставка (COPY, INSERT ... SELECT) обновляет счетчики один раз
+        """CREATE OR REPLACE FUNCTION videos_count_changed() RETURNS TRIGGER AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN
+                   PERFORM adjust_video_counts(array_agg(teacher_id), array_agg(n))
+                   FROM (SELECT teacher_id, COUNT(*)::INT AS n FROM new_videos GROUP BY teacher_id) D;
+               ELSIF TG_OP = 'DELETE' THEN
+                   PERFORM adjust_video_counts(array_agg(teacher_id), array_agg(n))
+                   FROM (SELECT teacher_id, -COUNT(*)::INT AS n FROM old_videos GROUP BY teacher_id) D;
+               ELSE
+                   PERFORM adjust_video_counts(array_agg(teacher_id), array_agg(n))
+                   FROM (SELECT teacher_id, SUM(n)::INT AS n
+                         FROM (SELECT teacher_id, COUNT(*) AS n FROM new_videos GROUP BY teacher_id
+                               UNION ALL
+                               SELECT teacher_id, -COUNT(*) FROM old_videos GROUP BY teacher_id) U
+                         GROUP BY teacher_id) D;
+               END IF;
+               RETURN NULL;
+           END
+           $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS videos_count_insert ON videos",
+        """CREATE TRIGGER videos_count_insert AFTER INSERT ON videos
+           REFERENCING NEW TABLE AS new_videos
+           FOR EACH STATEMENT EXECUTE FUNCTION videos_count_changed()""",
+        "DROP TRIGGER IF EXISTS videos_count_delete ON videos",
+        """CREATE TRIGGER videos_count_delete AFTER DELETE ON videos
+           REFERENCING OLD TABLE AS old_videos
+           FOR EACH STATEMENT EXECUTE FUNCTION videos_count_changed()""",
+        "DROP TRIGGER IF EXISTS videos_count_update ON videos",
+        """CREATE TRIGGER videos_count_update AFTER UPDATE ON videos
+           REFERENCING OLD TABLE AS old_videos NEW TABLE AS new_videos
+           FOR EACH STATEMENT EXECUTE FUNCTION videos_count_changed()""",
+        # Перенос преподавателя в другой предмет переносит его видео между счетчиками предметов
+        """CREATE OR REPLACE FUNCTION teachers_subject_changed() RETURNS TRIGGER AS $$
+           DECLARE
+               moved INT;
+           BEGIN
+               SELECT video_count INTO moved FROM teacher_video_counts WHERE teacher_id = NEW.id;
+               IF COALESCE(moved, 0) <> 0 THEN
+                   INSERT INTO subject_video_counts AS C (subject_id, video_count)
+                   SELECT subject_id, delta FROM (VALUES (OLD.subject_id, -moved), (NEW.subject_id, moved))
+                       AS D(subject_id, delta)
+                   WHERE subject_id IS NOT NULL
+                   ON CONFLICT (subject_id) DO UPDATE SET video_count = C.video_count + EXCLUDED.video_count;
+               END IF;
+               RETURN NULL;
+           END
+           $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS teachers_subject_changed ON teachers",
+        """CREATE TRIGGER teachers_subject_changed AFTER UPDATE OF subject_id ON teachers
+           FOR EACH ROW WHEN (OLD.subject_id IS DISTINCT FROM NEW.subject_id)
+           EXECUTE FUNCTION teachers_subject_changed()""",
+        # Заполнение счетчиков по существующим видео
+        """INSERT INTO teacher_video_counts (teacher_id, video_count)
+           SELECT teacher_id, COUNT(*) FROM videos WHERE teacher_id IS NOT NULL GROUP BY teacher_id
+           ON CONFLICT (teacher_id) DO UPDATE SET video_count = EXCLUDED.video_count""",
+        """INSERT INTO subject_video_counts (subject_id, video_count)
+           SELECT T.subject_id, COUNT(*) FROM videos V JOIN teachers T ON T.id = V.teacher_id
+           WHERE T.subject_id IS NOT NULL GROUP BY T.subject_id
+           ON CONFLICT (subject_id) DO UPDATE SET video_count = EXCLUDED.video_count""",
+    )),
+    Migration(3, 'Index videos by Telegram file id', (
+        # Сопоставление видео при импорте каталога
+        Index('videos_telegram_file_id_idx', 'videos', 'telegram_file_id'),
+    )),
+    Migration(4, 'User counters per role', (
+        "LOCK TABLE users IN SHARE ROW EXCLUSIVE MODE",
+        """CREATE TABLE IF NOT EXISTS users_role_counts
+           (role VARCHAR(50) PRIMARY KEY,
+           user_count INT NOT NULL)""",
+        """CREATE OR REPLACE FUNCTION users_role_count_changed() RETURNS TRIGGER AS $$
+           BEGIN
+               IF TG_OP = 'INSERT' THEN
+                   INSERT INTO users_role_counts AS C (role, user_count)
+                   SELECT role, COUNT(*) FROM new_users GROUP BY role
+                   ON CONFLICT (role) DO UPDATE SET user_count = C.user_count + EXCLUDED.user_count;
+               ELSIF TG_OP = 'DELETE' THEN
+                   INSERT INTO users_role_counts AS C (role, user_count)
+                   SELECT role, -COUNT(*) FROM old_users GROUP BY role
+                   ON CONFLICT (role) DO UPDATE SET user_count = C.user_count + EXCLUDED.user_count;
+               ELSE
+                   INSERT INTO users_role_counts AS C (role, user_count)
+                   SELECT role, SUM(n) FROM (SELECT role, COUNT(*) AS n FROM new_users GROUP BY role
+                                             UNION ALL
+                                             SELECT role, -COUNT(*) FROM old_users GROUP BY role) D
+                   GROUP BY role
+                   HAVING SUM(n) <> 0
+                   ON CONFLICT (role) DO UPDATE SET user_count = C.user_count + EXCLUDED.user_count;
+               END IF;
+               RETURN NULL;
+           END
+           $$ LANGUAGE plpgsql""",
+        "DROP TRIGGER IF EXISTS users_role_count_insert ON users",
+        """CREATE TRIGGER users_role_count_insert AFTER INSERT ON users
+           REFERENCING NEW TABLE AS new_users
+           FOR EACH STATEMENT EXECUTE FUNCTION users_role_count_changed()""",
+        "DROP TRIGGER IF EXISTS users_role_count_delete ON users",
+        """CREATE TRIGGER users_role_count_delete AFTER DELETE ON users
+           REFERENCING OLD TABLE AS old_users
+           FOR EACH STATEMENT EXECUTE FUNCTION users_role_count_changed()""",
+        "DROP TRIGGER IF EXISTS users_role_count_update ON users",
+        # Триггеры с таблицами переходов не могут ограничиваться списком столбцов - изменения других
+        # столбцов дают нулевую разницу и отбрасываются
+        """CREATE TRIGGER users_role_count_update AFTER UPDATE ON users
+           REFERENCING OLD TABLE AS old_users NEW TABLE AS new_users
+           FOR EACH STATEMENT EXECUTE FUNCTION users_role_count_changed()""",
+        """INSERT INTO users_role_counts (role, user_count)
+           SELECT role, COUNT(*) FROM users GROUP BY role
+           ON CONFLICT (role) DO UPDATE SET user_count = EXCLUDED.user_count""",
+    )),
+    Migration(5, 'Partial index of admins', (
+        # Список администраторов читается по небольшому частичному индексу, а не по всей таблице пользователей
+        Index('users_admins_idx', 'users', 'id', where="role = 'admin'"),
+    )),
+    Migration(6, 'Mark users who blocked the bot as inactive', (
+        # Пользователи, заблокировавшие бота, пропускаются рассылками
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS is_active BOOLEAN NOT NULL DEFAULT TRUE",
+    )),
+    Migration(7, 'Shared catalog version', (
+        # Версия увеличивается каждым импортом каталога, по ней все процессы бота сбрасывают свои кэши каталога
+        """CREATE TABLE IF NOT EXISTS catalog_version
+           (id INT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+           version BIGINT NOT NULL DEFAULT 0)""",
+        "INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING",
+    )),
+]
+
+# Горячие запросы реестра и примеры аргументов для EXPLAIN
+HOT_QUERIES = {
+    'users.get_by_chat_id': (0,),
+    'users.get_by_username': ('',),
+    'users.info': (),
+    'users.by_role_page_after': ('admin', 0, 21),
+    'users.admins_page_after': (0, 21),
+    'users.active_chunk': (0, 500),
+    'videos.subjects': (),
+    'videos.subjects_page_after': (0, 6),
+    'videos.by_subject': (1,),
+    'videos.by_subject_page_after': (1, 0, 3),
+    'videos.by_id': (1,),
+    'videos.catalog_version': (),
+    'reminders.upcoming': (1000,),
+    'reminders.current': (),
+    'reminders.claim_due': (100,),
+}
+
+
+async def applied_versions(conn: asyncpg.Connection) -> set[int]:
+    await conn.execute(f'''CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE}
+                           (version INT PRIMARY KEY,
+                           description TEXT NOT NULL,
+                           applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW())''')
+    return {row['version'] for row in await conn.fetch(f"SELECT version FROM {MIGRATIONS_TABLE}")}
+
+
+async def migrate(conn: asyncpg.Connection) -> list[int]:
+    """Применяет ожидающие миграции.
+
+    Соединение не должно находиться в транзакции. Возвращает список примененных версий.
+    """
+    applied = []
+    await conn.execute("SELECT pg_advisory_lock($1)", MIGRATIONS_LOCK_KEY)
+    try:
+        done = await applied_versions(conn)
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version in done:
+                continue
+            logging.info(f"Applying migration {migration.version}: {migration.description}")
+            if migration.transactional:
+                async with conn.transaction():
+                    for step in migration.steps:
+                        await conn.execute(step)
+                    await _record(conn, migration)
+            else:
+                for step in migration.steps:
+                    if isinstance(step, Index):
+                        await _drop_invalid_index(conn, step.name)
+                        await conn.execute(step.sql())
+                    else:
+                        await conn.execute(step)
+                await _record(conn, migration)
+            applied.append(migration.version)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", MIGRATIONS_LOCK_KEY)
+    return applied
+
+
+async def _record(conn: asyncpg.Connection, migration: Migration) -> None:
+    await conn.execute(f"INSERT INTO {MIGRATIONS_TABLE} (version, description) VALUES ($1, $2)",
+                       migration.version, migration.description)
+
+
+async def _drop_invalid_index(conn: asyncpg.Connection, name: str) -> None:
+    # Прерванный CREATE INDEX CONCURRENTLY оставляет недействительный индекс, который IF NOT EXISTS не перестроит
+    invalid = await conn.fetchval("""SELECT NOT I.indisvalid
+                                     FROM pg_index I
+                                     JOIN pg_class C ON C.oid = I.indexrelid
+                                     WHERE C.relname = $1 AND pg_table_is_visible(C.oid)""", name)
+    if invalid:
+        logging.warning(f"Rebuilding invalid index {name}")
+        await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+async def explain(conn: asyncpg.Connection, names=None) -> dict[str, str]:
+    """Возвращает планы выполнения (EXPLAIN без ANALYZE - запросы не выполняются) горячих запросов.
+
+    :param names: Имена запросов реестра. По умолчанию - HOT_QUERIES.
+    """
+    plans = {}
+    for name in names or HOT_QUERIES:
+        if name not in registry:
+            continue
+        try:
+            rows = await conn.fetch(f"EXPLAIN {registry[name]}", *HOT_QUERIES.get(name, ()))
+            plans[name] = '\n'.join(row[0] for row in rows)
+        except asyncpg.exceptions.PostgresError as e:
+            plans[name] = f"Error: {e}"
+    return plans
+
+
+async def _main(command: str) -> None:
+    import dotenv
+    from .postgresql_handler import PostgresqlHandler, PostgresqlVideoHandler, PostgresqlRemindersHandler
+
+    dotenv.load_dotenv()
+    # Обработчики регистрируют свои запросы в реестре при создании
+    users_handler = PostgresqlHandler()
+    await users_handler.set_table('users')
+    PostgresqlVideoHandler()
+    PostgresqlRemindersHandler()
+
+    conn = await asyncpg.connect(os.getenv('POSTGRES_CONNECTION_STRING'))
+    try:
+        if command == 'migrate':
+            applied = await migrate(conn)
+            print(f"Applied migrations: {applied}" if applied else "Database is up to date")
+        elif command == 'status':
+            done = await applied_versions(conn)
+            for migration in MIGRATIONS:
+                print(f"{'applied' if migration.version in done else 'pending':8} "
+                      f"{migration.version:4} {migration.description}")
+        elif command == 'explain':
+            for name, plan in (await explain(conn)).items():
+                print(f"=== {name}\n{plan}\n")
+        else:
+            print(__doc__)
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else 'status'))
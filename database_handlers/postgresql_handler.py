@@ -1,27 +1,135 @@
 import abc
+import contextlib
+from contextvars import ContextVar
 from datetime import datetime
 
 import asyncpg
 import asyncio
 import logging
+import time
 
-from .base_database_handler import BaseDatabaseHandler
+from metrics import observe_pool_wait
+from .base_database_handler import BaseDatabaseHandler, keyset_page
+from .queries import PreparedConnection, pool_settings_from_env, registry
+from .schema import FINGERPRINT_TABLE
 
 
 class ParentPostgresqlHandler:
     _pool = None
+    # Соединение (и задача-владелец), общее для запросов внутри блока connection()
+    _shared_connection: ContextVar = ContextVar('shared_connection', default=None)
 
     # def __init__(self):
     #     self._pool = None
 
     @classmethod
-    async def open_connection(cls, dsn: str):
+    async def open_connection(cls, dsn: str, **pool_kwargs):
+        """Открывает пул соединений с базой данных.
+
+        Параметры пула берутся из переменных окружения (см. queries.pool_settings_from_env).
+        :param dsn: Строка подключения к базе данных.
+        :param pool_kwargs: Параметры asyncpg.create_pool, переопределяющие настройки из окружения.
+        """
+        settings = pool_settings_from_env()
+        settings.update(pool_kwargs)
+        settings['min_size'] = min(settings['min_size'], settings['max_size'])
         try:
-            cls._pool = await asyncpg.create_pool(dsn)
+            cls._pool = await asyncpg.create_pool(dsn, connection_class=PreparedConnection,
+                                                  init=cls._init_connection, **settings)
             logging.info(f'Database Connection established')
         except Exception as e:
             logging.error(f'Could not connect to database: {e}')
 
+    @staticmethod
+    async def _init_connection(conn: PreparedConnection):
+        # Новое соединение пула сразу подготавливает все запросы реестра
+        await conn.prepare_all()
+
+    @classmethod
+    async def warm_up(cls):
+        """Подготавливает запросы реестра на всех соединениях, открытых при старте.
+
+        Вызывается после создания таблиц: при первом запуске соединения открываются раньше,
+        чем появляются таблицы, и часть запросов не может быть подготовлена.
+        """
+        connections = []
+        try:
+            for _ in range(cls._pool.get_min_size()):
+                connections.append(await cls._pool.acquire())
+            prepared = await asyncio.gather(*(conn.prepare_all() for conn in connections))
+            logging.info(f'Prepared {sum(prepared)} statements on {len(connections)} connections')
+        except Exception as e:
+            logging.error(f'Could not warm up database connections: {e}')
+        finally:
+            for conn in connections:
+                await cls._pool.release(conn)
+
+    @classmethod
+    @contextlib.asynccontextmanager
+    async def connection(cls):
+        """Выдает соединение из пула.
+
+        Все запросы обработчиков внутри блока
+            async with ParentPostgresqlHandler.connection():
+                ...
+        выполняются на одном соединении, которое берется из пула один раз.
+        Соединение используется только задачей, открывшей блок: задачи, созданные внутри блока
+        (например, через asyncio.gather), берут из пула свои соединения.
+        """
+        task = asyncio.current_task()
+        shared = cls._shared_connection.get()
+        if shared is not None and shared[1] is task:
+            yield shared[0]
+            return
+        start = time.perf_counter()
+        async with cls._pool.acquire() as conn:
+            observe_pool_wait(time.perf_counter() - start)
+            token = cls._shared_connection.set((conn, task))
+            try:
+                yield conn
+            finally:
+                cls._shared_connection.reset(token)
+
+    @classmethod
+    def pool_size(cls) -> int:
+        """ Кол-во открытых соединений пула """
+        return cls._pool.get_size() if cls._pool is not None else 0
+
+    @classmethod
+    def pool_idle_size(cls) -> int:
+        """ Кол-во свободных соединений пула """
+        return cls._pool.get_idle_size() if cls._pool is not None else 0
+
+    @classmethod
+    def is_connected(cls) -> bool:
+        """ Возвращает True, если пул соединений с базой данных открыт """
+        return cls._pool is not None
+
+    @classmethod
+    async def get_schema_fingerprint(cls) -> str | None:
+        """ Возвращает сохраненный отпечаток схемы (см. schema.py) или None, если его нет """
+        try:
+            async with cls.connection() as conn:
+                return await conn.fetchval(f"SELECT fingerprint FROM {FINGERPRINT_TABLE} WHERE name = 'schema'")
+        except asyncpg.exceptions.UndefinedTableError:
+            return None
+        except Exception as e:
+            logging.error(f"Error getting schema fingerprint: {e}")
+
+    @classmethod
+    async def save_schema_fingerprint(cls, fingerprint: str):
+        try:
+            async with cls.connection() as conn:
+                await conn.execute(f"""CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE}
+                                       (name TEXT PRIMARY KEY,
+                                       fingerprint TEXT NOT NULL,
+                                       updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW())""")
+                await conn.execute(f"""INSERT INTO {FINGERPRINT_TABLE} (name, fingerprint) VALUES ('schema', $1)
+                                       ON CONFLICT (name) DO UPDATE
+                                       SET fingerprint = EXCLUDED.fingerprint, updated_at = NOW()""", fingerprint)
+        except Exception as e:
+            logging.error(f"Error saving schema fingerprint: {e}")
+
     @classmethod
     async def close_connection(cls):
         try:
@@ -30,6 +138,8 @@ class ParentPostgresqlHandler:
         except Exception as e:
             logging.error(f'Could not close database connection: {e}')
 
+    _page = staticmethod(keyset_page)
+
     @abc.abstractmethod
     async def create_table_if_not_exist(self):
         pass
@@ -42,11 +152,50 @@ class PostgresqlHandler(ParentPostgresqlHandler, BaseDatabaseHandler, abc.ABC):
 
     async def set_table(self, table_name: str):
         self._table = table_name
+        self._role_counts_table = f'{table_name}_role_counts'
+        self._register_queries()
+
+    def _register_queries(self):
+        registry.add('users.get_by_chat_id', f"SELECT * FROM {self._table} WHERE chat_id = $1")
+        registry.add('users.get_by_username', f"SELECT * FROM {self._table} WHERE username = $1")
+        registry.add('users.insert', f'''INSERT INTO {self._table} (chat_id, username, firstname, role) 
+                                       VALUES ($1, $2, $3, $4) RETURNING *''')
+        registry.add('users.change_role', f'''UPDATE {self._table} SET role=$1 WHERE chat_id=$2 RETURNING *''')
+        # Кол-во пользователей по ролям берется из счетчиков, которые поддерживает триггер (миграция 4)
+        registry.add('users.info', f'''
+                select coalesce(sum(user_count), 0)::int as total_users,
+                coalesce(sum(user_count) filter (where role='admin'), 0)::int as admin_users_count,
+                coalesce(sum(user_count) filter (where role='user'), 0)::int as user_users_count
+                from {self._role_counts_table}
+                ''')
+        for name, condition, order in (('users.by_role_page_after', 'id > $2', 'id'),
+                                       ('users.by_role_page_before', 'id < $2', 'id DESC')):
+            registry.add(name, f'''SELECT id, chat_id, username, firstname FROM {self._table}
+                                    WHERE role = $1 AND {condition}
+                                    ORDER BY {order}
+                                    LIMIT $3''')
+        # Роль записана константой: общий план подготовленного запроса с параметром роли не может использовать
+        # частичный индекс users_admins_idx (миграция 5)
+        for name, condition, order in (('users.admins_page_after', 'id > $1', 'id'),
+                                       ('users.admins_page_before', 'id < $1', 'id DESC')):
+            registry.add(name, f'''SELECT id, chat_id, username, firstname FROM {self._table}
+                                    WHERE role = 'admin' AND {condition}
+                                    ORDER BY {order}
+                                    LIMIT $2''')
+        registry.add('users.get_users', f"select * from {self._table} where role='user'")
+        registry.add('users.active_chunk', f"""SELECT id, chat_id FROM {self._table}
+                                               WHERE is_active AND id > $1
+                                               ORDER BY id
+                                               LIMIT $2""")
+        registry.add('users.count_active', f"SELECT count(*) FROM {self._table} WHERE is_active")
+        registry.add('users.activate', f"""UPDATE {self._table} SET is_active = TRUE
+                                            WHERE chat_id = $1 AND NOT is_active
+                                            RETURNING *""")
 
 
     async def create_table_if_not_exist(self):
         try:
-            async with self._pool.acquire() as conn:
+            async with self.connection() as conn:
                 async with conn.transaction():
                     await conn.execute(f'''
                     CREATE TABLE IF NOT EXISTS {self._table}
@@ -56,67 +205,120 @@ class PostgresqlHandler(ParentPostgresqlHandler, BaseDatabaseHandler, abc.ABC):
                     firstname VARCHAR(50) NOT NULL,
                     role VARCHAR(50) NOT NULL)''')
             logging.warning(f"Created table {self._table}")
+            return True
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error creating table {self._table}: {e}")
+            return False
 
     async def get_user_by_id(self, chat_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetchrow(f"SELECT * FROM {self._table} WHERE chat_id = $1", chat_id)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.get_by_chat_id', chat_id)
             return result
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error getting user {chat_id}: {e}")
 
     async def get_user_by_username(self, username: str):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetchrow(f"SELECT id, chat_id, username FROM {self._table} WHERE username = $1", username)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.get_by_username', username)
             return result
         except Exception as e:
             logging.error(f"Error getting user {username}: {e}")
 
     async def insert_user(self, chat_id: int, username: str, first_name: str, role: str):
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(f'''INSERT INTO {self._table} (chat_id, username, firstname, role) 
-                                       VALUES ($1, $2, $3, $4)''', chat_id, username, first_name, role)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.insert', chat_id, username, first_name, role)
             logging.warning(f"User {username} ({role}) was successfully inserted")
+            return result
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error adding user {username} ({role}) to table {self._table}")
             logging.error(e)
 
     async def change_user_role(self, chat_id: int, new_role: str):
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(f'''UPDATE {self._table} SET role=$1 WHERE chat_id=$2''', new_role, chat_id)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.change_role', new_role, chat_id)
             logging.warning(f"User role changed to {new_role}")
+            return result
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error changing user role to {new_role}")
 
     async def get_users_info(self):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetchrow(f'''
-                select count(*) as total_users,
-                count(case when role='admin' then 1 end) as admin_users_count, 
-                array_agg({self._table}) as admin_users_data, 
-                count(case when role='user' then 1 end) as user_users_count 
-                from {self._table}
-                ''')
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.info')
                 logging.info(result)
             return result
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error getting users info from table {self._table}")
             logging.error(e)
 
+    async def get_users_by_role_page(self, role: str, after_id: int = 0, before_id: int = None, limit: int = 20):
+        """ Возвращает страницу пользователей с указанной ролью (keyset-пагинация по id).
+
+        Если указан before_id - возвращает страницу перед этим пользователем, иначе - после after_id.
+        Возвращает кортеж (записи, есть ли еще записи в направлении выборки).
+        """
+        if before_id is None:
+            query, cursor = 'users.by_role_page_after', after_id
+        else:
+            query, cursor = 'users.by_role_page_before', before_id
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named(query, role, cursor, limit + 1)
+            return self._page(result, limit, reverse=before_id is not None)
+        except Exception as e:
+            logging.error(f"Error getting users with role {role} from table {self._table}: {e}")
+
+    async def get_admins_page(self, after_id: int = 0, before_id: int = None, limit: int = 20):
+        """ Возвращает страницу администраторов (keyset-пагинация по id по частичному индексу users_admins_idx) """
+        if before_id is None:
+            query, cursor = 'users.admins_page_after', after_id
+        else:
+            query, cursor = 'users.admins_page_before', before_id
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named(query, cursor, limit + 1)
+            return self._page(result, limit, reverse=before_id is not None)
+        except Exception as e:
+            logging.error(f"Error getting admins from table {self._table}: {e}")
+
     async def get_users(self):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"select * from {self._table} where role='user'")
+            async with self.connection() as conn:
+                result = await conn.fetch_named('users.get_users')
                 return result
         except Exception as e:
             logging.error(f"Error getting users from table {self._table}: {e}")
 
+    async def get_active_users_chunk(self, after_id: int = 0, limit: int = 500):
+        """ Возвращает следующую пачку активных пользователей (id, chat_id) после пользователя after_id """
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named('users.active_chunk', after_id, limit)
+            return result
+        except Exception as e:
+            logging.error(f"Error getting active users after {after_id} from table {self._table}: {e}")
+
+    async def count_active_users(self):
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetchval_named('users.count_active')
+            return result
+        except Exception as e:
+            logging.error(f"Error counting active users in table {self._table}: {e}")
+
+    async def activate_user(self, chat_id: int):
+        """ Снова включает неактивного пользователя в рассылки. Возвращает None, если пользователь уже активен """
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('users.activate', chat_id)
+            return result
+        except Exception as e:
+            logging.error(f"Error activating user {chat_id}: {e}")
+
 class PostgresqlVideoHandler(ParentPostgresqlHandler):
     def __init__(self):
         super().__init__()
@@ -125,10 +327,65 @@ class PostgresqlVideoHandler(ParentPostgresqlHandler):
         self._teachers_table = 'teachers'
         self._subjects_table = 'subjects'
         self._faculties_table = 'faculties'
+        self._subject_counts_table = 'subject_video_counts'
+        self._catalog_version_table = 'catalog_version'
+        self._register_queries()
+
+    def _register_queries(self):
+        registry.add('videos.faculties', f"SELECT * FROM {self._faculties_table}")
+        # Предметы с видео берутся из таблицы счетчиков, которую поддерживают триггеры (миграция 2)
+        registry.add('videos.subjects', f"""SELECT S.id, S.name
+                                            FROM {self._subject_counts_table} C
+                                            JOIN {self._subjects_table} S ON S.id = C.subject_id
+                                            WHERE C.video_count > 0
+                                            ORDER BY S.id""")
+        for name, condition, order in (('videos.subjects_page_after', 'C.subject_id > $1', 'C.subject_id'),
+                                       ('videos.subjects_page_before', 'C.subject_id < $1', 'C.subject_id DESC')):
+            registry.add(name, f"""SELECT S.id, S.name
+                                   FROM {self._subject_counts_table} C
+                                   JOIN {self._subjects_table} S ON S.id = C.subject_id
+                                   WHERE {condition} AND C.video_count > 0
+                                   ORDER BY {order}
+                                   LIMIT $2""")
+        registry.add('videos.teachers', f"SELECT * FROM {self._teachers_table}")
+        registry.add('videos.by_category',
+                     f"SELECT id, name, telegram_file_id FROM {self._video_table} WHERE category_id = $1")
+        registry.add('videos.by_teacher',
+                     f"SELECT id, name, telegram_file_id FROM {self._video_table} WHERE teacher_id = $1")
+        registry.add('videos.by_subject', f"""SELECT V.id, V.name, V.telegram_file_id
+                                              FROM {self._subjects_table} S
+                                              JOIN {self._teachers_table} T ON S.id = T.subject_id
+                                              JOIN {self._video_table} V ON T.id = V.teacher_id
+                                              WHERE S.id = $1
+                                              ORDER BY V.id""")
+        for name, condition, order in (('videos.by_subject_page_after', 'V.id > $2', 'V.id'),
+                                       ('videos.by_subject_page_before', 'V.id < $2', 'V.id DESC')):
+            registry.add(name, f"""SELECT V.id, V.name, V.telegram_file_id
+                                   FROM {self._teachers_table} T
+                                   JOIN {self._video_table} V ON T.id = V.teacher_id
+                                   WHERE T.subject_id = $1 AND {condition}
+                                   ORDER BY {order}
+                                   LIMIT $3""")
+        registry.add('videos.by_faculty', f"""SELECT V.id, V.name, V.telegram_file_id
+                                              FROM {self._faculties_table} F
+                                              JOIN {self._subjects_table} S ON F.id = S.faculty_id
+                                              JOIN {self._teachers_table} T ON S.id = T.subject_id
+                                              JOIN {self._video_table} V ON T.id = V.teacher_id
+                                              WHERE F.id = $1""")
+        registry.add('videos.by_id', f"SELECT name, telegram_file_id FROM {self._video_table} WHERE id = $1")
+        registry.add('videos.subject_id_by_video', f"""SELECT S.id
+                                                       FROM {self._subjects_table} S
+                                                       JOIN {self._teachers_table} T ON S.id = T.subject_id
+                                                       JOIN {self._video_table} V ON T.id = V.teacher_id
+                                                       WHERE V.id = $1""")
+        # Общая для всех процессов версия каталога (миграция 7)
+        registry.add('videos.catalog_version', f"SELECT version FROM {self._catalog_version_table} WHERE id = 1")
+        registry.add('videos.bump_catalog_version',
+                     f"UPDATE {self._catalog_version_table} SET version = version + 1 WHERE id = 1")
 
     async def create_table_if_not_exist(self):
         try:
-            async with self._pool.acquire() as conn:
+            async with self.connection() as conn:
                 await conn.execute(f'''
                     CREATE TABLE IF NOT EXISTS {self._faculties_table}
                     (id SERIAL PRIMARY KEY,
@@ -152,86 +409,106 @@ class PostgresqlVideoHandler(ParentPostgresqlHandler):
                 ''')
             logging.info(
                 f"Tables {self._video_table}, {self._teachers_table}, {self._subjects_table}, {self._faculties_table} connected!")
+            return True
         except asyncpg.exceptions.PostgresError as e:
             logging.error(f"Error creating tables: {e.args}")
+            return False
 
     async def get_faculties(self):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"SELECT * FROM {self._faculties_table}")
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.faculties')
                 return result
         except Exception as e:
             logging.error(f"Error getting faculties: {e}")
 
     async def get_subjects(self):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"""SELECT S.id, S.name
-                                              FROM {self._subjects_table} S
-                                              JOIN {self._teachers_table} T ON S.id = T.subject_id
-                                              JOIN {self._video_table} V ON T.id = V.teacher_id
-                                              GROUP BY S.id, S.name
-                                              HAVING COUNT(V.id) > 0""")
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.subjects')
                 return result
         except Exception as e:
             logging.error(f"Error getting subjects: {e}")
 
+    async def get_subjects_page(self, after_id: int = 0, before_id: int = None, limit: int = 5):
+        """ Возвращает страницу предметов, по которым есть видео (keyset-пагинация по id).
+
+        Если указан before_id - возвращает страницу перед этим предметом, иначе - после after_id.
+        Возвращает кортеж (записи, есть ли еще записи в направлении выборки).
+        """
+        if before_id is None:
+            query, cursor = 'videos.subjects_page_after', after_id
+        else:
+            query, cursor = 'videos.subjects_page_before', before_id
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named(query, cursor, limit + 1)
+            return self._page(result, limit, reverse=before_id is not None)
+        except Exception as e:
+            logging.error(f"Error getting subjects page after {after_id} before {before_id}: {e}")
+
     async def get_teachers(self):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"SELECT * FROM {self._teachers_table}")
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.teachers')
                 return result
         except Exception as e:
             logging.error(f"Error getting teachers: {e}")
 
     async def get_videos(self, category_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(
-                    f"SELECT id, name, telegram_file_id FROM {self._video_table} WHERE category_id = $1", category_id)
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.by_category', category_id)
             return result
         except Exception as e:
             logging.error(f"Error getting videos by category_id {category_id}: {e}")
 
     async def get_videos_by_teacher_id(self, teacher_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(
-                    f"SELECT id, name, telegram_file_id FROM {self._video_table} WHERE teacher_id = $1", teacher_id)
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.by_teacher', teacher_id)
             return result
         except Exception as e:
             logging.error(f"Error getting videos by teacher_id {teacher_id}: {e}")
 
     async def get_videos_by_subject_id(self, subject_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"""SELECT V.id, V.name, V.telegram_file_id
-                                              FROM {self._subjects_table} S
-                                              JOIN {self._teachers_table} T ON S.id = T.subject_id
-                                              JOIN {self._video_table} V ON T.id = V.teacher_id
-                                              WHERE S.id = $1""", subject_id)
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.by_subject', subject_id)
             return result
         except Exception as e:
             logging.error(f"Error getting videos by subject_id {subject_id}: {e}")
 
+    async def get_videos_page_by_subject_id(self, subject_id: int, after_id: int = 0, before_id: int = None,
+                                            limit: int = 2):
+        """ Возвращает страницу видео по предмету (keyset-пагинация по id).
+
+        Если указан before_id - возвращает страницу перед этим видео, иначе - после after_id.
+        Возвращает кортеж (записи, есть ли еще записи в направлении выборки).
+        """
+        if before_id is None:
+            query, cursor = 'videos.by_subject_page_after', after_id
+        else:
+            query, cursor = 'videos.by_subject_page_before', before_id
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named(query, subject_id, cursor, limit + 1)
+            return self._page(result, limit, reverse=before_id is not None)
+        except Exception as e:
+            logging.error(f"Error getting videos page by subject_id {subject_id}: {e}")
+
     async def get_videos_by_faculty_id(self, faculty_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetch(f"""SELECT V.id, V.name, V.telegram_file_id
-                                              FROM {self._faculties_table} F
-                                              JOIN {self._subjects_table} S ON F.id = S.faculty_id
-                                              JOIN {self._teachers_table} T ON S.id = T.subject_id
-                                              JOIN {self._video_table} V ON T.id = V.teacher_id
-                                              WHERE F.id = $1""", faculty_id)
+            async with self.connection() as conn:
+                result = await conn.fetch_named('videos.by_faculty', faculty_id)
             return result
         except Exception as e:
             logging.error(f"Error getting videos by faculty_id {faculty_id}: {e}")
 
     async def get_video_by_id(self, video_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetchrow(
-                    f"SELECT name, telegram_file_id FROM {self._video_table} WHERE id = $1", video_id)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('videos.by_id', video_id)
                 logging.info(f"Video with id {video_id}: {result}")
             return result
         except Exception as e:
@@ -240,26 +517,139 @@ class PostgresqlVideoHandler(ParentPostgresqlHandler):
 
     async def get_subject_id_by_video_id(self, video_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                result = await conn.fetchrow(f"""SELECT S.id
-                                                 FROM {self._subjects_table} S
-                                                 JOIN {self._teachers_table} T ON S.id = T.subject_id
-                                                 JOIN {self._video_table} V ON T.id = V.teacher_id
-                                                 WHERE V.id = $1""", video_id)
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('videos.subject_id_by_video', video_id)
             return result
         except Exception as e:
             logging.error(f"Error getting subject by video_id. Video_id: {video_id}, {e}")
 
+    async def import_catalog(self, records) -> dict[str, int] | None:
+        """Импортирует каталог видео одной транзакцией.
+
+        Записи загружаются через COPY во временную таблицу, затем недостающие факультеты, предметы и преподаватели
+        добавляются, а названия сопоставляются с ID соединениями по всей временной таблице сразу.
+        Видео сопоставляются по telegram_file_id: известные обновляются, новые добавляются.
+        :param records: Итерируемый объект кортежей (факультет, предмет, преподаватель, название видео, file_id).
+        :return: Кол-во добавленных и обновленных записей по таблицам или None при ошибке.
+        """
+        stats = {}
+        try:
+            async with self.connection() as conn:
+                async with conn.transaction():
+                    await conn.execute("""CREATE TEMP TABLE catalog_import
+                                          (faculty TEXT NOT NULL,
+                                          subject TEXT NOT NULL,
+                                          teacher TEXT NOT NULL,
+                                          name TEXT NOT NULL,
+                                          file_id TEXT NOT NULL) ON COMMIT DROP""")
+                    await conn.copy_records_to_table('catalog_import', records=records,
+                                                     columns=['faculty', 'subject', 'teacher', 'name', 'file_id'])
+                    # Импорты не должны выполняться параллельно, иначе одно и то же название будет добавлено дважды
+                    await conn.execute(f"""LOCK TABLE {self._faculties_table}, {self._subjects_table},
+                                           {self._teachers_table}, {self._video_table} IN SHARE ROW EXCLUSIVE MODE""")
+
+                    stats['faculties'] = self._rows(await conn.execute(f"""
+                        INSERT INTO {self._faculties_table} (name)
+                        SELECT DISTINCT I.faculty FROM catalog_import I
+                        WHERE NOT EXISTS (SELECT 1 FROM {self._faculties_table} F WHERE F.name = I.faculty)"""))
+                    stats['subjects'] = self._rows(await conn.execute(f"""
+                        INSERT INTO {self._subjects_table} (name, faculty_id)
+                        SELECT DISTINCT I.subject, F.id
+                        FROM catalog_import I
+                        JOIN (SELECT name, MIN(id) AS id FROM {self._faculties_table} GROUP BY name) F
+                            ON F.name = I.faculty
+                        WHERE NOT EXISTS (SELECT 1 FROM {self._subjects_table} S
+                                          WHERE S.name = I.subject AND S.faculty_id = F.id)"""))
+                    stats['teachers'] = self._rows(await conn.execute(f"""
+                        INSERT INTO {self._teachers_table} (name, subject_id)
+                        SELECT DISTINCT I.teacher, S.id
+                        FROM catalog_import I
+                        JOIN (SELECT name, MIN(id) AS id FROM {self._faculties_table} GROUP BY name) F
+                            ON F.name = I.faculty
+                        JOIN (SELECT name, faculty_id, MIN(id) AS id FROM {self._subjects_table}
+                              GROUP BY name, faculty_id) S ON S.name = I.subject AND S.faculty_id = F.id
+                        WHERE NOT EXISTS (SELECT 1 FROM {self._teachers_table} T
+                                          WHERE T.name = I.teacher AND T.subject_id = S.id)"""))
+
+                    # Видео с ID преподавателей (для повторяющихся file_id берется последняя запись манифеста)
+                    await conn.execute(f"""
+                        CREATE TEMP TABLE catalog_import_videos ON COMMIT DROP AS
+                        SELECT DISTINCT ON (I.file_id) I.file_id, I.name, T.id AS teacher_id
+                        FROM (SELECT *, ctid FROM catalog_import) I
+                        JOIN (SELECT name, MIN(id) AS id FROM {self._faculties_table} GROUP BY name) F
+                            ON F.name = I.faculty
+                        JOIN (SELECT name, faculty_id, MIN(id) AS id FROM {self._subjects_table}
+                              GROUP BY name, faculty_id) S ON S.name = I.subject AND S.faculty_id = F.id
+                        JOIN (SELECT name, subject_id, MIN(id) AS id FROM {self._teachers_table}
+                              GROUP BY name, subject_id) T ON T.name = I.teacher AND T.subject_id = S.id
+                        ORDER BY I.file_id, I.ctid DESC""")
+                    stats['videos_updated'] = self._rows(await conn.execute(f"""
+                        UPDATE {self._video_table} V SET name = I.name, teacher_id = I.teacher_id
+                        FROM catalog_import_videos I
+                        WHERE V.telegram_file_id = I.file_id
+                          AND (V.name <> I.name OR V.teacher_id IS DISTINCT FROM I.teacher_id)"""))
+                    stats['videos'] = self._rows(await conn.execute(f"""
+                        INSERT INTO {self._video_table} (teacher_id, telegram_file_id, name)
+                        SELECT I.teacher_id, I.file_id, I.name FROM catalog_import_videos I
+                        WHERE NOT EXISTS (SELECT 1 FROM {self._video_table} V WHERE V.telegram_file_id = I.file_id)"""))
+                    # В той же транзакции: процессы, увидевшие новую версию, загрузят уже новый каталог
+                    await conn.execute_named('videos.bump_catalog_version')
+            logging.info(f"Catalog imported: {stats}")
+            return stats
+        except Exception as e:
+            logging.error(f"Error importing catalog: {e}")
+
+    async def get_catalog_version(self) -> int | None:
+        """ Возвращает версию каталога, которую увеличивает каждый импорт, или None при ошибке """
+        try:
+            async with self.connection() as conn:
+                return await conn.fetchval_named('videos.catalog_version')
+        except Exception as e:
+            logging.error(f"Error getting catalog version: {e}")
+
+    @staticmethod
+    def _rows(status: str) -> int:
+        """ Возвращает кол-во строк из статуса команды ('INSERT 0 5' -> 5) """
+        return int(status.split()[-1])
+
 
 class PostgresqlRemindersHandler(ParentPostgresqlHandler):
     def __init__(self):
         super().__init__()
         # Установка названий таблиц базы данных
         self._reminders_table = 'reminders'
+        self._users_table = 'users'
+        self._register_queries()
+
+    def _register_queries(self):
+        registry.add('reminders.add', f"""INSERT INTO {self._reminders_table} (username, date_time, text)
+                                          VALUES ($1, $2, $3) RETURNING id;""")
+        registry.add('reminders.upcoming', f"""SELECT id, username, date_time, text FROM {self._reminders_table}
+                                               ORDER BY date_time LIMIT $1;""")
+        # Сравнение TIMESTAMPTZ не зависит от часового пояса, а условие без выражений над date_time использует индекс
+        registry.add('reminders.current', f"SELECT * FROM {self._reminders_table} WHERE date_time <= NOW();")
+        registry.add('reminders.claim_due', f"""
+                    WITH due AS (
+                        SELECT id FROM {self._reminders_table}
+                        WHERE date_time <= NOW()
+                        ORDER BY date_time
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    ), claimed AS (
+                        DELETE FROM {self._reminders_table} R
+                        USING due
+                        WHERE R.id = due.id
+                        RETURNING R.id, R.username, R.text
+                    )
+                    SELECT C.id, C.username, C.text, U.chat_id
+                    FROM claimed C
+                    LEFT JOIN LATERAL (SELECT chat_id FROM {self._users_table}
+                                       WHERE username = C.username LIMIT 1) U ON TRUE;""")
+        registry.add('reminders.delete', f"DELETE FROM {self._reminders_table} WHERE id = $1;")
 
     async def create_table_if_not_exist(self):
         try:
-            async with self._pool.acquire() as conn:
+            async with self.connection() as conn:
                 await conn.execute(f'''
                     CREATE TABLE IF NOT EXISTS {self._reminders_table}
                     (id SERIAL PRIMARY KEY,
@@ -267,31 +657,152 @@ class PostgresqlRemindersHandler(ParentPostgresqlHandler):
                     date_time TIMESTAMPTZ NOT NULL,
                     text TEXT NOT NULL);''')
             logging.info(f"Table {self._reminders_table} connected!")
+            return True
         except Exception as e:
             logging.error(f"Error creating table {self._reminders_table}: {e}")
+            return False
 
     async def add_reminder(self, username: str, date_time: datetime, text: str):
+        """ Добавляет напоминание и возвращает его id """
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(f"""INSERT INTO {self._reminders_table} (username, date_time, text)
-                                       VALUES ($1, $2, $3);""", username, date_time, text)
+            async with self.connection() as conn:
+                reminder_id = await conn.fetchval_named('reminders.add', username, date_time, text)
                 logging.info(f"Added reminder: {username}, {date_time}, {text}")
+            return reminder_id
         except Exception as e:
             logging.error(f"Error adding reminder: {username}, {date_time}, {text} | {e}")
 
+    async def get_upcoming_reminders(self, limit: int):
+        """ Возвращает ближайшие напоминания, отсортированные по date_time """
+        try:
+            async with self.connection() as conn:
+                reminders = await conn.fetch_named('reminders.upcoming', limit)
+            return reminders
+        except Exception as e:
+            logging.error(f"Error getting upcoming reminders: {e}")
+
     async def get_current_reminders(self):
         """ Возвращает напоминания на текущий момент """
         try:
-            async with self._pool.acquire() as conn:
-                reminders = await conn.fetch(f"SELECT * FROM {self._reminders_table} WHERE date_time AT TIME ZONE 'Europe/Moscow' <= NOW() AT TIME ZONE 'Europe/Moscow';")
+            async with self.connection() as conn:
+                reminders = await conn.fetch_named('reminders.current')
             return reminders
         except Exception as e:
             logging.error(f"Error getting current reminders: {e}")
 
+    async def claim_due_reminders(self, limit: int):
+        """ Забирает пачку наступивших напоминаний вместе с chat_id пользователей.
+
+        Напоминания удаляются в том же запросе, а строки, заблокированные другим экземпляром бота, пропускаются -
+        поэтому одно и то же напоминание не может быть отправлено дважды.
+        """
+        try:
+            async with self.connection() as conn:
+                reminders = await conn.fetch_named('reminders.claim_due', limit)
+            return reminders
+        except Exception as e:
+            logging.error(f"Error claiming due reminders: {e}")
+
     async def delete_reminder(self, reminder_id: int):
         try:
-            async with self._pool.acquire() as conn:
-                await conn.execute(f"DELETE FROM {self._reminders_table} WHERE id = $1;", reminder_id)
+            async with self.connection() as conn:
+                await conn.execute_named('reminders.delete', reminder_id)
             logging.info(f"Deleted reminder: {reminder_id}")
         except Exception as e:
-            logging.error(f"Error deleting reminder: {reminder_id}")
\ No newline at end of file
+            logging.error(f"Error deleting reminder: {reminder_id}")
+
+class PostgresqlBroadcastHandler(ParentPostgresqlHandler):
+    def __init__(self):
+        super().__init__()
+        # Установка названий таблиц базы данных
+        self._broadcasts_table = 'broadcasts'
+        self._users_table = 'users'
+        self._register_queries()
+
+    def _register_queries(self):
+        registry.add('broadcasts.create', f"""INSERT INTO {self._broadcasts_table} (admin_chat_id, text, total)
+                                              VALUES ($1, $2, $3) RETURNING *""")
+        registry.add('broadcasts.set_status_message',
+                     f"UPDATE {self._broadcasts_table} SET status_message_id = $2 WHERE id = $1")
+        registry.add('broadcasts.unfinished',
+                     f"SELECT * FROM {self._broadcasts_table} WHERE finished_at IS NULL ORDER BY id")
+        registry.add('broadcasts.progress', f"""UPDATE {self._broadcasts_table}
+                                                SET last_user_id = $2, sent = sent + $3, failed = failed + $4,
+                                                    blocked = blocked + $5
+                                                WHERE id = $1""")
+        registry.add('broadcasts.deactivate_users',
+                     f"UPDATE {self._users_table} SET is_active = FALSE WHERE id = ANY($1::INT[])")
+        registry.add('broadcasts.finish', f"UPDATE {self._broadcasts_table} SET finished_at = NOW() WHERE id = $1")
+
+    async def create_table_if_not_exist(self):
+        try:
+            async with self.connection() as conn:
+                await conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {self._broadcasts_table}
+                    (id SERIAL PRIMARY KEY,
+                    admin_chat_id BIGINT NOT NULL,
+                    status_message_id BIGINT,
+                    text TEXT NOT NULL,
+                    total INT NOT NULL DEFAULT 0,
+                    last_user_id INT NOT NULL DEFAULT 0,
+                    sent INT NOT NULL DEFAULT 0,
+                    failed INT NOT NULL DEFAULT 0,
+                    blocked INT NOT NULL DEFAULT 0,
+                    started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                    finished_at TIMESTAMPTZ);''')
+            logging.info(f"Table {self._broadcasts_table} connected!")
+            return True
+        except Exception as e:
+            logging.error(f"Error creating table {self._broadcasts_table}: {e}")
+            return False
+
+    async def create_broadcast(self, admin_chat_id: int, text: str, total: int):
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetchrow_named('broadcasts.create', admin_chat_id, text, total)
+            logging.info(f"Created broadcast {result['id']} for {total} users")
+            return result
+        except Exception as e:
+            logging.error(f"Error creating broadcast: {e}")
+
+    async def set_status_message(self, broadcast_id: int, message_id: int):
+        try:
+            async with self.connection() as conn:
+                await conn.execute_named('broadcasts.set_status_message', broadcast_id, message_id)
+        except Exception as e:
+            logging.error(f"Error setting status message of broadcast {broadcast_id}: {e}")
+
+    async def get_unfinished_broadcasts(self):
+        try:
+            async with self.connection() as conn:
+                result = await conn.fetch_named('broadcasts.unfinished')
+            return result
+        except Exception as e:
+            logging.error(f"Error getting unfinished broadcasts: {e}")
+
+    async def save_progress(self, broadcast_id: int, last_user_id: int, sent: int, failed: int,
+                            blocked_user_ids: list[int]) -> bool:
+        """Сохраняет контрольную точку рассылки после отправки пачки.
+
+        В той же транзакции пользователи, заблокировавшие бота, помечаются неактивными.
+        :return: True - если контрольная точка сохранена.
+        """
+        try:
+            async with self.connection() as conn:
+                async with conn.transaction():
+                    if blocked_user_ids:
+                        await conn.execute_named('broadcasts.deactivate_users', blocked_user_ids)
+                    await conn.execute_named('broadcasts.progress', broadcast_id, last_user_id, sent, failed,
+                                             len(blocked_user_ids))
+            return True
+        except Exception as e:
+            logging.error(f"Error saving progress of broadcast {broadcast_id}: {e}")
+            return False
+
+    async def finish_broadcast(self, broadcast_id: int):
+        try:
+            async with self.connection() as conn:
+                await conn.execute_named('broadcasts.finish', broadcast_id)
+            logging.info(f"Broadcast {broadcast_id} finished")
+        except Exception as e:
+            logging.error(f"Error finishing broadcast {broadcast_id}: {e}")
@@ -0,0 +1,125 @@
+import logging
+import os
+import time
+
+import asyncpg
+from asyncpg.prepared_stmt import PreparedStatement
+
+from metrics import observe_query
+
+
+class QueryRegistry:
+    """Реестр именованных SQL-запросов.
+
+    Обработчики регистрируют свои запросы под именами вида '<таблица>.<действие>' и выполняют их по имени.
+    Каждое соединение пула подготавливает (PREPARE) запрос один раз и дальше переиспользует его,
+    а при открытии соединения все зарегистрированные запросы подготавливаются заранее.
+    """
+
+    def __init__(self):
+        self._queries: dict[str, str] = {}
+
+    def add(self, name: str, sql: str) -> None:
+        self._queries[name] = sql
+
+    def __getitem__(self, name: str) -> str:
+        return self._queries[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._queries
+
+    def __iter__(self):
+        return iter(self._queries)
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+
+registry = QueryRegistry()
+
+
+class PreparedConnection(asyncpg.Connection):
+    """Соединение, которое хранит подготовленные запросы реестра.
+
+    Подготовленные запросы хранятся по тексту SQL, поэтому смена названия таблицы (set_table)
+    просто приводит к подготовке нового запроса.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prepared: dict[str, PreparedStatement] = {}
+
+    async def prepared(self, name: str) -> PreparedStatement:
+        """ Возвращает подготовленный запрос реестра по имени """
+        sql = registry[name]
+        statement = self._prepared.get(sql)
+        if statement is None:
+            statement = await self.prepare(sql)
+            self._prepared[sql] = statement
+        return statement
+
+    async def prepare_all(self) -> int:
+        """Подготавливает все зарегистрированные запросы.
+
+        Запросы к еще не созданным таблицам пропускаются - они будут подготовлены при первом вызове.
+        Возвращает кол-во подготовленных запросов.
+        """
+        count = 0
+        for name in registry:
+            try:
+                await self.prepared(name)
+                count += 1
+            except asyncpg.exceptions.PostgresError as e:
+                logging.debug(f"Could not prepare query {name}: {e}")
+        return count
+
+    def forget_prepared(self) -> None:
+        """ Сбрасывает подготовленные запросы (например, после изменения схемы БД) """
+        self._prepared.clear()
+
+    async def _run_named(self, method: str, name: str, args: tuple):
+        start = time.perf_counter()
+        try:
+            statement = await self.prepared(name)
+            try:
+                return await getattr(statement, method)(*args)
+            except asyncpg.exceptions.InvalidCachedStatementError:
+                # Схема таблицы изменилась после подготовки запроса - подготавливаем его заново
+                self._prepared.pop(registry[name], None)
+                statement = await self.prepared(name)
+                return await getattr(statement, method)(*args)
+        finally:
+            observe_query(name, time.perf_counter() - start)
+
+    async def fetch_named(self, name: str, *args) -> list:
+        return await self._run_named('fetch', name, args)
+
+    async def fetchrow_named(self, name: str, *args):
+        return await self._run_named('fetchrow', name, args)
+
+    async def fetchval_named(self, name: str, *args):
+        return await self._run_named('fetchval', name, args)
+
+    async def execute_named(self, name: str, *args) -> None:
+        # У подготовленного запроса нет execute, результат запросов без RETURNING - пустой список
+        await self._run_named('fetch', name, args)
+
+
+def pool_settings_from_env() -> dict:
+    """Возвращает параметры пула соединений из переменных окружения.
+
+    DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE - размер пула;
+    DB_POOL_MAX_INACTIVE_LIFETIME - через сколько секунд простоя соединение закрывается;
+    DB_COMMAND_TIMEOUT - таймаут запроса в секундах;
+    DB_STATEMENT_CACHE_SIZE - размер кэша подготовленных запросов asyncpg для запросов вне реестра.
+    """
+    settings = {
+        'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 5)),
+        'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 20)),
+        'max_inactive_connection_lifetime': float(os.getenv('DB_POOL_MAX_INACTIVE_LIFETIME', 300)),
+        'statement_cache_size': int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100)),
+    }
+    command_timeout = os.getenv('DB_COMMAND_TIMEOUT')
+    if command_timeout:
+        settings['command_timeout'] = float(command_timeout)
+    return settings
@@ -0,0 +1,28 @@
+"""Отпечаток схемы базы данных.
+
+При каждом запуске обработчики выполняют CREATE TABLE IF NOT EXISTS, а для PostgreSQL еще и проверяют миграции.
+Чтобы не делать этого при каждом перезапуске, после успешного создания схемы в таблицу schema_fingerprint
+записывается хэш всего, что ее определяет: исходного кода методов create_table_if_not_exist, названий таблиц
+обработчиков и списка миграций. Если при следующем запуске хэш совпадает, DDL пропускается.
+Изменение любого CREATE TABLE, названия таблицы или новая миграция меняют хэш, и схема проверяется заново.
+"""
+import hashlib
+import inspect
+
+FINGERPRINT_TABLE = 'schema_fingerprint'
+
+
+def schema_fingerprint(handlers, *parts) -> str:
+    """Вычисляет отпечаток схемы.
+
+    :param handlers: Обработчики, создающие таблицы (create_table_if_not_exist).
+    :param parts: Остальное, от чего зависит схема (бэкенд, миграции), - учитывается через repr.
+    """
+    digest = hashlib.sha256()
+    for handler in handlers:
+        digest.update(inspect.getsource(type(handler).create_table_if_not_exist).encode())
+        # Названия таблиц хранятся в атрибутах обработчика
+        digest.update(repr(sorted(vars(handler).items())).encode())
+    for part in parts:
+        digest.update(repr(part).encode())
+    return digest.hexdigest()
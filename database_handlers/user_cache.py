@@ -0,0 +1,107 @@
+import time
+from collections import OrderedDict
+
+# Возвращается, если записи о пользователе нет в кэше и нужно обратиться к базе данных
+MISSING = object()
+
+
+class UserCache:
+    """Ограниченный кэш пользователей в памяти.
+
+    Основной индекс - chat_id, дополнительный - username.
+    Неизвестные пользователи тоже кэшируются (со значением None) на короткое время, чтобы повторные
+    проверки не ходили в базу данных. Значения отдаются без копирования, поэтому изменять их нельзя.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600, negative_ttl: float = 30):
+        """
+        :param maxsize: Максимальное кол-во пользователей в кэше.
+        :param ttl: Время жизни записи о пользователе в секундах.
+        :param negative_ttl: Время жизни записи о неизвестном пользователе в секундах.
+        """
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        # chat_id -> (время истечения, данные пользователя или None)
+        self._users: OrderedDict[int, tuple[float, dict | None]] = OrderedDict()
+        # username -> chat_id
+        self._usernames: dict[str, int] = {}
+        # username -> время истечения записи о неизвестном пользователе
+        self._missing_usernames: OrderedDict[str, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    @property
+    def stats(self) -> dict:
+        """ Возвращает статистику попаданий и промахов кэша """
+        return {'size': len(self._users), 'hits': self.hits, 'misses': self.misses}
+
+    def get(self, chat_id: int):
+        """Возвращает данные пользователя по chat_id.
+
+        :return: Данные пользователя, None - если пользователь неизвестен, или MISSING - если записи в кэше нет.
+        """
+        entry = self._users.get(chat_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self.misses += 1
+            return MISSING
+        self._users.move_to_end(chat_id)
+        self.hits += 1
+        return entry[1]
+
+    def get_by_username(self, username: str):
+        """Возвращает данные пользователя по username.
+
+        :return: Данные пользователя, None - если пользователь неизвестен, или MISSING - если записи в кэше нет.
+        """
+        chat_id = self._usernames.get(username)
+        if chat_id is not None:
+            user = self.get(chat_id)
+            if user is not MISSING:
+                return user
+            return MISSING
+        expires = self._missing_usernames.get(username)
+        if expires is not None and expires > time.monotonic():
+            self.hits += 1
+            return None
+        self.misses += 1
+        return MISSING
+
+    def put(self, user: dict) -> None:
+        """ Сохраняет данные пользователя (словарь со строкой таблицы users) """
+        chat_id = user['chat_id']
+        self.invalidate(chat_id)
+        self._users[chat_id] = (time.monotonic() + self._ttl, user)
+        if user['username']:
+            self._usernames[user['username']] = chat_id
+            self._missing_usernames.pop(user['username'], None)
+        self._evict()
+
+    def put_missing(self, chat_id: int = None, username: str = None) -> None:
+        """ Запоминает, что пользователя с указанным chat_id или username нет в базе данных """
+        expires = time.monotonic() + self._negative_ttl
+        if chat_id is not None:
+            self.invalidate(chat_id)
+            self._users[chat_id] = (expires, None)
+            self._users.move_to_end(chat_id)
+        if username is not None:
+            self._missing_usernames[username] = expires
+            self._missing_usernames.move_to_end(username)
+        self._evict()
+
+    def invalidate(self, chat_id: int) -> None:
+        """ Удаляет запись о пользователе из кэша """
+        entry = self._users.pop(chat_id, None)
+        if entry is not None and entry[1] is not None and self._usernames.get(entry[1]['username']) == chat_id:
+            del self._usernames[entry[1]['username']]
+
+    def _evict(self) -> None:
+        while len(self._users) > self._maxsize:
+            chat_id, (_, user) = self._users.popitem(last=False)
+            if user is not None and self._usernames.get(user['username']) == chat_id:
+                del self._usernames[user['username']]
+        while len(self._missing_usernames) > self._maxsize:
+            self._missing_usernames.popitem(last=False)
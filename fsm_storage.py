@@ -0,0 +1,107 @@
+import datetime
+import json
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+from redis.asyncio import Redis
+
+
+def _encode(value: Any) -> Any:
+    """ Компактно кодирует значения, которые не поддерживает json (дата и время из формы напоминания) """
+    if isinstance(value, datetime.datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$d': value.toordinal()}
+    if isinstance(value, datetime.time):
+        encoded = {'$t': value.hour * 3600 + value.minute * 60 + value.second}
+        if value.microsecond:
+            encoded['us'] = value.microsecond
+        return encoded
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _decode(obj: dict) -> Any:
+    if '$d' in obj:
+        return datetime.date.fromordinal(obj['$d'])
+    if '$t' in obj:
+        seconds = obj['$t']
+        return datetime.time(seconds // 3600, seconds // 60 % 60, seconds % 60, obj.get('us', 0))
+    if '$dt' in obj:
+        return datetime.datetime.fromisoformat(obj['$dt'])
+    return obj
+
+
+def dumps(data: Dict[str, Any]) -> str:
+    return json.dumps(data, default=_encode, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(raw: str | bytes) -> Dict[str, Any]:
+    return json.loads(raw, object_hook=_decode)
+
+
+# Время жизни состояния и данных незавершенных диалогов в Redis (в секундах)
+STATE_TTL = 86400
+DATA_TTL = 86400
+
+
+def create_redis_storage(redis, prefix: str = 'fsm') -> RedisStorage:
+    """Создает FSM-хранилище aiogram в Redis с компактной сериализацией данных (dumps/loads).
+
+    В отличие от MemoryStorage, состояние незавершенных диалогов (например, создания напоминания)
+    переживает перезапуск бота и доступно всем экземплярам бота, подключенным к одному Redis.
+    Ключи хранятся с TTL, поэтому брошенные диалоги не копятся бесконечно.
+    :param redis: Клиент redis.asyncio.Redis или совместимый (например, FakeRedis).
+    :param prefix: Префикс ключей.
+    """
+    return RedisStorage(redis, key_builder=DefaultKeyBuilder(prefix=prefix, with_bot_id=True, with_destiny=True),
+                        state_ttl=STATE_TTL, data_ttl=DATA_TTL, json_dumps=dumps, json_loads=loads)
+
+
+class FakeRedis:
+    """Минимальная замена клиента Redis в памяти процесса.
+
+    Поддерживает только команды, которые использует RedisStorage aiogram (get, set с TTL, delete, aclose).
+    Предназначена для тестов и локального запуска без Redis.
+    """
+
+    def __init__(self):
+        # Ключ -> (значение, время истечения или None)
+        self._data: dict[str, tuple[bytes, float | None]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def set(self, key: str, value: str | bytes, ex: Optional[int] = None) -> bool:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def aclose(self, close_connection_pool: bool = True) -> None:
+        pass
+
+
+def create_storage(backend: str = None, redis_url: str = None) -> BaseStorage:
+    """Создает FSM-хранилище по настройке.
+
+    :param backend: 'memory' (по умолчанию), 'redis' или 'fake-redis'.
+    :param redis_url: Строка подключения к Redis (для backend='redis').
+    """
+    if backend == 'redis':
+        return create_redis_storage(Redis.from_url(redis_url or 'redis://localhost:6379/0'))
+    if backend == 'fake-redis':
+        return create_redis_storage(FakeRedis())
+    return MemoryStorage()
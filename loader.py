@@ -0,0 +1,179 @@
+"""Объекты бота, общие для всех модулей: бот, диспетчер, обработчики БД, планировщики, метрики.
+
+Модули с обработчиками импортируют их отсюда (from loader import ...), а точки входа (bot.py, workers.py)
+импортируют loader и модули с обработчиками, поэтому каждый модуль загружается один раз и без циклических импортов.
+Здесь же описан запуск: подключение к БД с проверкой отпечатка схемы и параллельный прогрев.
+"""
+import asyncio
+import logging
+import os
+
+import dotenv
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from broadcaster import Broadcaster
+from fsm_storage import create_storage
+import metrics
+from profiling import SamplingProfiler, SlowUpdateLog, StartupTimer
+from outbound_dispatcher import OutboundDispatcher
+from reminder_scheduler import ReminderScheduler
+from database_handlers.schema import schema_fingerprint
+from database_handlers.user_cache import UserCache
+
+dotenv.load_dotenv()
+
+# Устанавливаем формат лога в формате [дата и время] - [уровень лога] - [сообщение]
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# База данных выбирается настройкой DATABASE_BACKEND (postgres | sqlite)
+DATABASE_BACKEND = os.getenv('DATABASE_BACKEND', 'postgres')
+if DATABASE_BACKEND == 'sqlite':
+    from database_handlers.sqlite_handler import ParentSqliteHandler as ParentDatabaseHandler, \
+        SqliteHandler as UsersHandler, SqliteVideoHandler as VideoHandler, \
+        SqliteRemindersHandler as RemindersHandler, SqliteBroadcastHandler as BroadcastHandler
+else:
+    from database_handlers.postgresql_handler import ParentPostgresqlHandler as ParentDatabaseHandler, \
+        PostgresqlHandler as UsersHandler, PostgresqlVideoHandler as VideoHandler, \
+        PostgresqlRemindersHandler as RemindersHandler, PostgresqlBroadcastHandler as BroadcastHandler
+
+
+def create_session() -> AiohttpSession | None:
+    """ Сессия бота с адресом Bot API из TELEGRAM_API_SERVER (локальный или тестовый сервер) или None - api.telegram.org """
+    api_server = os.getenv('TELEGRAM_API_SERVER')
+    if not api_server:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(api_server))
+
+
+bot = Bot(os.getenv("TOKEN"), session=create_session())
+# Все исходящие запросы к Bot API проходят через диспетчер с ограничением частоты
+outbound_dispatcher = OutboundDispatcher(rate=float(os.getenv('BOT_API_RATE', 30)),
+                                         chat_rate=float(os.getenv('BOT_API_CHAT_RATE', 1)),
+                                         concurrency=int(os.getenv('BOT_API_CONCURRENCY', 16)))
+bot.session.middleware(outbound_dispatcher)
+# Хранилище состояний выбирается настройкой FSM_STORAGE (memory | redis)
+dp = Dispatcher(storage=create_storage(os.getenv('FSM_STORAGE'), os.getenv('REDIS_URL')))
+db_handler = UsersHandler()
+db_video_handler = VideoHandler()
+db_reminder_handler = RemindersHandler()
+db_broadcast_handler = BroadcastHandler()
+# Кэш пользователей по chat_id и username. Обновляется при добавлении пользователя, смене роли и блокировке бота
+user_cache = UserCache(maxsize=10000, ttl=3600, negative_ttl=30)
+reminder_scheduler = ReminderScheduler(db_reminder_handler)
+broadcaster = Broadcaster(db_handler, db_broadcast_handler, user_cache)
+
+# Сбор метрик: время обработки обновлений, запросов к БД и к Bot API
+metrics.setup(dp, bot)
+metrics.register_gauge('bot_db_pool_size', 'Open database connections', ParentDatabaseHandler.pool_size)
+metrics.register_gauge('bot_db_pool_idle', 'Idle database connections', ParentDatabaseHandler.pool_idle_size)
+metrics.register_gauge('bot_reminder_queue_size', 'Reminders waiting in the scheduler', lambda: len(reminder_scheduler))
+metrics.register_gauge('bot_outbound_queue_size', 'Bot API requests waiting to be sent',
+                       lambda: outbound_dispatcher.queue_size)
+metrics.register_gauge('bot_broadcasts_running', 'Broadcasts in progress', lambda: len(broadcaster))
+# Профилирование по запросу администратора и журнал медленных обновлений
+profiler = SamplingProfiler(directory=os.getenv('PROFILE_DIR', 'profiles'),
+                            interval=int(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000)
+slow_updates = SlowUpdateLog(threshold=int(os.getenv('SLOW_UPDATE_THRESHOLD_MS', 500)) / 1000,
+                             size=int(os.getenv('SLOW_UPDATES_BUFFER', 100)))
+metrics.add_update_listener(slow_updates.observe)
+metrics.add_update_listener(profiler.observe)
+
+
+async def start_metrics_server(offset: int = 0):
+    """ Запускает сервер метрик на METRICS_PORT + offset, если METRICS_PORT задан. Возвращает его AppRunner или None """
+    port = os.getenv('METRICS_PORT')
+    if port:
+        return await metrics.start_metrics_server(os.getenv('METRICS_HOST', '127.0.0.1'), int(port) + offset)
+
+
+async def connect_to_db(timer: StartupTimer = None, **pool_kwargs) -> bool:
+    """Подключается к БД и создает схему, если ее отпечаток изменился (см. database_handlers/schema.py).
+
+    :param timer: Замер фаз запуска (подключение и проверка схемы записываются как отдельные фазы).
+    :param pool_kwargs: Параметры пула PostgreSQL (для SQLite не используются).
+    :return: True - если выполнялся DDL, False - если схема уже была актуальной.
+    """
+    timer = timer or StartupTimer()
+    handlers = (db_handler, db_video_handler, db_reminder_handler, db_broadcast_handler)
+    # Устанавливаем название таблицы с данными пользователей
+    await db_handler.set_table('users')
+
+    with timer.phase('connect'):
+        if DATABASE_BACKEND == 'sqlite':
+            # Открываем файл базы SQLite (параметры пула PostgreSQL не используются)
+            await ParentDatabaseHandler.open_connection(os.getenv('SQLITE_PATH', 'bot.db'))
+            migrations = ()
+        else:
+            from database_handlers.migrations import MIGRATIONS
+            # Подключаемся к БД Postgres
+            await ParentDatabaseHandler.open_connection(os.getenv('POSTGRES_CONNECTION_STRING'), **pool_kwargs)
+            migrations = MIGRATIONS
+
+    with timer.phase('schema'):
+        fingerprint = schema_fingerprint(handlers, DATABASE_BACKEND, migrations)
+        if await ParentDatabaseHandler.get_schema_fingerprint() == fingerprint:
+            logging.info('Database schema is up to date')
+            return False
+        if await _create_schema(handlers):
+            await ParentDatabaseHandler.save_schema_fingerprint(fingerprint)
+        return True
+
+
+async def _create_schema(handlers) -> bool:
+    """ Создает таблицы если их нет и применяет миграции. Возвращает True, если все шаги выполнены """
+    if DATABASE_BACKEND == 'sqlite':
+        return all([await handler.create_table_if_not_exist() for handler in handlers])
+
+    from database_handlers.migrations import migrate
+    # Все запросы - на одном соединении
+    async with ParentDatabaseHandler.connection() as conn:
+        created = all([await handler.create_table_if_not_exist() for handler in handlers])
+        if os.getenv('DB_AUTO_MIGRATE', '1') != '1':
+            # Без миграций схема может быть неполной - отпечаток не сохраняется
+            return False
+        try:
+            await migrate(conn)
+        except Exception as e:
+            logging.error(f"Error applying database migrations: {e}")
+            return False
+    return created
+
+
+async def startup(timer: StartupTimer = None, catalog_page_size: int = None, run_reminders: bool = True,
+                  resume_broadcasts: bool = True, **pool_kwargs) -> asyncio.Task | None:
+    """Запускает бота: подключение к БД и независимые шаги прогрева, выполняемые параллельно.
+
+    Запрос getMe выполняется одновременно с подключением к БД, а после подключения параллельно прогреваются
+    соединения, кэш каталога, запускается планировщик напоминаний и продолжаются прерванные рассылки.
+    В конце в лог выводится отчет о длительности фаз.
+    :param timer: Замер фаз запуска, начатый точкой входа (например, с импортом модулей).
+    :param catalog_page_size: Размер страницы предметов, которая прогревается в кэше каталога (None - без прогрева).
+    :param run_reminders: Запускать ли планировщик напоминаний.
+    :param resume_broadcasts: Продолжать ли прерванные рассылки.
+    :param pool_kwargs: Параметры пула PostgreSQL.
+    :return: Задача планировщика напоминаний или None.
+    """
+    from database_handlers.functions import warm_up_catalog_cache, watch_catalog_version
+    timer = timer or StartupTimer()
+    # Бот кэширует результат getMe, поэтому polling и вебхук не запрашивают его повторно
+    me = asyncio.create_task(timer.run('get_me', bot.me()))
+    with timer.phase('database'):
+        schema_changed = await connect_to_db(timer, **pool_kwargs)
+
+    steps = []
+    if schema_changed:
+        # Подготавливаем запросы на соединениях, открытых до создания таблиц
+        steps.append(timer.run('pool warm-up', ParentDatabaseHandler.warm_up()))
+    if catalog_page_size:
+        steps.append(timer.run('catalog cache', warm_up_catalog_cache(catalog_page_size)))
+    steps.append(timer.run('catalog version', watch_catalog_version()))
+    reminders_task = None
+    if run_reminders:
+        reminders_task = asyncio.create_task(reminder_scheduler.run(bot))
+    if resume_broadcasts:
+        steps.append(timer.run('broadcasts', broadcaster.resume(bot)))
+    await asyncio.gather(me, *steps)
+    logging.info(timer.report())
+    return reminders_task
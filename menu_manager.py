@@ -1,12 +1,44 @@
 import calendar
 import datetime
 import logging
+from functools import wraps
 
 import aiogram.exceptions
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, InputMediaVideo, Message
 
+from callbacks import SelectCategory, CategoryPage, ChooseVideo, VideoPage, SelectVideo, CalendarMonth, SelectDay, \
+    AdminsPage
 from database_handlers.functions import get_user_by_chat_id
-from bot import bot
+from loader import bot
+
+
+def memoize_markup(builder):
+    """Кэширует клавиатуры, построенные функцией builder, по ее аргументам.
+
+    Клавиатуры aiogram - изменяемые pydantic-модели, поэтому каждый вызов получает копию закэшированной разметки
+    с новыми списками рядов и копиями кнопок: изменение клавиатуры в одном обработчике (например, добавление ряда
+    или замена текста кнопки) не портит меню остальных пользователей. Такая копия в несколько раз дешевле
+    построения клавиатуры и глубокого копирования (model_copy(deep=True)).
+    Исходная функция доступна через __wrapped__, а сам кэш - через атрибут cache.
+    """
+    cache = {}
+
+    @wraps(builder)
+    def wrapper(*args):
+        markup = cache.get(args)
+        if markup is None:
+            markup = cache[args] = builder(*args)
+        return _copy_markup(markup)
+
+    wrapper.cache = cache
+    return wrapper
+
+
+def _copy_markup(markup: InlineKeyboardMarkup) -> InlineKeyboardMarkup:
+    # Вложенные объекты кнопок (web_app, login_url и т.п.) в кэшируемых меню не используются, поэтому кнопки
+    # копируются поверхностно
+    return InlineKeyboardMarkup.model_construct(
+        inline_keyboard=[[button.model_copy() for button in row] for row in markup.inline_keyboard])
 
 
 async def create_inline_menu(buttons: list[list], buttons_callback: list[list] = "None",
@@ -25,6 +57,12 @@ async def create_inline_menu(buttons: list[list], buttons_callback: list[list] =
     :param optional: Параметр, отвечающий за добавление к колбэку приставки.
     :return: InlineKeyboardMarkup с полученным меню.
     """
+    return build_inline_menu(buttons, buttons_callback, optional)
+
+
+def build_inline_menu(buttons: list[list], buttons_callback: list[list] = "None",
+                      optional: str = None) -> InlineKeyboardMarkup:
+    """ Синхронная версия create_inline_menu """
     inline_keyboard = []
     if buttons:
         for row, callback_row in zip(buttons, buttons_callback):
@@ -76,78 +114,172 @@ async def main_menu(chat_id: int) -> (str, InlineKeyboardMarkup):
     text = "Главное меню"
     user_data = await get_user_by_chat_id(chat_id=chat_id)
     if user_data:
-        logging.error(user_data[-1])
-        buttons = [
-            ['Смотреть видео'],
-            ['Сменить роль'],
-        ]
-        callbacks = [
-            ['watch_video'],
-            ['change_role'],
-        ]
-        if user_data[-1] == 'admin':
-            # TODO: Получать данные админ-меню и возвращает
-            buttons.append(['Админ меню'])
-            callbacks.append(['admin_menu'])
-
-        return text, await create_inline_menu(buttons, callbacks)
+        return text, _main_menu_markup(user_data['role'])
     else:
         return await choose_role_menu()
 
 
+@memoize_markup
+def _main_menu_markup(role: str) -> InlineKeyboardMarkup:
+    buttons = [
+        ['Смотреть видео'],
+        ['Сменить роль'],
+    ]
+    callbacks = [
+        ['watch_video'],
+        ['change_role'],
+    ]
+    if role == 'admin':
+        # TODO: Получать данные админ-меню и возвращает
+        buttons.append(['Админ меню'])
+        callbacks.append(['admin_menu'])
+    return build_inline_menu(buttons, callbacks)
+
+
 async def choose_role_menu(opt: str = None) -> (str, InlineKeyboardMarkup):
     """Возвращает меню выбора роли
     :return: разметка клавиатуры
     """
     text = "Меню выбора роли"
+    return text, _choose_role_markup(opt)
+
+
+@memoize_markup
+def _choose_role_markup(opt: str | None) -> InlineKeyboardMarkup:
     buttons = [
         ["Пользователь", "Администратор"]
     ]
     buttons_callback = [
         ['select_user', 'select_admin']
     ]
-
-    return text, await create_inline_menu(buttons, buttons_callback, optional=opt)
+    return build_inline_menu(buttons, buttons_callback, optional=opt)
 
 
 async def admin_menu() -> (str, InlineKeyboardMarkup):
     text = "Меню администратора"
+    return text, _admin_menu_markup()
+
 
+@memoize_markup
+def _admin_menu_markup() -> InlineKeyboardMarkup:
     buttons = [
         ['Статистика пользователей'],
         ['Установить напоминание'],
+        ['Импорт каталога'],
+        ['Рассылка'],
+        ['Профилирование'],
         ['Главное меню'],
     ]
 
     callbacks = [
         ['admin_get_users'],
         ['admin_set_reminder'],
+        ['admin_import_catalog'],
+        ['admin_broadcast'],
+        ['admin_profiling'],
         ['main_menu'],
     ]
 
-    return text, await create_inline_menu(buttons, callbacks)
+    return build_inline_menu(buttons, callbacks)
+
+
+async def profiling_menu(running: bool, slow_updates: int) -> (str, InlineKeyboardMarkup):
+    """Меню профилирования.
+
+    :param running: Выполняется ли профилирование.
+    :param slow_updates: Кол-во записей в журнале медленных обновлений.
+    """
+    text = (f"Профилирование: {'выполняется' if running else 'выключено'}\n"
+            f"Медленных обновлений в журнале: {slow_updates}")
+    return text, _profiling_menu_markup()
+
+
+@memoize_markup
+def _profiling_menu_markup() -> InlineKeyboardMarkup:
+    buttons = [
+        ['Профиль по времени', 'Профиль по обновлениям'],
+        ['Медленные обновления'],
+        ['Админ меню'],
+    ]
+
+    callbacks = [
+        ['admin_profile_seconds', 'admin_profile_updates'],
+        ['admin_slow_updates'],
+        ['admin_menu'],
+    ]
+
+    return build_inline_menu(buttons, callbacks)
 
 
-async def categories_menu(categories: dict, page: int = 0) -> InlineKeyboardMarkup:
-    PAGE_SIZE = 5
-    text = 'Выберите категорию'
+# Кол-во администраторов на одной странице статистики пользователей
+ADMINS_PAGE_SIZE = 20
+
+
+async def admins_menu(admins: list, has_prev: bool = False, has_next: bool = False) -> InlineKeyboardMarkup:
+    """Меню страницы списка администраторов.
+
+    :param admins: Страница администраторов.
+    :param has_prev: Есть ли предыдущая страница.
+    :param has_next: Есть ли следующая страница.
+    """
+    buttons = []
+    page_buttons = []
+    if admins and has_prev:
+        page_buttons.append(InlineKeyboardButton(
+            text="◀️Назад", callback_data=AdminsPage(cursor=admins[0]['id'], forward=False).pack()))
+    if admins and has_next:
+        page_buttons.append(InlineKeyboardButton(
+            text="Далее▶️", callback_data=AdminsPage(cursor=admins[-1]['id'], forward=True).pack()))
+    if page_buttons:
+        buttons.append(page_buttons)
+    buttons.append([InlineKeyboardButton(text="Админ меню", callback_data='admin_menu')])
+    return InlineKeyboardMarkup(inline_keyboard=buttons)
+
+
+# Кол-во категорий на одной странице меню выбора категории
+CATEGORIES_PAGE_SIZE = 5
+# Максимальное кол-во видео на 1 странице меню выбора видео
+VIDEOS_PAGE_SIZE = 2
+
+
+async def categories_menu(categories: dict, has_prev: bool = False, has_next: bool = False) -> InlineKeyboardMarkup:
+    """Меню выбора категории.
+
+    :param categories: Страница категорий в виде словаря {ID категории: Название категории}.
+    :param has_prev: Есть ли предыдущая страница.
+    :param has_next: Есть ли следующая страница.
+    """
     keys = list(categories.keys())
-    start = page * PAGE_SIZE
-    end = start + PAGE_SIZE
-    buttons = [[categories[key]] for key in keys[start:end]]
-    buttons_callback = [["select_category_" + str(key)] for key in keys[start:end]]
-    if end < len(keys):
+    buttons = [[categories[key]] for key in keys]
+    buttons_callback = [[SelectCategory(subject_id=key).pack()] for key in keys]
+    if keys and has_next:
         buttons.append(["Далее"])
-        buttons_callback.append(["next_page_" + str(page + 1)])
-    if page > 0:
+        buttons_callback.append([CategoryPage(cursor=keys[-1], forward=True).pack()])
+    if keys and has_prev:
         buttons.append(["Назад"])
-        buttons_callback.append(["prev_page_" + str(page - 1)])
+        buttons_callback.append([CategoryPage(cursor=keys[0], forward=False).pack()])
     buttons.append(["Главное меню"])
     buttons_callback.append(["main_menu"])
     return await create_inline_menu(buttons, buttons_callback)
 
 
-async def under_video_menu(videos: list, video_index: int = 0, category_id: int = 0) -> InlineKeyboardMarkup:
+def video_page_cursor(videos: list, video_index: int, page_size: int) -> int:
+    """ Возвращает курсор (after_id) страницы списка видео по page_size видео, на которой находится videos[video_index] """
+    start = video_index - video_index % page_size
+    return videos[start - 1]['id'] if start else 0
+
+
+async def under_video_menu(videos: list, video_index: int = 0, category_id: int = 0,
+                           page_after_id: int = 0, page_size: int = None) -> InlineKeyboardMarkup:
+    """Меню под видео.
+
+    :param videos: Видео предмета по порядку (для кнопок предыдущего и следующего видео).
+    :param video_index: Индекс текущего видео в videos.
+    :param category_id: ID предмета.
+    :param page_after_id: Курсор страницы списка, на которую возвращает кнопка "Выбрать видео".
+    :param page_size: Размер страницы списка видео. Если задан - кнопки предыдущего и следующего видео
+    возвращают к списку на страницу своего видео.
+    """
     has_prev = video_index > 0
     has_next = video_index < len(videos) - 1
     current_video = videos[video_index] if videos else None
@@ -156,23 +288,25 @@ async def under_video_menu(videos: list, video_index: int = 0, category_id: int
     buttons.append([current_video['name']] if current_video else [])
     buttons_callback.append(["ignore"])
 
+    def select_video(index: int) -> str:
+        cursor = video_page_cursor(videos, index, page_size) if page_size else page_after_id
+        return SelectVideo(video_id=videos[index]['id'], subject_id=category_id, page_after_id=cursor).pack()
+
     page_buttons = []
     page_callback = []
-    # if has_prev:
-    #     page_buttons.append("⬅️Предыдущее видео WIP")
-    #     page_callback.append(f"prev_video_{category_id}_{video_index}")
-    # if has_next:
-    #     page_buttons.append("Следующее видео➡️ WIP")
-    #     page_callback.append(f"next_video_{category_id}_{video_index}")
-    #     logging.warning(f"next_video_{category_id}_{video_index}")
+    if has_prev:
+        page_buttons.append("⬅️Предыдущее видео")
+        page_callback.append(select_video(video_index - 1))
+    if has_next:
+        page_buttons.append("Следующее видео➡️")
+        page_callback.append(select_video(video_index + 1))
 
     if page_buttons:
         buttons.append(page_buttons)
         buttons_callback.append(page_callback)
 
     buttons.append(["Выбрать видео"])
-    buttons_callback.append([f'choose_video_{category_id}'])
-    logging.warning(f'choose_video_{category_id}')
+    buttons_callback.append([ChooseVideo(subject_id=category_id, after_id=page_after_id).pack()])
 
     buttons.append(["Выбрать категорию"])
     buttons_callback.append(['watch_video'])
@@ -181,29 +315,79 @@ async def under_video_menu(videos: list, video_index: int = 0, category_id: int
     return await create_inline_menu(buttons, buttons_callback)
 
 
-async def choose_video_menu(category_id: int, videos: list, page_index: int = 0) -> InlineKeyboardMarkup:
+async def change_video_message(message: Message, file_id: str, markup: InlineKeyboardMarkup) -> None:
+    """Заменяет видео и инлайн-меню сообщения одним запросом editMessageMedia.
+
+    Если в сообщении нет видео (например, это меню со списком категорий) или изменить его не удалось,
+    сообщение удаляется, а видео отправляется новым сообщением.
+    :param message: Сообщение бота, к которому относится нажатая кнопка.
+    :param file_id: ID файла видео в телеграм.
+    :param markup: Новая инлайн-разметка.
+    """
+    chat_id, message_id = message.chat.id, message.message_id
+    if message.video is not None:
+        try:
+            await bot.edit_message_media(media=InputMediaVideo(media=file_id), chat_id=chat_id,
+                                         message_id=message_id, reply_markup=markup)
+            return
+        except aiogram.exceptions.TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                return
+            logging.error(f"Error in change_video_message: {e}")
+    try:
+        await bot.delete_message(chat_id=chat_id, message_id=message_id)
+    except Exception as e:
+        logging.error(f"Невозможно удалить сообщение с id {message_id}: {e}")
+    await bot.send_video(chat_id=chat_id, video=file_id, reply_markup=markup)
+
+
+async def change_video_list_menu(message: Message, text: str, markup: InlineKeyboardMarkup) -> None:
+    """Заменяет меню под видео списком видео.
+
+    Видео остается в сообщении, а подпись и инлайн-меню меняются одним запросом editMessageCaption -
+    следующее выбранное видео снова подставляется в это же сообщение (см. change_video_message).
+    Если в сообщении нет видео или изменить его не удалось - меняется текстовое меню (change_inline_menu).
+    """
+    if message.video is not None:
+        try:
+            await bot.edit_message_caption(chat_id=message.chat.id, message_id=message.message_id, caption=text,
+                                           reply_markup=markup)
+            return
+        except aiogram.exceptions.TelegramBadRequest as e:
+            if 'message is not modified' in str(e):
+                return
+            logging.error(f"Error in change_video_list_menu: {e}")
+    await change_inline_menu(chat_id=message.chat.id, message_id=message.message_id, text=text, markup=markup)
+
+
+async def choose_video_menu(category_id: int, videos: list, has_prev: bool = False,
+                            has_next: bool = False, after_id: int = None) -> InlineKeyboardMarkup:
     """Меню выбора видео из указанной категории.
 
     :param category_id: ID категории.
-    :param videos: Список видео.
-    :param page_index: Номер страницы.
+    :param videos: Страница видео.
+    :param has_prev: Есть ли предыдущая страница.
+    :param has_next: Есть ли следующая страница.
+    :param after_id: Курсор, с которым была получена страница (after_id в get_videos_page_by_subject).
+    Если страница получена по before_id - курсор вычисляется по первому видео страницы.
     """
-    # Максимальное кол-во видео на 1 странице
-    max_videos_per_page = 2
-
-    pages = [videos[i:i + max_videos_per_page] for i in range(0, len(videos), max_videos_per_page)]
-    # TODO: CRITICAL!!! Решить проблему с колбэком кнопки с видео. Желательно использовать file_id (id файла телеграм), но судя по всему оно превышает допустимую длину в 64 байта.
-    buttons = [[InlineKeyboardButton(text=video['name'], callback_data=f'select_video_{video['id']}')] for video in
-               pages[page_index]]
+    if after_id is None:
+        after_id = videos[0]['id'] - 1 if videos else 0
+    buttons = [[InlineKeyboardButton(text=video['name'],
+                                     callback_data=SelectVideo(video_id=video['id'], subject_id=category_id,
+                                                               page_after_id=after_id).pack())]
+               for video in videos]
 
     page_buttons = []
 
-    if page_index > 0:
+    if videos and has_prev:
         page_buttons.append(
-            InlineKeyboardButton(text="◀️Назад", callback_data=f'prev_video_page_{category_id}_{page_index}'))
-    if page_index + 1 < len(pages):
+            InlineKeyboardButton(text="◀️Назад", callback_data=VideoPage(subject_id=category_id, cursor=videos[0]['id'],
+                                                                        forward=False).pack()))
+    if videos and has_next:
         page_buttons.append(
-            InlineKeyboardButton(text="Далее▶️", callback_data=f'next_video_page_{category_id}_{page_index}'))
+            InlineKeyboardButton(text="Далее▶️", callback_data=VideoPage(subject_id=category_id, cursor=videos[-1]['id'],
+                                                                        forward=True).pack()))
     if page_buttons:
         buttons.append(page_buttons)
     buttons.append([InlineKeyboardButton(text="Главное меню", callback_data='main_menu')])
@@ -213,13 +397,43 @@ async def choose_video_menu(category_id: int, videos: list, page_index: int = 0)
 # === CANCEL REMINDER ===
 
 async def create_cancel_button() -> InlineKeyboardMarkup:
+    return _cancel_button_markup()
+
+
+@memoize_markup
+def _cancel_button_markup() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(
         inline_keyboard=[[InlineKeyboardButton(text="Отмена", callback_data="cancel_reminder")]])
 
 
+async def create_admin_cancel_button() -> InlineKeyboardMarkup:
+    """ Кнопка отмены ввода в админ-меню (импорт каталога, рассылка) с возвратом в админ-меню """
+    return _admin_cancel_button_markup()
+
+
+@memoize_markup
+def _admin_cancel_button_markup() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        inline_keyboard=[[InlineKeyboardButton(text="Отмена", callback_data="admin_cancel")]])
+
+
 # === CALENDAR ===
 
+# Максимальное кол-во календарей в кэше
+CALENDAR_CACHE_SIZE = 256
+
+
 async def create_calendar(month, year):
+    today = datetime.date.today()
+    cache = _calendar_markup.cache
+    # Прошедшие дни в календаре скрываются, поэтому с наступлением нового дня кэш календарей сбрасывается
+    if cache and (next(iter(cache))[2] != today or len(cache) >= CALENDAR_CACHE_SIZE):
+        cache.clear()
+    return _calendar_markup(month, year, today)
+
+
+@memoize_markup
+def _calendar_markup(month: int, year: int, today: datetime.date) -> InlineKeyboardMarkup:
     inline_keyboard = []
     row = []
     row.append(InlineKeyboardButton(text=calendar.month_name[month] + " " + str(year), callback_data="ignore"))
@@ -237,17 +451,19 @@ async def create_calendar(month, year):
             if day == 0:
                 row.append(InlineKeyboardButton(text=" ", callback_data='ignore'))
             else:
-                if datetime.date.today() > datetime.date(year, month, day):
+                if today > datetime.date(year, month, day):
                     row.append(InlineKeyboardButton(text=" ", callback_data='ignore'))
                 else:
-                    date_str = datetime.datetime(year, month, day).strftime('%d-%m-%Y')
-                    row.append(InlineKeyboardButton(text=str(day), callback_data="select-day_" + date_str))
+                    row.append(InlineKeyboardButton(text=str(day),
+                                                    callback_data=SelectDay(year=year, month=month, day=day).pack()))
         inline_keyboard.append(row)
 
+    prev_year, prev_month = (year - 1, 12) if month == 1 else (year, month - 1)
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
     row = []
-    row.append(InlineKeyboardButton(text="<", callback_data='prev-month_' + str(year) + '_' + str(month)))
+    row.append(InlineKeyboardButton(text="<", callback_data=CalendarMonth(year=prev_year, month=prev_month).pack()))
     row.append(InlineKeyboardButton(text=" ", callback_data='ignore'))
-    row.append(InlineKeyboardButton(text=">", callback_data='next-month_' + str(year) + '_' + str(month)))
+    row.append(InlineKeyboardButton(text=">", callback_data=CalendarMonth(year=next_year, month=next_month).pack()))
     inline_keyboard.append(row)
 
     markup = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
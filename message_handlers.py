@@ -3,13 +3,16 @@ from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart
 from aiogram.types import Message
 
-from bot import dp
+from loader import dp
 from database_handlers.functions import *
 from menu_manager import *
 
 
 @dp.message(CommandStart())
 async def start(message: Message):
+    # Пользователь, заблокировавший бота, вернулся - снова включаем его в рассылки.
+    # Для пользователей, активных по данным кэша, запроса к БД нет
+    await activate_user(message.chat.id)
     if await is_user_in_db(message.chat.id):
         text, keyboard = await main_menu(message.chat.id)
     else:
@@ -0,0 +1,311 @@
+"""Метрики бота в текстовом формате Prometheus.
+
+Собираются:
+    bot_update_duration_seconds       - время обработки обновления по типу и обработчику (UpdateMetricsMiddleware);
+    bot_update_errors_total           - обновления, обработка которых завершилась исключением;
+    bot_db_query_duration_seconds     - время запроса к БД по имени запроса реестра (PreparedConnection);
+    bot_db_pool_wait_seconds          - время ожидания соединения из пула (ParentPostgresqlHandler.connection);
+    bot_api_request_duration_seconds  - время запроса к Bot API по методу и результату (ApiMetricsMiddleware);
+    bot_event_loop_lag_seconds        - задержка цикла событий;
+а также показатели, зарегистрированные через register_gauge (размер пула, очереди напоминаний и исходящих запросов).
+
+Метрики отдаются по адресу http://<METRICS_HOST>:<METRICS_PORT>/metrics, если задан METRICS_PORT.
+"""
+import asyncio
+import bisect
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.dispatcher.middlewares.base import BaseMiddleware
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+# Период измерения задержки цикла событий (в секундах)
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """ Показатель, значение которого вычисляется функцией в момент чтения метрик """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._function = function
+
+    def _samples(self) -> list[str]:
+        try:
+            return [f"{self.name} {float(self._function())}"]
+        except Exception as e:
+            logging.error(f"Error reading gauge {self.name}: {e}")
+            return []
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: [кол-во наблюдений в каждой корзине (не накопительно), сумма, кол-во]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self._buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self._buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def _samples(self) -> list[str]:
+        samples = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self._buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{bound}"')
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            samples.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            samples.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def add(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+update_duration = registry.add(Histogram('bot_update_duration_seconds', 'Time spent handling an update',
+                                         ('type', 'handler')))
+update_errors = registry.add(Counter('bot_update_errors_total', 'Updates whose handler raised an exception',
+                                     ('type', 'handler')))
+db_query_duration = registry.add(Histogram('bot_db_query_duration_seconds', 'Database query latency',
+                                           ('query',), DB_BUCKETS))
+db_pool_wait = registry.add(Histogram('bot_db_pool_wait_seconds', 'Time spent waiting for a pooled connection',
+                                      (), DB_BUCKETS))
+api_request_duration = registry.add(Histogram('bot_api_request_duration_seconds', 'Bot API request latency',
+                                              ('method', 'status')))
+
+_loop_lag = 0.0
+# Задача измерения задержки цикла событий. Цикл хранит задачи по слабым ссылкам, поэтому без этой ссылки
+# задачу может удалить сборщик мусора, и показатель перестанет обновляться
+_loop_lag_task: asyncio.Task | None = None
+registry.add(Gauge('bot_event_loop_lag_seconds', 'Delay of the event loop over a scheduled wakeup',
+                   lambda: _loop_lag))
+
+
+def register_gauge(name: str, documentation: str, function: Callable[[], float]) -> None:
+    """ Регистрирует показатель, значение которого вычисляется функцией при каждом чтении метрик """
+    registry.add(Gauge(name, documentation, function))
+
+
+def observe_query(name: str, seconds: float) -> None:
+    """ Учитывает запрос к БД в гистограмме и в сведениях о текущем обновлении """
+    db_query_duration.observe(seconds, query=name)
+    _account('db_queries', 'db_time', seconds)
+
+
+def observe_pool_wait(seconds: float) -> None:
+    """ Учитывает ожидание соединения из пула """
+    db_pool_wait.observe(seconds)
+    _account(None, 'pool_wait', seconds)
+
+
+# === UPDATES ===
+
+# Сведения об обрабатываемом обновлении: обработчик, кол-во и время запросов к БД и Bot API.
+# Словарь общий для задач, созданных при обработке обновления (они получают копию контекста)
+_current_update: ContextVar[dict | None] = ContextVar('metrics_update', default=None)
+# Функции, вызываемые после обработки каждого обновления: listener(update, info, duration)
+_update_listeners: list[Callable[[Any, dict, float], None]] = []
+
+
+def add_update_listener(listener: Callable[[Any, dict, float], None]) -> None:
+    """ Регистрирует функцию, получающую сведения о каждом обработанном обновлении """
+    _update_listeners.append(listener)
+
+
+def _account(count_key: str | None, time_key: str, seconds: float) -> None:
+    current = _current_update.get()
+    if current is not None:
+        if count_key is not None:
+            current[count_key] += 1
+        current[time_key] += seconds
+
+
+def set_handler_name(name: str) -> None:
+    """ Запоминает имя обработчика текущего обновления для метки handler """
+    current = _current_update.get()
+    if current is not None:
+        current['handler'] = name
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """ Внешний middleware обновлений: измеряет полное время обработки обновления """
+
+    async def __call__(self, handler: Callable[[Any, dict], Awaitable[Any]], event, data: dict) -> Any:
+        current = {'handler': 'unhandled', 'db_queries': 0, 'db_time': 0.0, 'pool_wait': 0.0,
+                   'api_calls': 0, 'api_time': 0.0, 'routed_at': None}
+        token = _current_update.set(current)
+        start = current['started_at'] = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            update_errors.inc(type=event.event_type, handler=current['handler'])
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            update_duration.observe(duration, type=event.event_type, handler=current['handler'])
+            _current_update.reset(token)
+            for listener in _update_listeners:
+                try:
+                    listener(event, current, duration)
+                except Exception as e:
+                    logging.error(f"Error in update listener {listener}: {e}")
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """ Внутренний middleware наблюдателей: запоминает имя выбранного обработчика """
+
+    async def __call__(self, handler: Callable[[Any, dict], Awaitable[Any]], event, data: dict) -> Any:
+        current = _current_update.get()
+        if current is not None:
+            # Время до этой точки - фильтры, внешние middleware и загрузка состояния FSM
+            current['routed_at'] = time.perf_counter()
+        handler_object = data.get('handler')
+        if handler_object is not None:
+            set_handler_name(handler_object.callback.__name__)
+        return await handler(event, data)
+
+
+# === BOT API ===
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """ Middleware сессии бота: измеряет время каждого запроса к Bot API """
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            api_request_duration.observe(seconds, method=method.__api_method__, status=status)
+            _account('api_calls', 'api_time', seconds)
+
+
+def setup(dispatcher, bot: Bot) -> None:
+    """Подключает сбор метрик к диспетчеру и сессии бота.
+
+    Middleware сессии регистрируется после OutboundDispatcher, поэтому время ожидания в очереди исходящих запросов
+    в задержку Bot API не входит (размер очереди - отдельный показатель).
+    """
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    for observer in (dispatcher.message, dispatcher.callback_query):
+        observer.middleware(HandlerNameMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+# === SERVER ===
+
+async def _measure_loop_lag() -> None:
+    global _loop_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        _loop_lag = max(loop.time() - start - LOOP_LAG_INTERVAL, 0.0)
+
+
+async def start_metrics_server(host: str = '127.0.0.1', port: int = 9100) -> web.AppRunner:
+    """ Запускает HTTP-сервер с метриками и измерение задержки цикла событий """
+    global _loop_lag_task
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def stop_loop_lag(_: web.Application) -> None:
+        global _loop_lag_task
+        if _loop_lag_task is not None:
+            _loop_lag_task.cancel()
+            _loop_lag_task = None
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    app.on_cleanup.append(stop_loop_lag)
+    # Запросы сборщика метрик не пишутся в журнал
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if _loop_lag_task is None:
+        _loop_lag_task = asyncio.create_task(_measure_loop_lag())
+    logging.info(f"Metrics server started on {host}:{port}/metrics")
+    return runner
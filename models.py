@@ -5,6 +5,8 @@ class Form(StatesGroup):
     time_input = State()
     text_input = State()
     finish_reminder = State()
+    catalog_import = State()
+    broadcast_text = State()
 
 
 class States(StatesGroup):
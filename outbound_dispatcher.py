@@ -0,0 +1,185 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod, Response
+from aiogram.methods.base import TelegramType
+
+# Приоритеты исходящих запросов: чем меньше число - тем раньше запрос будет отправлен
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+_priority = contextvars.ContextVar('outbound_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def bulk_sending():
+    """Помечает все запросы к Bot API внутри блока как массовые.
+
+    Массовые запросы (рассылки, напоминания) отправляются только после интерактивных ответов пользователям.
+    """
+    token = _priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Ограничитель частоты по алгоритму token bucket.
+
+    Токены восполняются со скоростью rate в секунду, но не больше capacity.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Забирает токен и возвращает время (в секундах), через которое им можно воспользоваться.
+
+        Токены могут уходить в минус - так ожидающие получают их строго по очереди.
+        """
+        self._refill()
+        self._tokens -= 1
+        delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        return max(delay, self._paused_until - time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """ Запрещает выдачу токенов на указанное время (например, после flood wait от Telegram) """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    @property
+    def is_idle(self) -> bool:
+        """ True - если корзина полная и не на паузе, то есть ее можно удалить без потери состояния """
+        self._refill()
+        return self._tokens >= self.capacity and self._paused_until <= time.monotonic()
+
+
+class OutboundDispatcher(BaseRequestMiddleware):
+    """Центральный диспетчер исходящих запросов к Bot API.
+
+    Подключается к сессии бота (bot.session.middleware), поэтому через него проходят все вызовы
+    bot.send_message, send_video, edit_message_text, delete_message и т.д. без изменения мест вызова.
+    Запросы, адресованные чату, проходят через:
+        - ограничение частоты для конкретного чата;
+        - глобальное ограничение частоты (token bucket);
+        - ограничение кол-ва одновременных запросов;
+        - очередь с приоритетами (интерактивные ответы раньше массовых отправок).
+    При TelegramRetryAfter чат ставится на паузу на указанное время, и запрос повторяется.
+    """
+
+    # Кол-во чатов, после которого из памяти удаляются ограничители неактивных чатов
+    MAX_TRACKED_CHATS = 10000
+
+    def __init__(self, rate: float = 30, chat_rate: float = 1, chat_burst: int = 5, concurrency: int = 16,
+                 max_retries: int = 3):
+        """
+        :param rate: Глобальное кол-во запросов в секунду.
+        :param chat_rate: Кол-во запросов в секунду в один чат.
+        :param chat_burst: Кол-во запросов в один чат, которые можно отправить без ожидания.
+        :param concurrency: Максимальное кол-во одновременно выполняемых запросов.
+        :param max_retries: Кол-во повторов запроса после TelegramRetryAfter.
+        """
+        self._global = TokenBucket(rate, rate)
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._chats: dict[int | str, TokenBucket] = {}
+        self._concurrency = concurrency
+        self._max_retries = max_retries
+        self._active = 0
+        self._released = asyncio.Event()
+        # Куча ожидающих запросов: (приоритет, порядковый номер, future)
+        self._waiters = []
+        self._seq = itertools.count()
+        self._pump_task = None
+
+    @property
+    def queue_size(self) -> int:
+        """ Кол-во запросов, ожидающих отправки """
+        return len(self._waiters)
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = getattr(method, 'chat_id', None)
+        for attempt in range(self._max_retries + 1):
+            if chat_id is not None:
+                await self._acquire(chat_id)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self._max_retries:
+                    raise
+                logging.warning(f"Flood wait {e.retry_after}s on {type(method).__name__} (chat {chat_id})")
+                if chat_id is not None:
+                    self._chat_bucket(chat_id).pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
+            finally:
+                if chat_id is not None:
+                    self._release()
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_TRACKED_CHATS:
+                self._chats = {key: value for key, value in self._chats.items() if not value.is_idle}
+            bucket = self._chats[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    async def _acquire(self, chat_id: int | str) -> None:
+        """ Ожидает разрешения на отправку запроса в чат """
+        delay = self._chat_bucket(chat_id).reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_priority.get(), next(self._seq), future))
+        if self._pump_task is None:
+            self._pump_task = asyncio.create_task(self._pump())
+        try:
+            await future
+        except asyncio.CancelledError:
+            # Разрешение могло быть выдано прямо перед отменой - возвращаем его
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._active -= 1
+        self._released.set()
+
+    async def _pump(self) -> None:
+        """ Выдает разрешения ожидающим запросам в порядке приоритета с учетом глобальных ограничений """
+        try:
+            while self._waiters:
+                while self._active >= self._concurrency:
+                    self._released.clear()
+                    await self._released.wait()
+                delay = self._global.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Разрешение получает самый приоритетный запрос на момент выдачи
+                while self._waiters:
+                    _, _, future = heapq.heappop(self._waiters)
+                    if not future.done():
+                        self._active += 1
+                        future.set_result(None)
+                        break
+        finally:
+            self._pump_task = None
@@ -0,0 +1,235 @@
+"""Профилирование бота в работе.
+
+SamplingProfiler - семплирующий профилировщик цикла событий: отдельный поток каждые PROFILE_INTERVAL_MS
+снимает стек потока, в котором работает цикл событий, и считает одинаковые стеки. Результат записывается
+в каталог PROFILE_DIR в формате collapsed stacks ("модуль:функция;модуль:функция <кол-во>"), который
+принимают flamegraph.pl, speedscope и другие инструменты. Профилирование включается из админ-меню или
+сигналом SIGUSR1 (kill -USR1 <pid>) на PROFILE_SECONDS секунд либо на PROFILE_UPDATES обновлений.
+
+SlowUpdateLog - журнал медленных обновлений: каждое обновление, обработка которого заняла больше
+SLOW_UPDATE_THRESHOLD_MS, записывается в кольцевой буфер на SLOW_UPDATES_BUFFER записей с данными колбэка,
+именем обработчика, кол-вом запросов к БД и разбивкой времени по этапам. Буфер выгружается из админ-меню.
+
+StartupTimer - замер фаз запуска процесса (импорт, подключение к БД, проверка схемы, прогрев): после запуска
+в лог выводится отчет с началом и длительностью каждой фазы, в том числе выполнявшихся параллельно.
+"""
+import asyncio
+import collections
+import contextlib
+import datetime
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Awaitable, Callable
+
+
+class SamplingProfiler:
+    """ Семплирующий профилировщик потока цикла событий """
+
+    def __init__(self, directory: str = 'profiles', interval: float = 0.005):
+        """
+        :param directory: Каталог, в который записываются профили.
+        :param interval: Интервал между снимками стека (в секундах).
+        """
+        self._directory = directory
+        self._interval = interval
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._updates_left: int | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, seconds: float | None = None, updates: int | None = None,
+              on_finish: Callable[[str | None], Awaitable[None]] | None = None) -> bool:
+        """Запускает профилирование потока, в котором работает текущий цикл событий.
+
+        Профилирование останавливается через seconds секунд или после обработки updates обновлений
+        (что наступит раньше); если не задано ни то, ни другое - через 30 секунд.
+        :param on_finish: Корутина, вызываемая в цикле событий с путем к файлу профиля (None - профиль не записан).
+        :return: False - если профилирование уже выполняется.
+        """
+        if self.running:
+            return False
+        if seconds is None and updates is None:
+            seconds = 30
+        loop = asyncio.get_running_loop()
+        self._stop.clear()
+        self._updates_left = updates
+        self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True,
+                                        args=(threading.get_ident(), seconds, loop, on_finish))
+        self._thread.start()
+        logging.info(f"Profiling started (seconds: {seconds}, updates: {updates})")
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def observe(self, update, info: dict, duration: float) -> None:
+        """ Отсчитывает обработанное обновление для остановки по кол-ву обновлений (metrics.add_update_listener) """
+        if self._updates_left is not None:
+            self._updates_left -= 1
+            if self._updates_left <= 0:
+                self._stop.set()
+
+    def _sample(self, target: int, seconds: float | None, loop: asyncio.AbstractEventLoop,
+                on_finish: Callable[[str | None], Awaitable[None]] | None) -> None:
+        stacks = collections.Counter()
+        deadline = time.monotonic() + seconds if seconds is not None else None
+        samples = 0
+        while not self._stop.wait(self._interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                break
+            stacks[self._collapse(frame)] += 1
+            samples += 1
+
+        path = self._write(stacks)
+        logging.info(f"Profiling finished: {samples} samples, {len(stacks)} unique stacks, saved to {path}")
+        self._thread = None
+        self._updates_left = None
+        if on_finish is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(lambda: asyncio.ensure_future(on_finish(path)))
+
+    @staticmethod
+    def _collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+            names.append(f"{module}:{code.co_name}")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _write(self, stacks: collections.Counter) -> str | None:
+        if not stacks:
+            return None
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            path = os.path.join(self._directory,
+                                f"profile-{os.getpid()}-{datetime.datetime.now():%Y%m%d-%H%M%S}.collapsed")
+            with open(path, 'w', encoding='utf-8') as file:
+                for stack, count in stacks.most_common():
+                    file.write(f"{stack} {count}\n")
+            return path
+        except OSError as e:
+            logging.error(f"Error writing profile: {e}")
+            return None
+
+
+class SlowUpdateLog:
+    """ Кольцевой буфер сведений о медленных обновлениях """
+
+    def __init__(self, threshold: float = 0.5, size: int = 100):
+        """
+        :param threshold: Время обработки обновления (в секундах), начиная с которого оно считается медленным.
+        :param size: Кол-во последних медленных обновлений, хранящихся в буфере.
+        """
+        self._threshold = threshold
+        self._entries: collections.deque[dict] = collections.deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def observe(self, update, info: dict, duration: float) -> None:
+        """ Записывает обновление в буфер, если оно обрабатывалось дольше порога (metrics.add_update_listener) """
+        if duration < self._threshold:
+            return
+        routed_at = info['routed_at']
+        routing = routed_at - info['started_at'] if routed_at is not None else duration
+        entry = {
+            'time': datetime.datetime.now(),
+            'update_id': update.update_id,
+            'type': update.event_type,
+            'data': self._event_data(update),
+            'handler': info['handler'],
+            'duration': duration,
+            'db_queries': info['db_queries'],
+            'api_calls': info['api_calls'],
+            'phases': {
+                'routing': routing,
+                'pool_wait': info['pool_wait'],
+                'db': info['db_time'],
+                'bot_api': info['api_time'],
+                # Время собственного кода обработчика; при параллельных запросах может быть занижено
+                'code': max(duration - routing - info['pool_wait'] - info['db_time'] - info['api_time'], 0.0),
+            },
+        }
+        self._entries.append(entry)
+        logging.warning(f"Slow update {entry['update_id']} ({entry['handler']}, {entry['data']!r}): "
+                        f"{duration * 1000:.0f} ms, {self._format_phases(entry['phases'])}")
+
+    @staticmethod
+    def _event_data(update) -> str:
+        if update.callback_query is not None:
+            return update.callback_query.data or ''
+        if update.message is not None:
+            return (update.message.text or update.message.content_type)[:64]
+        return ''
+
+    @staticmethod
+    def _format_phases(phases: dict) -> str:
+        return ', '.join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items())
+
+    def dump(self) -> str:
+        """ Возвращает содержимое буфера в текстовом виде (от новых записей к старым) """
+        lines = []
+        for entry in reversed(self._entries):
+            lines.append(f"{entry['time']:%Y-%m-%d %H:%M:%S} update {entry['update_id']} {entry['type']} "
+                         f"handler={entry['handler']} data={entry['data']!r}\n"
+                         f"    total {entry['duration'] * 1000:.0f} ms, DB queries: {entry['db_queries']}, "
+                         f"Bot API calls: {entry['api_calls']}\n"
+                         f"    {self._format_phases(entry['phases'])}")
+        return '\n'.join(lines)
+
+
+def install_signal_handler(profiler: SamplingProfiler, seconds: float) -> None:
+    """ Включает профилирование на seconds секунд по сигналу SIGUSR1 """
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, lambda: profiler.start(seconds=seconds))
+    except (NotImplementedError, RuntimeError) as e:
+        logging.error(f"Could not install profiling signal handler: {e}")
+
+
+class StartupTimer:
+    """ Замеряет фазы запуска процесса """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        # Фазы в порядке начала: (название, начало от старта процесса, длительность) в секундах
+        self.phases: list[tuple[str, float, float]] = []
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self._started, time.perf_counter() - start))
+
+    async def run(self, name: str, awaitable: Awaitable):
+        """Выполняет шаг запуска как фазу name.
+
+        Ошибка шага записывается в лог и не прерывает запуск: шаги, выполняемые через run, только ускоряют
+        обработку первых обновлений.
+        """
+        with self.phase(name):
+            try:
+                return await awaitable
+            except Exception as e:
+                logging.error(f"Startup phase {name} failed: {e}")
+
+    def report(self) -> str:
+        total = time.perf_counter() - self._started
+        lines = [f"Startup finished in {total * 1000:.0f} ms"]
+        for name, start, duration in sorted(self.phases, key=lambda phase: phase[1]):
+            lines.append(f"  {name:<16} +{start * 1000:7.0f} ms  {duration * 1000:7.0f} ms")
+        return '\n'.join(lines)
@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timezone
+
+from aiogram import Bot
+
+from outbound_dispatcher import bulk_sending
+
+
+class ReminderScheduler:
+    """Планировщик напоминаний.
+
+    Хранит ближайшие напоминания в min-куче, упорядоченной по date_time, и спит до срока ближайшего из них.
+    Пока ни одно напоминание не наступило - к базе данных запросов нет.
+    Новые напоминания передаются методом push, который сразу будит планировщик.
+    """
+
+    # Пауза перед повторной загрузкой напоминаний, если база данных недоступна (в секундах)
+    RETRY_DELAY = 60
+    # Пауза перед повторной попыткой, если наступившие по часам бота напоминания не удалось забрать из БД (в секундах)
+    CLAIM_RETRY_DELAY = 1
+
+    def __init__(self, reminders_handler, batch_size: int = 1000):
+        """
+        :param reminders_handler: Обработчик таблицы напоминаний (PostgresqlRemindersHandler).
+        :param batch_size: Максимальное кол-во напоминаний, загружаемых в кучу или забираемых на отправку за один раз.
+        """
+        self._reminders_handler = reminders_handler
+        self._batch_size = batch_size
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        # Срок самого позднего загруженного напоминания.
+        # None - в куче находятся все напоминания из базы данных.
+        self._horizon = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    async def load(self) -> bool:
+        """Загружает ближайшие напоминания из базы данных в кучу.
+
+        :return: True - если загрузка прошла успешно.
+        """
+        reminders = await self._reminders_handler.get_upcoming_reminders(limit=self._batch_size)
+        if reminders is None:
+            return False
+        self._heap = [(r['date_time'], r['id'], r['username'], r['text']) for r in reminders]
+        heapq.heapify(self._heap)
+        # Если загружена полная пачка - в базе могут остаться более поздние напоминания
+        self._horizon = reminders[-1]['date_time'] if len(reminders) >= self._batch_size else None
+        logging.info(f"Reminder scheduler loaded {len(self._heap)} reminders")
+        return True
+
+    def push(self, reminder_id: int, date_time: datetime, username: str, text: str) -> None:
+        """Добавляет новое напоминание в кучу и будит планировщик.
+
+        :param reminder_id: ID напоминания в БД.
+        :param date_time: Дата и время напоминания (с часовым поясом).
+        :param username: Username пользователя.
+        :param text: Текст напоминания.
+        """
+        if self._horizon is not None and date_time > self._horizon:
+            # Напоминание позже загруженных - оно будет подгружено из БД вместе со следующей пачкой
+            return
+        heapq.heappush(self._heap, (date_time, reminder_id, username, text))
+        self._wakeup.set()
+
+    async def run(self, bot: Bot) -> None:
+        """Основной цикл планировщика.
+
+        :param bot: Экземпляр бота для отправки напоминаний.
+        """
+        while not await self.load():
+            await asyncio.sleep(self.RETRY_DELAY)
+
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                if self._horizon is not None:
+                    # Загруженная пачка закончилась - подгружаем следующую
+                    if not await self.load():
+                        await asyncio.sleep(self.RETRY_DELAY)
+                    continue
+                # Напоминаний нет - ждем добавления нового
+                await self._wakeup.wait()
+                continue
+
+            delay = (self._heap[0][0] - datetime.now(timezone.utc)).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._send_due(bot)
+
+    async def _send_due(self, bot: Bot) -> None:
+        """Отправляет все напоминания, срок которых наступил.
+
+        Куча служит только подсказкой о сроках: сами напоминания забираются из БД пачками через claim_due_reminders,
+        поэтому несколько экземпляров бота могут работать с одной таблицей без повторных отправок.
+        Напоминания из кучи, которые не удалось забрать (часы бота спешат относительно NOW() базы данных или
+        напоминание уже забрал другой экземпляр), возвращаются в кучу, а после короткой паузы куча загружается
+        из БД заново - так они не теряются до перезапуска.
+        """
+        now = datetime.now(timezone.utc)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap))
+
+        claimed = set()
+        while True:
+            reminders = await self._reminders_handler.claim_due_reminders(limit=self._batch_size)
+            if reminders is None:
+                # База данных недоступна - возвращаем напоминания в кучу и повторяем попытку позже
+                for item in due:
+                    if item[1] not in claimed:
+                        heapq.heappush(self._heap, item)
+                await asyncio.sleep(self.RETRY_DELAY)
+                return
+            claimed.update(reminder['id'] for reminder in reminders)
+            if reminders:
+                # Напоминания отправляются параллельно, частоту и кол-во одновременных запросов ограничивает OutboundDispatcher
+                with bulk_sending():
+                    await asyncio.gather(*(self._send_reminder(bot, reminder) for reminder in reminders))
+            if len(reminders) < self._batch_size:
+                break
+
+        unclaimed = [item for item in due if item[1] not in claimed]
+        if unclaimed:
+            for item in unclaimed:
+                heapq.heappush(self._heap, item)
+            await asyncio.sleep(self.CLAIM_RETRY_DELAY)
+            # Напоминания, забранные другим экземпляром, исчезают из кучи при загрузке
+            await self.load()
+
+    @staticmethod
+    async def _send_reminder(bot: Bot, reminder) -> None:
+        if reminder['chat_id'] is None:
+            logging.error(f"Reminder {reminder['id']}: user {reminder['username']} not found")
+            return
+        try:
+            await bot.send_message(chat_id=reminder['chat_id'], text=f"НАПОМИНАНИЕ!\n{reminder['text']}")
+        except Exception as e:
+            logging.error(f"Error sending reminder {reminder['id']} to {reminder['username']}: {e}")
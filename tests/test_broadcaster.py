@@ -0,0 +1,118 @@
+import asyncio
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from benchmarks.fake_bot_api import FakeBotApi
+from broadcaster import Broadcaster
+from database_handlers.sqlite_handler import ParentSqliteHandler, SqliteBroadcastHandler, SqliteHandler
+from database_handlers.user_cache import MISSING, UserCache
+
+ADMIN_CHAT_ID = 1
+USERS = 7
+CHUNK_SIZE = 3
+# Пользователи 1..USERS имеют chat_id 1000 + id, пользователи 2 и 5 заблокировали бота
+BLOCKED = {1002, 1005}
+RECIPIENTS = [1000 + user_id for user_id in range(1, USERS + 1)]
+
+
+async def _run(path, scenario):
+    """ Выполняет сценарий с базой SQLite из USERS пользователей и ботом, подключенным к FakeBotApi """
+    api = FakeBotApi()
+    api.blocked_chats.update(BLOCKED)
+    bot = Bot('1:test', session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start(port=0))))
+    await ParentSqliteHandler.open_connection(str(path))
+    try:
+        users_handler = SqliteHandler()
+        await users_handler.set_table('users')
+        broadcasts_handler = SqliteBroadcastHandler()
+        await users_handler.create_table_if_not_exist()
+        await broadcasts_handler.create_table_if_not_exist()
+        for chat_id in RECIPIENTS:
+            await users_handler.insert_user(chat_id, f'user{chat_id}', 'User', 'user')
+        await scenario(api, bot, users_handler, broadcasts_handler)
+    finally:
+        await ParentSqliteHandler.close_connection()
+        await bot.session.close()
+        await api.stop()
+
+
+async def _wait(broadcaster: Broadcaster) -> None:
+    while len(broadcaster):
+        await asyncio.sleep(0.01)
+
+
+async def _broadcast(broadcasts_handler, broadcast_id: int) -> dict:
+    row = await broadcasts_handler.read(None, lambda conn: conn.execute("SELECT * FROM broadcasts WHERE id = ?",
+                                                                        (broadcast_id,)).fetchone())
+    return dict(row)
+
+
+def _assert_finished(api: FakeBotApi, broadcast: dict) -> None:
+    assert broadcast['finished_at'] is not None
+    assert (broadcast['last_user_id'], broadcast['sent'], broadcast['failed'], broadcast['blocked']) == (USERS, 5, 0, 2)
+    status = api.chats[ADMIN_CHAT_ID]['text']
+    assert f"Рассылка #{broadcast['id']} завершена" in status
+    assert f"Обработано: {USERS} из {USERS}" in status
+    assert "Отправлено: 5, ошибок: 0, заблокировали бота: 2" in status
+
+
+def test_broadcast_checkpoints_and_blocked_users(tmp_path):
+    async def scenario(api, bot, users_handler, broadcasts_handler):
+        cache = UserCache(maxsize=100, ttl=3600, negative_ttl=30)
+        for chat_id in RECIPIENTS:
+            cache.put(dict(await users_handler.get_user_by_id(chat_id)))
+        checkpoints = []
+        save_progress = broadcasts_handler.save_progress
+
+        async def recording_save_progress(broadcast_id, last_user_id, *args):
+            checkpoints.append(last_user_id)
+            return await save_progress(broadcast_id, last_user_id, *args)
+
+        broadcasts_handler.save_progress = recording_save_progress
+        broadcaster = Broadcaster(users_handler, broadcasts_handler, cache, chunk_size=CHUNK_SIZE)
+
+        broadcast_id = await broadcaster.start(bot, ADMIN_CHAT_ID, 'Новость')
+        await _wait(broadcaster)
+
+        assert checkpoints == [3, 6, 7]
+        _assert_finished(api, await _broadcast(broadcasts_handler, broadcast_id))
+        for chat_id in RECIPIENTS:
+            active = chat_id not in BLOCKED
+            assert bool((await users_handler.get_user_by_id(chat_id))['is_active']) == active
+            # Заблокировавшие бота удалены из кэша, остальные записи не тронуты
+            assert (cache.get(chat_id) is MISSING) != active
+            if active:
+                assert api.chats[chat_id]['text'] == 'Новость'
+
+        # Следующая рассылка не отправляется заблокировавшим бота
+        api.reset()
+        await broadcaster.start(bot, ADMIN_CHAT_ID, 'Еще новость')
+        await _wait(broadcaster)
+        assert api.calls['sendMessage'] == 1 + USERS - len(BLOCKED)
+
+    asyncio.run(_run(tmp_path / 'bot.db', scenario))
+
+
+def test_broadcast_resumes_from_checkpoint(tmp_path):
+    async def scenario(api, bot, users_handler, broadcasts_handler):
+        # Рассылка прервана остановкой бота после первой пачки: пользователи 1..3 обработаны, 2 заблокировал бота
+        broadcast = await broadcasts_handler.create_broadcast(ADMIN_CHAT_ID, 'Новость', USERS)
+        status = await bot.send_message(ADMIN_CHAT_ID, 'Рассылка запущена')
+        await broadcasts_handler.set_status_message(broadcast['id'], status.message_id)
+        assert await broadcasts_handler.save_progress(broadcast['id'], 3, 2, 0, [2])
+        api.reset()
+
+        broadcaster = Broadcaster(users_handler, broadcasts_handler, chunk_size=CHUNK_SIZE)
+        await broadcaster.resume(bot)
+        await _wait(broadcaster)
+
+        # Отправлены только сообщения после контрольной точки
+        assert api.calls['sendMessage'] == USERS - 3
+        assert not {1001, 1003} & api.chats.keys()
+        _assert_finished(api, await _broadcast(broadcasts_handler, broadcast['id']))
+        assert api.chats[ADMIN_CHAT_ID]['message_id'] == status.message_id
+        assert await broadcasts_handler.get_unfinished_broadcasts() == []
+
+    asyncio.run(_run(tmp_path / 'bot.db', scenario))
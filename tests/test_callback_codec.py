@@ -0,0 +1,122 @@
+import pytest
+from aiogram.filters.callback_data import MAX_CALLBACK_LENGTH
+
+import callback_codec
+from callback_codec import SHORT_KEY_MARK, PackedCallbackData, ShortKeyTable, _b64decode, _b64encode
+from callbacks import SelectVideo
+
+
+class Sample(PackedCallbackData, prefix='t'):
+    number: int
+    flag: bool
+    text: str
+
+
+class Other(PackedCallbackData, prefix='o'):
+    number: int
+    flag: bool
+    text: str
+
+
+@pytest.mark.parametrize('number', [0, 1, -1, 63, -64, 64, 127, 128, 2 ** 31, -2 ** 31, 2 ** 63 - 1, -2 ** 63,
+                                    2 ** 64, -2 ** 64 - 1, 10 ** 30, -10 ** 30])
+def test_int_roundtrip(number):
+    data = Sample(number=number, flag=True, text='')
+    assert Sample.unpack(data.pack()) == data
+
+
+@pytest.mark.parametrize('text', ['', 'a', 'Лекция 1', 'x:y:z', '🎬'])
+def test_str_and_bool_roundtrip(text):
+    for flag in (False, True):
+        data = Sample(number=-5, flag=flag, text=text)
+        assert Sample.unpack(data.pack()) == data
+
+
+def test_select_video_is_compact():
+    data = SelectVideo(video_id=123456, subject_id=789, page_after_id=123450)
+    packed = data.pack()
+    assert packed.startswith('sv:') and len(packed) < len(f'sv:{123456}:{789}:{123450}')
+    assert SelectVideo.unpack(packed) == data
+
+
+def test_small_ints_take_one_byte():
+    # версия + 3 однобайтовых varint + 2 байта контрольной суммы
+    packed = SelectVideo(video_id=-64, subject_id=63, page_after_id=0).pack()
+    assert len(_b64decode(packed.partition(':')[2])) == 1 + 3 + 2
+
+
+def _tamper(packed: str, change) -> str:
+    prefix, _, encoded = packed.partition(':')
+    return f"{prefix}:{_b64encode(change(bytearray(_b64decode(encoded))))}"
+
+
+def _flip_byte(index):
+    def change(body):
+        body[index] ^= 0x01
+        return bytes(body)
+    return change
+
+
+@pytest.mark.parametrize('change', [
+    _flip_byte(1),                      # поле
+    _flip_byte(-1),                     # контрольная сумма
+    lambda body: bytes(body[:-1]),      # обрезанная контрольная сумма
+    lambda body: bytes(body[:1] + body[2:]),  # пропущенный байт поля
+    lambda body: bytes(body[:2]),       # почти пустые данные
+])
+def test_corrupted_payload_is_rejected(change):
+    packed = Sample(number=300, flag=True, text='abc').pack()
+    with pytest.raises(ValueError):
+        Sample.unpack(_tamper(packed, change))
+
+
+def test_truncated_string_is_rejected():
+    packed = Sample(number=1, flag=False, text='abcdef').pack()
+    with pytest.raises(ValueError):
+        Sample.unpack(packed[:-3])
+
+
+def test_other_version_prefix_and_encoding_are_rejected():
+    packed = Sample(number=1, flag=False, text='a').pack()
+
+    def other_version(body):
+        body[0] = callback_codec.CODEC_VERSION + 1
+        return bytes(body)
+
+    with pytest.raises(ValueError):
+        Sample.unpack(_tamper(packed, other_version))
+    # Контрольная сумма учитывает prefix: данные другого класса с теми же полями не принимаются
+    with pytest.raises(ValueError):
+        Sample.unpack('t:' + Other(number=1, flag=False, text='a').pack().partition(':')[2])
+    with pytest.raises(ValueError):
+        Sample.unpack(packed.replace('t:', 'o:', 1))
+    with pytest.raises(ValueError):
+        Sample.unpack('t:*not base64*')
+
+
+def test_long_payload_uses_short_key(monkeypatch):
+    monkeypatch.setattr(callback_codec, 'short_key_table', ShortKeyTable(maxsize=2))
+    data = Sample(number=2 ** 100, flag=True, text='Очень длинное название видео ' * 3)
+    packed = data.pack()
+    assert len(packed.encode()) <= MAX_CALLBACK_LENGTH
+    assert packed.startswith(f't:{SHORT_KEY_MARK}')
+    assert Sample.unpack(packed) == data
+    # Повторная упаковка тех же данных дает тот же ключ
+    assert data.pack() == packed
+    assert len(callback_codec.short_key_table) == 1
+
+
+def test_short_key_expires_after_eviction(monkeypatch):
+    monkeypatch.setattr(callback_codec, 'short_key_table', ShortKeyTable(maxsize=2))
+    packed = [Sample(number=n, flag=True, text='x' * 60).pack() for n in range(3)]
+    assert Sample.unpack(packed[2]).number == 2
+    with pytest.raises(ValueError):
+        Sample.unpack(packed[0])
+
+
+@pytest.mark.parametrize('length', range(0, 60, 7))
+def test_packed_data_fits_callback_limit(length):
+    data = Sample(number=-2 ** 70, flag=False, text='я' * length)
+    packed = data.pack()
+    assert len(packed.encode()) <= MAX_CALLBACK_LENGTH
+    assert Sample.unpack(packed) == data
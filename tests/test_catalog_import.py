@@ -0,0 +1,46 @@
+import asyncio
+import io
+
+from database_handlers.catalog_import import read_manifest
+from database_handlers.sqlite_handler import ParentSqliteHandler, SqliteVideoHandler
+
+MANIFEST = """faculty,subject,teacher,name,file_id
+ФИТ,Алгебра,Иванов,Лекция 1,file_1
+ФИТ,Алгебра,Иванов,Лекция 2,file_2
+"""
+
+
+async def _run(path, scenario):
+    await ParentSqliteHandler.open_connection(str(path))
+    try:
+        handler = SqliteVideoHandler()
+        await handler.create_table_if_not_exist()
+        await scenario(handler)
+    finally:
+        await ParentSqliteHandler.close_connection()
+
+
+def test_import_bumps_catalog_version(tmp_path):
+    async def scenario(handler):
+        assert await handler.get_catalog_version() == 0
+        stats = await handler.import_catalog(read_manifest(io.StringIO(MANIFEST), 'csv'))
+        assert stats['videos'] == 2
+        assert await handler.get_catalog_version() == 1
+        # Повторный импорт тоже увеличивает версию - процессы бота перечитают каталог
+        await handler.import_catalog(read_manifest(io.StringIO(MANIFEST), 'csv'))
+        assert await handler.get_catalog_version() == 2
+
+    asyncio.run(_run(tmp_path / 'bot.db', scenario))
+
+
+def test_failed_import_keeps_catalog_version(tmp_path):
+    def broken_records():
+        yield 'ФИТ', 'Алгебра', 'Иванов', 'Лекция 1', 'file_1'
+        raise ValueError("Manifest row 2 has empty fields")
+
+    async def scenario(handler):
+        assert await handler.import_catalog(broken_records()) is None
+        assert await handler.get_catalog_version() == 0
+        assert await handler.get_videos_by_subject_id(1) == []
+
+    asyncio.run(_run(tmp_path / 'bot.db', scenario))
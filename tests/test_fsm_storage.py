@@ -0,0 +1,72 @@
+import asyncio
+import datetime
+import time
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+import fsm_storage
+from fsm_storage import FakeRedis, create_redis_storage, create_storage
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+class Form(StatesGroup):
+    date = State()
+
+
+def test_state_roundtrip():
+    async def scenario():
+        storage = create_storage('fake-redis')
+        assert await storage.get_state(KEY) is None
+        await storage.set_state(KEY, Form.date)
+        assert await storage.get_state(KEY) == Form.date.state
+        await storage.set_state(KEY, None)
+        assert await storage.get_state(KEY) is None
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_data_roundtrip_with_datetime():
+    data = {
+        'text': 'Позвонить',
+        'date': datetime.date(2024, 2, 29),
+        'time': datetime.time(9, 30, 15, 500),
+        'date_time': datetime.datetime(2024, 2, 29, 9, 30, tzinfo=datetime.timezone.utc),
+    }
+
+    async def scenario():
+        redis = FakeRedis()
+        storage = create_redis_storage(redis)
+        await storage.set_data(KEY, data)
+        assert await storage.get_data(KEY) == data
+        # Данные хранятся компактно и без экранирования кириллицы
+        raw = next(value for value, _ in redis._data.values())
+        assert 'Позвонить'.encode() in raw and b' ' not in raw
+        await storage.set_data(KEY, {})
+        assert await storage.get_data(KEY) == {}
+        assert not redis._data
+
+    asyncio.run(scenario())
+
+
+def test_keys_expire(monkeypatch):
+    now = time.monotonic()
+    monkeypatch.setattr(fsm_storage.time, 'monotonic', lambda: now)
+
+    async def scenario():
+        storage = create_storage('fake-redis')
+        await storage.set_state(KEY, Form.date)
+        await storage.set_data(KEY, {'text': 'a'})
+        return storage
+
+    storage = asyncio.run(scenario())
+
+    async def check():
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    now += fsm_storage.STATE_TTL - 1
+    assert asyncio.run(check()) == (Form.date.state, {'text': 'a'})
+    now += 1
+    assert asyncio.run(check()) == (None, {})
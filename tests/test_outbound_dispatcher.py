@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+import pytest
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.exceptions import TelegramRetryAfter
+
+from benchmarks.fake_bot_api import FakeBotApi
+from outbound_dispatcher import OutboundDispatcher
+
+# Допуск на неточность таймеров цикла событий (в секундах)
+TOLERANCE = 0.05
+
+
+async def _run(scenario, **dispatcher_kwargs):
+    """ Выполняет сценарий с ботом, запросы которого идут через OutboundDispatcher в FakeBotApi """
+    api = FakeBotApi()
+    bot = Bot('1:test', session=AiohttpSession(api=TelegramAPIServer.from_base(await api.start(port=0))))
+    bot.session.middleware(OutboundDispatcher(**dispatcher_kwargs))
+    try:
+        await scenario(api, bot)
+    finally:
+        await bot.session.close()
+        await api.stop()
+
+
+def _times(api: FakeBotApi, chat_id=None) -> list[float]:
+    return sorted(moment for moment, _, chat in api.requests if chat_id is None or chat == chat_id)
+
+
+def _assert_rate(times: list[float], rate: float, burst: float) -> None:
+    """ k-й запрос (с нуля) отправлен не раньше, чем через (k + 1 - burst) / rate секунд после первого """
+    for k, moment in enumerate(times):
+        assert moment - times[0] >= (k + 1 - burst) / rate - TOLERANCE, f"request {k} sent too early"
+
+
+def test_global_rate_is_respected():
+    rate, chats = 40, 100
+
+    async def scenario(api, bot):
+        start = time.monotonic()
+        await asyncio.gather(*(bot.send_message(chat_id, 'hi') for chat_id in range(1, chats + 1)))
+        times = _times(api)
+        assert len(times) == chats
+        # Первые rate запросов уходят сразу (полная корзина), остальные - со скоростью rate
+        _assert_rate(times, rate, burst=rate)
+        assert time.monotonic() - start < (chats - rate) / rate + 1
+
+    asyncio.run(_run(scenario, rate=rate, chat_rate=1000, concurrency=1000))
+
+
+def test_chat_rate_is_respected():
+    chat_rate, burst, messages = 10, 2, 6
+
+    async def scenario(api, bot):
+        start = time.monotonic()
+        await asyncio.gather(*(bot.send_message(chat_id, f'{n}') for n in range(messages) for chat_id in (1, 2)))
+        for chat_id in (1, 2):
+            times = _times(api, chat_id)
+            assert len(times) == messages
+            _assert_rate(times, chat_rate, burst)
+        # Чаты ограничиваются независимо друг от друга
+        assert time.monotonic() - start < 2 * (messages - burst) / chat_rate
+
+    asyncio.run(_run(scenario, rate=1000, chat_rate=chat_rate, chat_burst=burst, concurrency=100))
+
+
+def test_retry_after_pauses_only_the_chat():
+    async def scenario(api, bot):
+        api.flood_chats[1] = 1
+        first = asyncio.create_task(bot.send_message(1, 'flooded'))
+        await asyncio.sleep(0.1)
+        # Пока чат 1 на паузе, запросы в него ждут, а в другие чаты - уходят сразу
+        second = asyncio.create_task(bot.send_message(1, 'waits'))
+        other_sent = time.monotonic()
+        await bot.send_message(2, 'other')
+        assert time.monotonic() - other_sent < 0.5
+        await asyncio.gather(first, second)
+
+        flooded_at = _times(api, 1)[0]
+        retried = _times(api, 1)[1:]
+        assert len(retried) == 2
+        assert min(retried) - flooded_at >= api.retry_after - TOLERANCE
+        assert api.flood_waits == 1 and api.calls['sendMessage'] == 3
+
+    asyncio.run(_run(scenario, rate=1000, chat_rate=1000, concurrency=100))
+
+
+def test_retries_are_limited():
+    max_retries = 2
+
+    async def scenario(api, bot):
+        api.flood_chats[1] = 10
+        with pytest.raises(TelegramRetryAfter):
+            await bot.send_message(1, 'never delivered')
+        assert len(_times(api, 1)) == max_retries + 1
+        assert api.flood_waits == max_retries + 1
+        assert api.calls['sendMessage'] == 0
+
+    asyncio.run(_run(scenario, rate=1000, chat_rate=1000, concurrency=100, max_retries=max_retries))
@@ -0,0 +1,72 @@
+"""Режим работы бота через webhook на aiohttp.
+
+Telegram отправляет обновления POST-запросами на WEBHOOK_PATH, запрос проверяется по заголовку
+X-Telegram-Bot-Api-Secret-Token, сервер сразу отвечает 200, а обновление обрабатывается в фоне,
+поэтому обновления разных пользователей обрабатываются параллельно.
+
+Для локальной проверки можно не указывать WEBHOOK_URL (webhook в Telegram не регистрируется)
+и отправлять записанные обновления вручную:
+    curl -X POST localhost:8080/webhook -H 'X-Telegram-Bot-Api-Secret-Token: <secret>' -d @update.json
+"""
+import asyncio
+import logging
+from typing import Callable
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+
+def create_app(dispatcher: Dispatcher, bot: Bot, path: str = '/webhook', secret_token: str = None,
+               is_ready: Callable[[], bool] = lambda: True) -> web.Application:
+    """Создает aiohttp-приложение для приема обновлений.
+
+    :param dispatcher: Диспетчер с зарегистрированными обработчиками.
+    :param bot: Экземпляр бота.
+    :param path: Путь, на который Telegram отправляет обновления.
+    :param secret_token: Секретный токен для проверки запросов от Telegram.
+    :param is_ready: Функция, возвращающая готовность бота к обработке обновлений (например, открыт ли пул БД).
+    """
+    app = web.Application()
+
+    async def health(request: web.Request) -> web.Response:
+        """ Процесс жив и принимает запросы """
+        return web.json_response({'status': 'ok'})
+
+    async def readiness(request: web.Request) -> web.Response:
+        """ Бот готов обрабатывать обновления """
+        if is_ready():
+            return web.json_response({'status': 'ready'})
+        return web.json_response({'status': 'not ready'}, status=503)
+
+    SimpleRequestHandler(dispatcher=dispatcher, bot=bot, secret_token=secret_token,
+                         handle_in_background=True).register(app, path=path)
+    app.router.add_get('/healthz', health)
+    app.router.add_get('/readyz', readiness)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, host: str = '0.0.0.0', port: int = 8080,
+                      path: str = '/webhook', base_url: str = None, secret_token: str = None,
+                      is_ready: Callable[[], bool] = lambda: True) -> None:
+    """Запускает webhook-сервер и регистрирует webhook в Telegram.
+
+    :param base_url: Публичный адрес сервера (https://example.com). Если не указан - webhook в Telegram не регистрируется.
+    Остальные параметры - как в create_app.
+    """
+    app = create_app(dispatcher, bot, path=path, secret_token=secret_token, is_ready=is_ready)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Webhook server started on {host}:{port}{path}")
+
+    if base_url:
+        await bot.set_webhook(base_url.rstrip('/') + path, secret_token=secret_token,
+                              allowed_updates=dispatcher.resolve_used_update_types())
+        logging.info(f"Webhook set to {base_url.rstrip('/') + path}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,240 @@
+"""Многопроцессный режим работы бота.
+
+Фронтальный процесс получает обновления (webhook или long polling, по BOT_MODE) и передает каждое
+обновление одному из WORKERS рабочих процессов по chat_id. Все обновления одного чата попадают в один
+и тот же процесс и обрабатываются в нем по порядку, поэтому состояния FSM в MemoryStorage остаются согласованными.
+Каждый рабочий процесс открывает свой пул соединений, размер которого вычисляется из общего бюджета DB_POOL_BUDGET.
+Так же делится и глобальный лимит запросов к Bot API: каждый процесс отправляет не больше BOT_API_RATE / WORKERS
+запросов в секунду, поэтому вместе они не превышают BOT_API_RATE. Лимит на чат (BOT_API_CHAT_RATE) не делится -
+все сообщения одного чата отправляет один процесс.
+
+Запуск:
+    python workers.py
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+
+import dotenv
+from aiogram import Bot
+from aiohttp import web
+
+# Время, за которое рабочий процесс должен завершить обработку принятых обновлений при остановке (в секундах)
+DRAIN_TIMEOUT = 30
+
+# Поля обновления, в которых может находиться событие с чатом или пользователем
+_EVENT_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post', 'callback_query',
+                 'inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                 'my_chat_member', 'chat_member', 'chat_join_request')
+
+
+def shard_key(update: dict) -> int:
+    """ Возвращает ключ распределения обновления: ID чата, а если его нет - ID пользователя """
+    for field in _EVENT_FIELDS:
+        event = update.get(field)
+        if event:
+            chat = event.get('chat') or (event.get('message') or {}).get('chat')
+            if chat:
+                return chat['id']
+            user = event.get('from')
+            if user:
+                return user['id']
+    return update.get('update_id', 0)
+
+
+# === WORKER ===
+
+def _worker_main(index: int, queue: multiprocessing.Queue, pool_size: int, api_rate: float,
+                 resume_broadcasts: bool) -> None:
+    # Остановкой управляет фронтальный процесс, Ctrl+C не должен прерывать обработку обновлений
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Доля глобального лимита Bot API, которую loader передаст диспетчеру исходящих запросов процесса
+    os.environ['BOT_API_RATE'] = str(api_rate)
+    asyncio.run(_worker(index, queue, pool_size, resume_broadcasts))
+
+
+async def _worker(index: int, queue: multiprocessing.Queue, pool_size: int, resume_broadcasts: bool) -> None:
+    from profiling import StartupTimer, install_signal_handler
+    timer = StartupTimer()
+    with timer.phase('imports'):
+        import loader
+        # Импорт модулей с обработчиками регистрирует их в диспетчере
+        from callback_handlers import CATEGORIES_PAGE_SIZE
+        import message_handlers  # noqa: F401
+
+    # Каждый рабочий процесс отдает свои метрики на METRICS_PORT + номер процесса
+    metrics_runner = await loader.start_metrics_server(offset=index)
+    # Планировщик напоминаний работает в каждом процессе: новое напоминание попадает только в кучу процесса,
+    # обработавшего обновление, а повторную отправку исключает claim_due_reminders (FOR UPDATE SKIP LOCKED)
+    reminders_task = await loader.startup(timer, catalog_page_size=CATEGORIES_PAGE_SIZE,
+                                          resume_broadcasts=resume_broadcasts, min_size=1, max_size=pool_size)
+    install_signal_handler(loader.profiler, int(os.getenv('PROFILE_SECONDS', 30)))
+    logging.info(f"Worker {index} started (pool size {pool_size}, Bot API rate {os.environ['BOT_API_RATE']}/s)")
+
+    # Последняя задача каждого чата: следующее обновление чата ждет ее завершения
+    tails: dict[int, asyncio.Task] = {}
+    in_flight: set[asyncio.Task] = set()
+
+    def on_done(task: asyncio.Task, key: int) -> None:
+        in_flight.discard(task)
+        if tails.get(key) is task:
+            del tails[key]
+
+    loop = asyncio.get_running_loop()
+    while True:
+        raw = await loop.run_in_executor(None, queue.get)
+        if raw is None:
+            break
+        update = json.loads(raw)
+        key = shard_key(update)
+        task = asyncio.create_task(_process_update(loader, update, tails.get(key)))
+        tails[key] = task
+        in_flight.add(task)
+        task.add_done_callback(lambda t, key=key: on_done(t, key))
+
+    logging.info(f"Worker {index} draining {len(in_flight)} updates")
+    if in_flight:
+        await asyncio.wait(in_flight, timeout=DRAIN_TIMEOUT)
+    if reminders_task is not None:
+        reminders_task.cancel()
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+    await loader.ParentDatabaseHandler.close_connection()
+    await loader.bot.session.close()
+    logging.info(f"Worker {index} stopped")
+
+
+async def _process_update(loader, update: dict, previous: asyncio.Task | None) -> None:
+    if previous is not None:
+        await asyncio.wait([previous])
+    try:
+        await loader.dp.feed_raw_update(loader.bot, update)
+    except Exception as e:
+        logging.error(f"Error processing update {update.get('update_id')}: {e}")
+
+
+# === FRONT ===
+
+class _Front:
+    """ Принимает обновления и распределяет их по рабочим процессам """
+
+    def __init__(self, queues: list[multiprocessing.Queue], processes: list[multiprocessing.Process]):
+        self._queues = queues
+        self._processes = processes
+        self._stopping = asyncio.Event()
+
+    def route(self, update: dict, raw: str) -> None:
+        self._queues[shard_key(update) % len(self._queues)].put(raw)
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def is_ready(self) -> bool:
+        return not self._stopping.is_set() and all(process.is_alive() for process in self._processes)
+
+    async def run_polling(self, bot: Bot, timeout: int = 30) -> None:
+        offset = None
+        while not self._stopping.is_set():
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, request_timeout=timeout + 10)
+            except Exception as e:
+                logging.error(f"Error getting updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                raw = update.model_dump_json(by_alias=True, exclude_none=True)
+                self.route(json.loads(raw), raw)
+                offset = update.update_id + 1
+
+    async def run_webhook(self, bot: Bot, host: str, port: int, path: str, base_url: str | None,
+                          secret_token: str | None) -> None:
+        async def handle(request: web.Request) -> web.Response:
+            if secret_token and request.headers.get('X-Telegram-Bot-Api-Secret-Token') != secret_token:
+                return web.Response(status=401)
+            if self._stopping.is_set():
+                return web.Response(status=503)
+            raw = await request.text()
+            self.route(json.loads(raw), raw)
+            return web.Response()
+
+        async def health(request: web.Request) -> web.Response:
+            return web.json_response({'status': 'ok'})
+
+        async def readiness(request: web.Request) -> web.Response:
+            if self.is_ready():
+                return web.json_response({'status': 'ready'})
+            return web.json_response({'status': 'not ready'}, status=503)
+
+        app = web.Application()
+        app.router.add_post(path, handle)
+        app.router.add_get('/healthz', health)
+        app.router.add_get('/readyz', readiness)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f"Front webhook server started on {host}:{port}{path}")
+        if base_url:
+            await bot.set_webhook(base_url.rstrip('/') + path, secret_token=secret_token)
+        try:
+            await self._stopping.wait()
+        finally:
+            await runner.cleanup()
+
+
+async def _run_front(front: _Front) -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, front.stop)
+
+    from loader import create_session
+    bot = Bot(os.getenv('TOKEN'), session=create_session())
+    try:
+        if os.getenv('BOT_MODE') == 'webhook':
+            await front.run_webhook(bot,
+                                    host=os.getenv('WEBHOOK_HOST', '0.0.0.0'),
+                                    port=int(os.getenv('WEBHOOK_PORT', 8080)),
+                                    path=os.getenv('WEBHOOK_PATH', '/webhook'),
+                                    base_url=os.getenv('WEBHOOK_URL'),
+                                    secret_token=os.getenv('WEBHOOK_SECRET'))
+        else:
+            await front.run_polling(bot)
+    finally:
+        await bot.session.close()
+
+
+def main() -> None:
+    dotenv.load_dotenv()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(processName)s - %(message)s')
+
+    workers = int(os.getenv('WORKERS', os.cpu_count() or 1))
+    # Общее кол-во соединений с БД делится между рабочими процессами поровну
+    pool_size = max(1, int(os.getenv('DB_POOL_BUDGET', 20)) // workers)
+    # Глобальный лимит запросов к Bot API тоже делится между рабочими процессами
+    api_rate = float(os.getenv('BOT_API_RATE', 30)) / workers
+
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(workers)]
+    # Прерванные рассылки продолжает только первый рабочий процесс
+    processes = [context.Process(target=_worker_main, args=(index, queue, pool_size, api_rate, index == 0),
+                                 name=f'worker-{index}')
+                 for index, queue in enumerate(queues)]
+    for process in processes:
+        process.start()
+
+    try:
+        asyncio.run(_run_front(_Front(queues, processes)))
+    finally:
+        logging.info("Stopping workers")
+        for queue in queues:
+            queue.put(None)
+        for process in processes:
+            process.join(timeout=DRAIN_TIMEOUT + 5)
+            if process.is_alive():
+                process.terminate()
+
+
+if __name__ == '__main__':
+    main()